@@ -38,12 +38,29 @@ __init__.py
 """
 from helpers.arcgistools.create_folders import create_folders
 from helpers.arcgistools.create_folders import create_single_folder
+from helpers.arcgistools.create_folders import get_case_name
+from helpers.arcgistools.point_index import dedup_points
+from helpers.arcgistools.point_index import cluster_points
+from helpers.arcgistools.point_index import get_aliases
+from helpers.arcgistools.point_index import write_aliases
+from helpers.arcgistools.point_index import read_aliases
+from helpers.arcgistools.point_index import fan_out_case
 from helpers.arcgistools.prepare_topos import prepare_topos
 from helpers.arcgistools.prepare_topos import prepare_single_topo
+from helpers.arcgistools.prepare_topos import prepare_single_topo_window
+from helpers.arcgistools.prepare_topos import export_tiled_topo
 from helpers.arcgistools.prepare_hydros import prepare_hydros
 from helpers.arcgistools.prepare_hydros import prepare_single_point_hydros
+from helpers.arcgistools.prepare_hydros import rasterize_hydros
+from helpers.arcgistools.prepare_hydros import prepare_hydros_from_grids
 from helpers.arcgistools.write_geoclaw_params import write_setrun
+from helpers.arcgistools.write_geoclaw_params import write_setrun_batch
+from helpers.arcgistools.write_geoclaw_params import SetrunWriter
+from helpers.arcgistools.prepare_cases import prepare_single_case
+from helpers.arcgistools.prepare_cases import prepare_cases
+from helpers.arcgistools.prepare_cases import write_mission_params
 from helpers.arcgistools.monitor_gui import AzureMonitorWindow
+from helpers.arcgistools.monitor_gui import TaskTable
 
 __version__ = "alpha"
 __author__ = "Pi-Yueh Chuang (pychuang@gwu.edu)"
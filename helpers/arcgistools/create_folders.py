@@ -43,6 +43,34 @@ import shutil
 import numpy
 import re
 
+def get_case_name(xy, case_name_method="Rupture point easting and northing"):
+    """Get the case name of a single rupture point.
+
+    Args:
+        xy [in]: see create_single_folder.
+        case_name_method [in]: see create_single_folder.
+
+    Return:
+        The case name (also the name of the case folder).
+    """
+
+    # use W, E, N, and S to represent x & y coordinates
+    x = "{}{}".format(numpy.abs(xy[0]), "E" if xy[0]>=0 else "W")
+    y = "{}{}".format(numpy.abs(xy[1]), "N" if xy[1]>=0 else "S")
+    case_name = ""
+    if case_name_method == "Rupture point field value":
+        case_name = re.sub("[^a-zA-Z0-9]", "_", xy[2])
+
+    # Azure task does not accept .(a dot) in task names, so replace with _
+    x = x.replace(".", "_")
+    y = y.replace(".", "_")
+
+    if case_name_method == "Rupture point easting and northing":
+        return "{}{}".format(x, y)
+
+    # case_name_method == "Rupture point field value"
+    return case_name
+
 def create_single_folder(workdir, xy, case_name_method="Rupture point easting and northing", ignore=True):
     """Create the case folder of a single rupture point.
 
@@ -68,22 +96,8 @@ def create_single_folder(workdir, xy, case_name_method="Rupture point easting an
     # change to absolute path
     workdir = os.path.abspath(workdir)
 
-    # use W, E, N, and S to represent x & y coordinates
-    x = "{}{}".format(numpy.abs(xy[0]), "E" if xy[0]>=0 else "W")
-    y = "{}{}".format(numpy.abs(xy[1]), "N" if xy[1]>=0 else "S")
-    case_name = ""
-    if case_name_method == "Rupture point field value":
-        case_name = re.sub("[^a-zA-Z0-9]", "_", xy[2])
-
-    # Azure task does not accept .(a dot) in task names, so replace with _
-    x = x.replace(".", "_")
-    y = y.replace(".", "_")
-
     # final case folder path & name
-    if case_name_method == "Rupture point easting and northing":
-        target = os.path.join(workdir, "{}{}".format(x, y))
-    else:  # case_name_method == "Rupture point field value"
-        target = os.path.join(workdir, case_name)
+    target = os.path.join(workdir, get_case_name(xy, case_name_method))
 
     # check if the case folder already exists
     if os.path.isdir(target):
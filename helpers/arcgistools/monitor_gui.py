@@ -37,7 +37,221 @@
 A Tk GUI for monitoring Azure status.
 """
 import sys
+import difflib
+import datetime
 import tkinter
+import tkinter.font
+
+
+def _apply_lines(text, old_lines, new_lines):
+    """Change the lines in a Tk text widget to new lines by editing only the changed ones.
+
+    Args:
+        text [in]: a tkinter.Text object holding old_lines, each followed by a new line.
+        old_lines [in]: a list of str; the current lines in the widget.
+        new_lines [in]: a list of str; the lines wanted.
+    """
+
+    opcodes = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes()
+
+    # from the bottom up, so the line numbers of the remaining blocks stay valid
+    for tag, i1, i2, j1, j2 in reversed(opcodes):
+
+        if tag == "equal":
+            continue
+
+        # Tk line numbers start at 1; old_lines[i1:i2] are lines i1+1 to i2
+        start = "{}.0".format(i1+1)
+
+        if i2 > i1:
+            text.delete(start, "{}.0".format(i2+1))
+
+        if j2 > j1:
+            text.insert(start, "".join(line+"\n" for line in new_lines[j1:j2]))
+
+
+class TaskTable(tkinter.Frame):
+    """A virtual table of per-task status.
+
+    Only the rows visible in the widget are in the Tk text buffer, and only
+    the visible rows that changed are edited, so a mission of tens of
+    thousands of tasks stays responsive.
+    """
+
+    # the columns and the format of a row
+    header = "{:<32} {:<10} {:<9} {:>6}  {:<40} {:<15} {:<15}".format(
+        "Case", "State", "Result", "Exit", "Node", "Start (UTC)", "End (UTC)")
+
+    row_format = "{:<32} {:<10} {:<9} {:>6}  {:<40} {:<15} {:<15}"
+
+    def __init__(self, master=None, n_rows=20):
+        """__init__
+
+        Args:
+            master [in]: the parent widget.
+            n_rows [in]: the initial number of rows shown.
+        """
+        super().__init__(master)
+
+        self.header_label = tkinter.Label(
+            self, text=self.header, font="TkFixedFont", anchor="w", justify=tkinter.LEFT)
+        self.header_label.pack(side=tkinter.TOP, fill=tkinter.X)
+
+        self.text = tkinter.Text(
+            self, height=n_rows, wrap=tkinter.NONE, font="TkFixedFont", state=tkinter.DISABLED)
+        self.text.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
+
+        self.scrollbar = tkinter.Scrollbar(self, command=self.yview)
+        self.scrollbar.pack(side=tkinter.RIGHT, fill=tkinter.Y)
+
+        # the rows: case names in display order, and the line of each case
+        self._order = []
+        self._lines = {}
+
+        # the records the lines were made from
+        self._records = {}
+
+        # the first row shown, the number of rows shown, and the lines in the buffer
+        self._first = 0
+        self._n_visible = n_rows
+        self._shown = []
+
+        self.text.bind("<Configure>", self._on_configure)
+        self.text.bind("<MouseWheel>", self._on_mousewheel)
+        self.text.bind("<Button-4>", lambda event: self.yview("scroll", -3, "units"))
+        self.text.bind("<Button-5>", lambda event: self.yview("scroll", 3, "units"))
+
+    @staticmethod
+    def _format_time(t):
+        """Short string of a task's time."""
+
+        if t is None:
+            return "-"
+
+        if isinstance(t, datetime.datetime):
+            return t.strftime("%m-%d %H:%M:%S")
+
+        return str(t)
+
+    @classmethod
+    def format_row(cls, casename, record):
+        """The line of a task in the table.
+
+        Args:
+            casename [in]: the name of the case.
+            record [in]: a dict of the task's record in MissionInfo.tasks.
+
+        Return:
+            A str.
+        """
+
+        if not record.get("completed"):
+            result = "-"
+        elif record.get("memoized"):
+            result = "memoized"
+        else:
+            result = "succeeded" if record.get("succeeded") else "failed"
+
+        exit_code = record.get("exit_code")
+
+        return cls.row_format.format(
+            casename, record.get("state") or "-", result,
+            "-" if exit_code is None else exit_code, record.get("node_id") or "-",
+            cls._format_time(record.get("start_time")),
+            cls._format_time(record.get("end_time"))).rstrip()
+
+    def update_tasks(self, tasks):
+        """Update the table with the records of tasks.
+
+        Only the records that changed since the last update are formatted,
+        and only the visible rows that changed are redrawn.
+
+        Args:
+            tasks [in]: a dict of case names to task records, e.g., MissionInfo.tasks.
+        """
+
+        reorder = False
+
+        for casename, record in tasks.items():
+            if self._records.get(casename) != record:
+                reorder = reorder or casename not in self._records
+
+                # a copy; the records are updated in place by the task tracker
+                self._records[casename] = dict(record)
+                self._lines[casename] = self.format_row(casename, record)
+
+        # cases removed from the mission
+        if len(self._records) != len(tasks):
+            for casename in set(self._records) - set(tasks):
+                del self._records[casename]
+                del self._lines[casename]
+
+            reorder = True
+
+        if reorder:
+            self._order = sorted(self._lines)
+            self._first = max(0, min(self._first, len(self._order)-self._n_visible))
+
+        self._render()
+
+    def yview(self, *args):
+        """Scroll the table; the command of the scroll bar.
+
+        Args:
+            args [in]: ("moveto", fraction) or ("scroll", number, "units" or "pages").
+        """
+
+        n_rows = len(self._order)
+
+        if args[0] == "moveto":
+            first = int(round(float(args[1]) * n_rows))
+        elif args[0] == "scroll":
+            step = int(args[1]) * (self._n_visible if args[2] == "pages" else 1)
+            first = self._first + step
+        else:
+            return
+
+        self._first = max(0, min(first, n_rows-self._n_visible))
+
+        self._render()
+
+    def _on_configure(self, event):
+        """Fit the number of rows shown to the height of the widget."""
+
+        linespace = max(1, tkinter.font.nametofont("TkFixedFont").metrics("linespace"))
+        n_visible = max(1, event.height // linespace)
+
+        if n_visible != self._n_visible:
+            self._n_visible = n_visible
+            self._first = max(0, min(self._first, len(self._order)-self._n_visible))
+            self._render()
+
+    def _on_mousewheel(self, event):
+        """Scroll with the mouse wheel (Windows and macOS)."""
+
+        self.yview("scroll", -3 if event.delta > 0 else 3, "units")
+
+        return "break"
+
+    def _render(self):
+        """Write the visible rows to the text buffer, editing only changed lines."""
+
+        n_rows = len(self._order)
+        last = min(self._first+self._n_visible, n_rows)
+
+        lines = [self._lines[casename] for casename in self._order[self._first:last]]
+
+        if lines != self._shown:
+            self.text.config(state=tkinter.NORMAL)
+            _apply_lines(self.text, self._shown, lines)
+            self.text.config(state=tkinter.DISABLED)
+            self._shown = lines
+
+        if n_rows == 0:
+            self.scrollbar.set(0., 1.)
+        else:
+            self.scrollbar.set(self._first/n_rows, last/n_rows)
+
 
 class AzureMonitorWindow(tkinter.Frame):
     """The base and frame for printing information."""
@@ -46,9 +260,10 @@ class AzureMonitorWindow(tkinter.Frame):
         """__init__"""
         super().__init__(master)
         self.master = master
-        self.pack()
+        self.pack(fill=tkinter.BOTH, expand=True)
         self.init_button()
         self.init_text()
+        self.init_table()
 
     def init_button(self):
         """Definition of the Quit button."""
@@ -59,20 +274,41 @@ class AzureMonitorWindow(tkinter.Frame):
 
     def init_text(self):
         """Initialization of the text section."""
-        self.text = tkinter.Text(self, state=tkinter.DISABLED)
+        self.text_frame = tkinter.Frame(self)
+        self.text_frame.pack(side=tkinter.TOP, fill=tkinter.X)
+
+        self.text = tkinter.Text(self.text_frame, state=tkinter.DISABLED)
         self.text.pack(side=tkinter.LEFT, fill=tkinter.Y)
 
-        self.scrollbar = tkinter.Scrollbar(self)
+        self.scrollbar = tkinter.Scrollbar(self.text_frame)
         self.scrollbar.pack(side=tkinter.RIGHT, fill=tkinter.Y)
 
         self.text.config(yscrollcommand=self.scrollbar.set)
         self.scrollbar.config(command=self.text.yview)
 
+        # the lines currently in the text section
+        self.lines = []
+
+    def init_table(self):
+        """Initialization of the per-task table."""
+        self.table = TaskTable(self)
+        self.table.pack(side=tkinter.TOP, fill=tkinter.BOTH, expand=True)
+
     def update_text(self, s):
-        """Update the text inf the text section with s."""
+        """Update the text inf the text section with s; only changed lines are edited."""
+        lines = s.split("\n")
+
+        if lines == self.lines:
+            return
+
         vw = self.text.yview()
         self.text.config(state=tkinter.NORMAL)
-        self.text.delete(1.0, tkinter.END)
-        self.text.insert(tkinter.END, s)
+        _apply_lines(self.text, self.lines, lines)
         self.text.config(state=tkinter.DISABLED)
         self.text.yview_moveto(vw[0])
+
+        self.lines = lines
+
+    def update_tasks(self, tasks):
+        """Update the per-task table with a dict of task records, e.g., MissionInfo.tasks."""
+        self.table.update_tasks(tasks)
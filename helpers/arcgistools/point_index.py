@@ -0,0 +1,227 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+########################################################################################################################
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+# All Rights Reserved.
+#
+# Contributors: Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Licensed under the BSD-3-Clause License (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at: https://opensource.org/licenses/BSD-3-Clause
+#
+# BSD-3-Clause License:
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#    following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+# GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+########################################################################################################################
+
+"""
+Merge duplicate rupture points and group nearby ones with a grid-hash index.
+"""
+import os
+import json
+import shutil
+import numpy
+from helpers.arcgistools.create_folders import get_case_name
+
+
+def point_coords(points):
+    """Get an N x 2 float array of x and y from points or point records.
+
+    Args:
+        points [in]: an N x 2 (or N x 3) array, N point records (e.g., from
+            FeatureClassToNumPyArray), or a list of (x, y[, case name]).
+
+    Return:
+        An N x 2 numpy.ndarray of float64.
+    """
+
+    points = numpy.asarray(points)
+
+    if points.dtype.names is not None:
+        return numpy.stack(
+            [points[name] for name in points.dtype.names[:2]], axis=1).astype(numpy.float64)
+
+    try:
+        return numpy.asarray(points[:, :2], dtype=numpy.float64)
+    except (TypeError, ValueError, IndexError):
+        return numpy.array([[p[0], p[1]] for p in points], dtype=numpy.float64)
+
+def dedup_points(points, tolerance):
+    """Merge points closer than a tolerance to an earlier point.
+
+    Points are hashed into grid cells as large as the tolerance, so each point
+    is only compared with the kept points in its own and the 8 neighboring
+    cells. The first point (in the given order) of a group is kept, and the
+    others become its aliases. A tolerance of 0 merges identical points only.
+
+    Args:
+        points [in]: points or point records; see point_coords.
+        tolerance [in]: the distance under which two points are merged;
+            usually the finest resolution.
+
+    Return:
+        (indices of the kept points in ascending order, an array of size N
+        holding the index of the kept point each point is merged into).
+    """
+
+    xy = point_coords(points)
+
+    if tolerance <= 0:
+        _, first, inverse = numpy.unique(
+            xy, axis=0, return_index=True, return_inverse=True)
+        merged_into = first[inverse.ravel()]
+        return numpy.unique(merged_into), merged_into
+
+    cells = numpy.floor(xy / tolerance).astype(numpy.int64)
+    tol2 = tolerance * tolerance
+
+    merged_into = numpy.arange(xy.shape[0])
+    kept = {}
+    for k, (ci, cj) in enumerate(cells.tolist()):
+        for key in [(ci+di, cj+dj) for di in (-1, 0, 1) for dj in (-1, 0, 1)]:
+            found = [r for r in kept.get(key, ()) if ((xy[r]-xy[k])**2).sum() <= tol2]
+            if found:
+                merged_into[k] = found[0]
+                break
+        else:
+            kept.setdefault((ci, cj), []).append(k)
+
+    return numpy.flatnonzero(merged_into == numpy.arange(xy.shape[0])), merged_into
+
+def cluster_points(points, cell_size):
+    """Group points by the grid cells they fall in.
+
+    Points of the same cell have overlapping domains when the cell is no
+    larger than a domain, so preparing them one after another reuses the
+    same part of the base topography.
+
+    Args:
+        points [in]: points or point records; see point_coords.
+        cell_size [in]: the size of a grid cell; usually the domain size.
+
+    Return:
+        (cluster labels of size N, the indices of points ordered cluster by
+        cluster).
+    """
+
+    xy = point_coords(points)
+    cells = numpy.floor(xy / cell_size).astype(numpy.int64)
+
+    _, labels = numpy.unique(cells, axis=0, return_inverse=True)
+    labels = labels.ravel()
+
+    return labels, numpy.argsort(labels, kind="stable")
+
+def get_aliases(points, merged_into, case_name_method="Rupture point easting and northing"):
+    """The case names of merged points and of the cases they share.
+
+    Args:
+        points [in]: point records; see create_single_folder.
+        merged_into [in]: the array from dedup_points.
+        case_name_method [in]: see create_single_folder.
+
+    Return:
+        A dict of {alias case name: case name of the kept point}.
+    """
+
+    aliases = {}
+    for i, j in enumerate(merged_into.tolist()):
+        if i == j:
+            continue
+
+        # identical points also have identical names
+        alias = get_case_name(points[i], case_name_method)
+        name = get_case_name(points[j], case_name_method)
+        if alias != name:
+            aliases[alias] = name
+
+    return aliases
+
+def write_aliases(filename, aliases, tolerance=None):
+    """Write the mapping of alias cases to a JSON file.
+
+    Args:
+        filename [in]: path to the output file.
+        aliases [in]: a dict from get_aliases.
+        tolerance [in]: optional; the tolerance used, for the record.
+    """
+
+    with open(filename, "w") as f:
+        json.dump({"tolerance": tolerance, "aliases": aliases}, f, indent=1, sort_keys=True)
+
+def read_aliases(filename):
+    """Read the mapping of alias cases; empty if the file does not exist."""
+
+    if not os.path.isfile(filename):
+        return {}
+
+    with open(filename, "r") as f:
+        return json.load(f)["aliases"]
+
+def fan_out_case(case_dir, alias_dirs, alias_points=None):
+    """Copy the files of a case folder into the folders of its aliases.
+
+    The copied case_settings.txt is rewritten with the point and the case name
+    of each alias. Other files (e.g., setrun.py) are kept as they are, as they
+    describe the simulation whose results are shared.
+
+    Args:
+        case_dir [in]: the folder of the case simulated.
+        alias_dirs [in]: a list of folders of the alias cases.
+        alias_points [in]: optional; the point records of the aliases (see
+            create_single_folder). Without them, only the case name in
+            case_settings.txt is rewritten.
+    """
+
+    if alias_points is None:
+        alias_points = [None] * len(alias_dirs)
+
+    for alias_dir, point in zip(alias_dirs, alias_points):
+        for root, _, files in os.walk(case_dir):
+            target = os.path.join(alias_dir, os.path.relpath(root, case_dir))
+            os.makedirs(target, exist_ok=True)
+            for filename in files:
+                shutil.copy2(os.path.join(root, filename), os.path.join(target, filename))
+
+        settings = os.path.join(alias_dir, "case_settings.txt")
+        if os.path.isfile(settings):
+            _rewrite_case_settings(settings, point, os.path.basename(alias_dir))
+
+def _rewrite_case_settings(filename, point, casename):
+    """Replace the point and the case name in a case_settings.txt."""
+
+    values = {"CASE_NAME": casename}
+    if point is not None:
+        values["POINT_X"] = str(float(point[0]))
+        values["POINT_Y"] = str(float(point[1]))
+
+    with open(filename, "r") as f:
+        lines = f.read().split("\n")
+
+    for i, line in enumerate(lines):
+        key = line.split("=", 1)[0]
+        if key in values:
+            lines[i] = "{}={}".format(key, values[key])
+
+    with open(filename, "w") as f:
+        f.write("\n".join(lines))
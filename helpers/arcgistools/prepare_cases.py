@@ -0,0 +1,284 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+########################################################################################################################
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+# All Rights Reserved.
+#
+# Contributors: Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Licensed under the BSD-3-Clause License (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at: https://opensource.org/licenses/BSD-3-Clause
+#
+# BSD-3-Clause License:
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#    following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+# GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+########################################################################################################################
+
+"""
+Prepare many case folders with a pool of worker processes.
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import traceback
+import multiprocessing
+import arcpy
+from helpers.arcgistools.create_folders import create_single_folder
+from helpers.arcgistools.prepare_topos import prepare_single_topo
+from helpers.arcgistools.prepare_topos import prepare_single_topo_window
+from helpers.arcgistools.prepare_hydros import prepare_single_point_hydros
+from helpers.arcgistools.prepare_hydros import prepare_hydros_from_grids
+from helpers.arcgistools.write_geoclaw_params import SetrunWriter
+from helpers.rastertools import RasterGrid
+
+
+# the marker file written into a case folder after it is fully prepared
+MARKER = ".prepared"
+
+# hydro grids loaded by this process (see _get_hydro_grids)
+_hydro_grids = {}
+
+# setrun writers of this process (see _get_setrun_writer)
+_setrun_writers = {}
+
+
+def settings_fingerprint(settings):
+    """A hash of the preparation settings recorded in marker files."""
+
+    data = json.dumps(settings, sort_keys=True, default=str).encode()
+
+    return hashlib.sha256(data).hexdigest()
+
+def _get_hydro_grids(prefixes):
+    """Map cached hydro grids (and their text sidecars) once per process."""
+
+    key = tuple(prefixes)
+
+    if key not in _hydro_grids:
+        _hydro_grids[key] = [RasterGrid.load(prefix, None, True) for prefix in prefixes]
+
+    return _hydro_grids[key]
+
+def _get_setrun_writer(settings, fingerprint):
+    """Pre-render the setrun templates once per process and settings."""
+
+    if fingerprint not in _setrun_writers:
+        _setrun_writers[fingerprint] = SetrunWriter(
+            extent=settings["domain"], res=settings["resolution"],
+            case_name_method=settings["case_name_method"], **settings["setrun"])
+
+    return _setrun_writers[fingerprint]
+
+def prepare_single_case(point, settings, resume=True):
+    """Prepare the folder and all input files of one rupture point.
+
+    The settings is a dict of:
+        working_dir, case_name_method, ignore: see create_single_folder.
+        base_topo: None, or a raster for prepare_single_topo.
+        shared_topo: whether to write topo_window.txt instead of topo.asc.
+        hydro_layers: None, or a list of hydro feature layers.
+        hydro_grids: None, or the cache prefixes of rasterize_hydros.
+        domain, resolution: the extent (top, bottom, left, right) and (x, y)
+            resolution.
+        setrun: a dict of the other keyword arguments of SetrunWriter.
+        mission_params: optional; write only case_override.json and leave the
+            parameter files to the script of write_mission_params.
+
+    A marker file (.prepared) with the fingerprint of the settings is written
+    last. With resume, a case whose marker matches is not prepared again, and
+    a case folder without a matching marker (e.g., interrupted) is redone.
+
+    Args:
+        point [in]: a record of (x, y[, case name field]).
+        settings [in]: a dict; see above.
+        resume [in]: skip fully prepared cases.
+
+    Return:
+        (case path, True if skipped by resume).
+    """
+
+    fingerprint = settings_fingerprint(settings)
+
+    case_path = create_single_folder(
+        settings["working_dir"], point, settings["case_name_method"],
+        settings["ignore"] or resume)
+
+    marker = os.path.join(case_path, MARKER)
+    if resume and os.path.isfile(marker):
+        with open(marker, "r") as f:
+            if f.read().strip() == fingerprint:
+                return case_path, True
+
+    if os.path.isfile(marker):
+        os.remove(marker)
+
+    ignore = settings["ignore"]
+    domain = settings["domain"]
+
+    # topography ASCII file (or its clip window)
+    if settings["shared_topo"]:
+        prepare_single_topo_window(point, domain, case_path, ignore)
+    elif settings["base_topo"] is not None:
+        prepare_single_topo(settings["base_topo"], point, domain, case_path, ignore)
+
+    # ASCII rasters of hydrological features
+    if settings["hydro_grids"] is not None:
+        hydros = prepare_hydros_from_grids(
+            _get_hydro_grids(settings["hydro_grids"]), [point], domain,
+            [case_path], ignore)[0]
+    elif settings["hydro_layers"] is not None:
+        hydros = prepare_single_point_hydros(
+            settings["hydro_layers"], point, domain, min(settings["resolution"]),
+            case_path, ignore)
+    else:
+        hydros = ["hydro_0.asc"]
+
+    # setrun.py, roughness, and case settings files
+    writer = _get_setrun_writer(settings, fingerprint)
+    if settings.get("mission_params", False):
+        writer.write_overrides([case_path], [point], len(hydros))
+    else:
+        writer.write([case_path], [point], len(hydros))
+
+    with open(marker, "w") as f:
+        f.write(fingerprint)
+
+    return case_path, False
+
+def write_mission_params(settings, filename=None):
+    """Write the mission-wide parameter script of the settings.
+
+    Args:
+        settings [in]: a dict; see prepare_single_case.
+        filename [in]: path to the script; default to
+            <working_dir>/mission_setrun.py.
+
+    Return:
+        The path to the script.
+    """
+
+    if filename is None:
+        filename = os.path.join(settings["working_dir"], "mission_setrun.py")
+
+    return _get_setrun_writer(settings, settings_fingerprint(settings)).write_mission_script(filename)
+
+def _init_worker(scratch_dir):
+    """Give each worker process its own scratch geodatabase.
+
+    The arcpy functions use fixed dataset names ("temp", "square",
+    "hydro_feat_i", ...), so workers sharing a workspace would collide.
+    """
+
+    name = "worker_{}.gdb".format(os.getpid())
+    gdb = os.path.join(scratch_dir, name)
+
+    if not arcpy.Exists(gdb):
+        arcpy.management.CreateFileGDB(scratch_dir, name)
+
+    arcpy.env.workspace = gdb
+    arcpy.env.scratchWorkspace = gdb
+    arcpy.env.overwriteOutput = True
+
+def _prepare_worker(args):
+    """Prepare a case in a worker and catch errors."""
+
+    index, point, settings, resume = args
+
+    try:
+        case_path, skipped = prepare_single_case(point, settings, resume)
+        return index, case_path, skipped, None
+    except Exception: # pylint: disable=broad-except
+        return index, None, False, traceback.format_exc()
+
+def prepare_cases(points, settings, n_workers=1, resume=True, callback=None,
+                  scratch_dir=None, order=None):
+    """Prepare the case folders of many rupture points in parallel.
+
+    Points are spread over a pool of worker processes, each with its own
+    scratch workspace. Results are reported in the given order (default to
+    the order of points) whatever order the workers finish in, so outputs and
+    messages are deterministic. With an order grouping nearby points (see
+    cluster_points), each worker gets runs of neighbors and reuses the same
+    part of the base topography.
+    An error in one point does not stop the others; it is returned with the
+    point's result.
+
+    Args:
+        points [in]: an array of records of (x, y[, case name field]).
+        settings [in]: a dict; see prepare_single_case.
+        n_workers [in]: number of worker processes; 1 to prepare in this
+            process.
+        resume [in]: skip fully prepared cases; see prepare_single_case.
+        callback [in]: optional; called as callback(index, case_path, skipped,
+            error) for each point in order.
+        scratch_dir [in]: the folder of scratch geodatabases; default to
+            <working_dir>/_scratch. The geodatabases of workers are created in
+            a temporary sub-folder removed when the pool shuts down.
+        order [in]: optional; the indices of points in the order to prepare.
+
+    Return:
+        A list (in the order of points) of (case path, skipped, error). The
+        case path is None and error is a traceback string if failed.
+    """
+
+    if order is None:
+        order = range(len(points))
+
+    jobs = [(i, points[i], settings, resume) for i in order]
+    results = [None] * len(points)
+
+    if n_workers <= 1:
+        outputs = map(_prepare_worker, jobs)
+        pool = None
+    else:
+        if scratch_dir is None:
+            scratch_dir = os.path.join(settings["working_dir"], "_scratch")
+        os.makedirs(scratch_dir, exist_ok=True)
+        scratch_dir = tempfile.mkdtemp(prefix="workers_", dir=scratch_dir)
+
+        # inside ArcGIS Pro, sys.executable is the application, not Python
+        context = multiprocessing.get_context("spawn")
+        python = os.path.join(sys.exec_prefix, "python.exe")
+        if os.path.isfile(python):
+            context.set_executable(python)
+
+        pool = context.Pool(n_workers, _init_worker, (scratch_dir,))
+        # hand out short runs of consecutive (i.e., nearby) points
+        chunksize = max(1, min(8, len(jobs)//(4*n_workers)))
+        outputs = pool.imap(_prepare_worker, jobs, chunksize)
+
+    try:
+        for index, case_path, skipped, error in outputs:
+            results[index] = (case_path, skipped, error)
+            if callback is not None:
+                callback(index, case_path, skipped, error)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return results
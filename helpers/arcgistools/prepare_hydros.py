@@ -39,6 +39,10 @@ Prepare hydrological feature rasters.
 """
 import os
 import arcpy
+import numpy
+from helpers.rastertools import RasterGrid
+from helpers.rastertools import write_windows
+from helpers.arcgistools.prepare_topos import topo_window
 
 
 def prepare_single_point_hydros(in_feats, point, extent, res, out_dir, ignore=False):
@@ -101,3 +105,102 @@ def prepare_hydros(in_feats, points, extent, res, out_dirs, ignore=False):
                 in_feats, point, extent, res, out_dirs[i], ignore))
 
     return outputs
+
+def rasterize_hydros(in_feats, points, extent, res, cache_dir, ignore=False,
+                     max_cells=50000000):
+    """Rasterize each hydro feature layer once over the union of all windows.
+
+    Each layer is converted to one raster at the target resolution covering
+    the computational domains (plus padding) of all points, and is cached as
+    a binary grid (hydro_{i}.npy and hydro_{i}.json) in cache_dir, with its
+    values pre-formatted into a memory-mapped text file (hydro_{i}.text.npy).
+    The hydro files of each point are then slices of these grids (see
+    prepare_hydros_from_grids).
+
+    The union extent is a bounding box, so points spread far apart (e.g.,
+    along a pipeline) give a grid much larger than all windows together. If
+    the grid would have more than max_cells cells, nothing is rasterized and
+    None is returned, and the caller should rasterize per point instead. Cells
+    near window edges may also differ slightly from per-point rasterization,
+    because features are not clipped to each window first.
+
+    Args:
+        in_feats [in]: a list of hydro feature layers.
+        points [in]: an array of (x, y, ...) of rupture points.
+        extent [in]: (top, bottom, left, right) distances to rupture points.
+        res [in]: the resolution of rasters.
+        cache_dir [in]: the folder of cached grids.
+        ignore [in]: reuse cached grids made from the same layers and windows.
+        max_cells [in]: the max number of cells of the union grid.
+
+    Return:
+        A list of helpers.rastertools.RasterGrid, one per layer, or None if
+        the union grid exceeds max_cells.
+    """
+
+    windows = numpy.array([topo_window(point, extent) for point in points])
+
+    # the union extent snapped to whole cells
+    left, bottom = windows[:, 0].min(), windows[:, 1].min()
+    ncols = int(numpy.ceil((windows[:, 2].max()-left)/res))
+    nrows = int(numpy.ceil((windows[:, 3].max()-bottom)/res))
+    right, top = left + ncols * res, bottom + nrows * res
+
+    if ncols * nrows > max_cells:
+        return None
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    grids = []
+    for i, feat in enumerate(in_feats):
+
+        output = os.path.join(cache_dir, "hydro_{}".format(i))
+        meta = {"layer": str(feat), "res": float(res),
+                "extent": [float(left), float(bottom), float(right), float(top)]}
+
+        grid = RasterGrid.load(output, meta, True) if ignore else None
+
+        if grid is None:
+            with arcpy.EnvManager(
+                    extent=arcpy.Extent(left, bottom, right, top),
+                    outputCoordinateSystem=arcpy.SpatialReference(3857)):
+                arcpy.conversion.FeatureToRaster(
+                    feat, "FType", "hydro_raster_{}".format(i), res)
+
+            data = arcpy.RasterToNumPyArray(
+                "hydro_raster_{}".format(i), arcpy.Point(left, bottom),
+                ncols, nrows, nodata_to_value=-9999.)
+
+            arcpy.management.Delete("hydro_raster_{}".format(i))
+
+            RasterGrid(data.astype(numpy.float32), left, bottom, res).save(output, meta)
+            grid = RasterGrid.load(output, meta, True)
+
+        grids.append(grid)
+
+    return grids
+
+def prepare_hydros_from_grids(grids, points, extent, out_dirs, ignore=False):
+    """Write hydro files of many points by slicing pre-rasterized grids.
+
+    Args:
+        grids [in]: a list of RasterGrid (see rasterize_hydros).
+        points [in]: an array of (x, y, ...) of rupture points.
+        extent [in]: (top, bottom, left, right) distances to rupture points.
+        out_dirs [in]: the case folders of the points.
+        ignore [in]: keep existing hydro files.
+
+    Return:
+        A list (one per point) of lists of the paths of hydro files.
+    """
+
+    outputs = [[] for _ in out_dirs]
+
+    for i, grid in enumerate(grids):
+        files = write_windows(
+            grid, points, extent, out_dirs, "hydro_{}.asc".format(i), ignore)
+
+        for output, filename in zip(outputs, files):
+            output.append(filename)
+
+    return outputs
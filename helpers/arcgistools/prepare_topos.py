@@ -40,6 +40,8 @@ Prepare topagraphy files for each rupture points by clipping base topo.
 import os
 import arcpy
 import numpy
+from helpers.rastertools import write_tiled_raster_blocks
+from helpers.rastertools import write_window_file
 
 def prepare_topos(base, points, extent, out_dirs, ignore=False):
     """Prepare topagraphy files for each rupture points by clipping base topo."""
@@ -55,10 +57,7 @@ def prepare_topos(base, points, extent, out_dirs, ignore=False):
 def prepare_single_topo(base, point, extent, out_dir, ignore=False):
     """Prepare the topo file for a rupture point by clipping base topo."""
 
-    top = point[1] + extent[0] + 10
-    bottom = point[1] - extent[1] - 10
-    left = point[0] - extent[2] - 10
-    right = point[0] + extent[3] + 10
+    left, bottom, right, top = topo_window(point, extent)
 
     if not os.path.isdir(out_dir):
         raise FileNotFoundError("{} does not exist.".format(out_dir))
@@ -86,3 +85,63 @@ def prepare_single_topo(base, point, extent, out_dir, ignore=False):
     arcpy.management.Delete("temp")
 
     return output
+
+def topo_window(point, extent):
+    """The clip window (left, bottom, right, top) of a rupture point."""
+
+    top = point[1] + extent[0] + 10
+    bottom = point[1] - extent[1] - 10
+    left = point[0] - extent[2] - 10
+    right = point[0] + extent[3] + 10
+
+    return left, bottom, right, top
+
+def prepare_single_topo_window(point, extent, out_dir, ignore=False):
+    """Write the clip window of a rupture point instead of a clipped topo.
+
+    The window file (topo_window.txt) is used by computing nodes to crop the
+    shared base topography (see export_tiled_topo) into topo.asc.
+    """
+
+    if not os.path.isdir(out_dir):
+        raise FileNotFoundError("{} does not exist.".format(out_dir))
+
+    output = os.path.join(out_dir, "topo_window.txt")
+
+    if os.path.isfile(output) and ignore:
+        return output
+
+    write_window_file(output, *topo_window(point, extent))
+
+    return output
+
+def export_tiled_topo(base, output, ignore=False, tile_size=256, tile_rows=4):
+    """Export base topo to a tiled raster file that can be shared by cases.
+
+    The base raster is read in blocks of tile_rows rows of tiles, so only one
+    block is held in memory at a time.
+    """
+
+    if os.path.isfile(output):
+        if ignore:
+            return output
+        else:
+            os.remove(output)
+
+    desc = arcpy.Describe(base)
+    ncols, nrows = desc.width, desc.height
+    cellsize = desc.meanCellWidth
+    block_rows = tile_size * tile_rows
+
+    def blocks():
+        for r in range(0, nrows, block_rows):
+            rows = min(block_rows, nrows-r)
+            yield arcpy.RasterToNumPyArray(
+                base, arcpy.Point(desc.extent.XMin, desc.extent.YMin+(nrows-r-rows)*cellsize),
+                ncols, rows, nodata_to_value=-9999.)
+
+    write_tiled_raster_blocks(
+        output, blocks(), ncols, nrows, desc.extent.XMin, desc.extent.YMin,
+        cellsize, -9999., tile_size)
+
+    return output
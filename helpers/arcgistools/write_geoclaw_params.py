@@ -38,7 +38,9 @@
 Write GeoClaw setrun.py
 """
 import os
+import json
 import numpy
+from helpers.arcgistools.point_index import point_coords
 
 template = \
 "########################################################################################################################" + "\n" + \
@@ -211,22 +213,35 @@ template = \
 "    rundata = setrun(*sys.argv[1:])" + "\n" + \
 "    rundata.write()"
 
-def write_setrun(
-        aprx_file, out_dir, rupture_point_layer, rupture_point_path,
-        point, extent, end_time, output_time,
-        res, ref_mu, ref_temp, amb_temp,
-        density, leak_profile, evap_type, evap_coeffs, n_hydros,
-        friction_type, roughness, dt_init, dt_max, cfl_desired,
-        cfl_max, amr_max, refinement_ratio,
-        apply_datetime_stamp, datetime_stamp, calendar_type,
-        case_name_method, case_field_name):
+roughness_template = \
+    "1 mx\n" + \
+    "1 my\n" + \
+    "{} xlower\n" + \
+    "{} ylower\n" + \
+    "{} cellsize\n" + \
+    "{} nodatavalue\n\n" + \
+    "{}"
 
-    """Added parameters for CF datetime compliance and case name field - 6/28/2019 - G2 Integrated Solutions - JTT"""
+case_settings_template = \
+    "ARCGIS_PROJECT={}\n" + \
+    "RUPTURE_POINT_LAYER={}\n" + \
+    "RUPTURE_POINT_PATH={}\n" + \
+    "POINT_X={}\n" + \
+    "POINT_Y={}\n" + \
+    "APPLY_DATETIME_STAMP={}\n" + \
+    "DATETIME_STAMP={}\n" + \
+    "CALENDAR_TYPE={}\n" + \
+    "CASE_NAME_METHOD={}\n" + \
+    "CASE_FIELD_NAME={}\n" + \
+    "CASE_NAME={}"
 
-    """Write setrun.py"""
-
-    if not os.path.isdir(out_dir):
-        raise FileNotFoundError("{} does not exist.".format(out_dir))
+def _setrun_fields(
+        extent, end_time, output_time,
+        res, ref_mu, ref_temp, amb_temp,
+        density, leak_profile, evap_type, evap_coeffs,
+        friction_type, roughness, dt_init, dt_max, cfl_desired,
+        cfl_max, amr_max, refinement_ratio):
+    """The fields of the setrun.py template that do not depend on points."""
 
     NCells = [int((extent[3]+extent[2])/(4*res[0])+0.5),
               int((extent[1]+extent[0])/(4*res[1])+0.5)]
@@ -251,16 +266,14 @@ def write_setrun(
     else:
         raise RuntimeError
 
-    hydro_strings = ["hydro_{}.asc".format(i) for i in range(n_hydros)]
-
     if dt_init == 0:
         dt_init = dt_max / (refinement_ratio**(amr_max-1))
 
     refinement_ratio_str = numpy.array2string(
         numpy.ones(amr_max-1, dtype=int)*refinement_ratio, separator=", ")
 
-    data = template.format(
-        point=point, extent=extent, NCells=NCells,
+    return dict(
+        extent=extent, NCells=NCells,
         end_time=end_time, output_time=output_time,
         ref_mu=ref_mu, ref_temp=ref_temp, amb_temp=amb_temp, density=density,
         NStages=leak_profile.shape[0],
@@ -268,13 +281,39 @@ def write_setrun(
         StageRates=numpy.array2string(leak_profile[:, 1], separator=", "),
         evap_type=evap_type_num,
         evap_coeffs=numpy.array2string(evap_coeffs, separator=", "),
-        hydros=hydro_strings,
         friction_type=friction_type_num,
         roughness=roughness,
         dt_init=dt_init, dt_max=dt_max,
         cfl_desired=cfl_desired, cfl_max=cfl_max,
         amr_max=amr_max, refinement_ratio=refinement_ratio_str)
 
+def write_setrun(
+        aprx_file, out_dir, rupture_point_layer, rupture_point_path,
+        point, extent, end_time, output_time,
+        res, ref_mu, ref_temp, amb_temp,
+        density, leak_profile, evap_type, evap_coeffs, n_hydros,
+        friction_type, roughness, dt_init, dt_max, cfl_desired,
+        cfl_max, amr_max, refinement_ratio,
+        apply_datetime_stamp, datetime_stamp, calendar_type,
+        case_name_method, case_field_name):
+
+    """Added parameters for CF datetime compliance and case name field - 6/28/2019 - G2 Integrated Solutions - JTT"""
+
+    """Write setrun.py"""
+
+    if not os.path.isdir(out_dir):
+        raise FileNotFoundError("{} does not exist.".format(out_dir))
+
+    hydro_strings = ["hydro_{}.asc".format(i) for i in range(n_hydros)]
+
+    data = template.format(
+        point=point, hydros=hydro_strings,
+        **_setrun_fields(
+            extent, end_time, output_time, res, ref_mu, ref_temp, amb_temp,
+            density, leak_profile, evap_type, evap_coeffs, friction_type,
+            roughness, dt_init, dt_max, cfl_desired, cfl_max, amr_max,
+            refinement_ratio))
+
     output = os.path.join(out_dir, "setrun.py")
     with open(output, "w") as f:
         f.write(data)
@@ -291,16 +330,7 @@ def write_roughness(aprx_file, out_dir, rupture_point_layer, rupture_point_path,
 
     """Write roughness.txt."""
 
-    temp = \
-        "1 mx\n" + \
-        "1 my\n" + \
-        "{} xlower\n" + \
-        "{} ylower\n" + \
-        "{} cellsize\n" + \
-        "{} nodatavalue\n\n" + \
-        "{}"
-
-    data = temp.format(
+    data = roughness_template.format(
         point[0]-extent[2]-10, point[1]-extent[1]-10,
         extent[1]+extent[0]+20, -9999, value)
 
@@ -322,20 +352,7 @@ def write_case_settings(aprx_file, out_dir, rupture_point_layer, rupture_point_p
     6/28/2019 - G2 Integrated Solutions - JTT
     """
 
-    file_template = \
-        "ARCGIS_PROJECT={}\n" + \
-        "RUPTURE_POINT_LAYER={}\n" + \
-        "RUPTURE_POINT_PATH={}\n" + \
-        "POINT_X={}\n" + \
-        "POINT_Y={}\n" + \
-        "APPLY_DATETIME_STAMP={}\n" + \
-        "DATETIME_STAMP={}\n" + \
-        "CALENDAR_TYPE={}\n" + \
-        "CASE_NAME_METHOD={}\n" + \
-        "CASE_FIELD_NAME={}\n" + \
-        "CASE_NAME={}"
-
-    file_data = file_template.format(
+    file_data = case_settings_template.format(
         aprx_file, rupture_point_layer, rupture_point_path, point[0], point[1],
         apply_datetime_stamp, datetime_stamp, calendar_type,
         case_name_method, case_field_name, os.path.basename(out_dir))
@@ -345,3 +362,262 @@ def write_case_settings(aprx_file, out_dir, rupture_point_layer, rupture_point_p
         f.write(file_data)
 
     return output
+
+
+# marks the per-point fields in pre-rendered templates
+_SEP = "\x00"
+
+# the per-case record used with a mission-wide parameter script
+case_override_file = "case_override.json"
+
+# the files written for a case from the templates
+case_param_files = ["setrun.py", "roughness.txt", "case_settings.txt"]
+
+# the mission-wide parameter script; the pre-rendered templates and the domain
+# extent are inserted between the head and the body
+mission_script_head = \
+"\"\"\"" + "\n" + \
+"Write setrun.py, roughness.txt, and case_settings.txt of cases from the mission-wide" + "\n" + \
+"parameters in this file and the case_override.json in each case folder." + "\n" + \
+"" + "\n" + \
+"Usage: python mission_setrun.py <case folder> [<case folder> ...]" + "\n" + \
+"\"\"\"" + "\n" + \
+"import os" + "\n" + \
+"import sys" + "\n" + \
+"import json" + "\n"
+
+mission_script_body = \
+"def render(texts, keys, values):" + "\n" + \
+"    pieces = [texts[0]]" + "\n" + \
+"    for key, text in zip(keys, texts[1:]):" + "\n" + \
+"        pieces.append(values[key])" + "\n" + \
+"        pieces.append(text)" + "\n" + \
+"    return ''.join(pieces)" + "\n" + \
+"def write_case(case_dir):" + "\n" + \
+"    with open(os.path.join(case_dir, 'case_override.json'), 'r') as f:" + "\n" + \
+"        override = json.load(f)" + "\n" + \
+"    x, y = [float(v) for v in override['point']]" + "\n" + \
+"    values = {" + "\n" + \
+"        'x': repr(x), 'y': repr(y)," + "\n" + \
+"        'xlower': repr(x-extent[2]-10), 'ylower': repr(y-extent[1]-10)," + "\n" + \
+"        'hydros': str(['hydro_{}.asc'.format(i) for i in range(override['n_hydros'])])," + "\n" + \
+"        'casename': override['case_name']}" + "\n" + \
+"    for filename, (texts, keys) in templates.items():" + "\n" + \
+"        with open(os.path.join(case_dir, filename), 'w') as f:" + "\n" + \
+"            f.write(render(texts, keys, values))" + "\n" + \
+"if __name__ == '__main__':" + "\n" + \
+"    for case_dir in sys.argv[1:]:" + "\n" + \
+"        write_case(case_dir)" + "\n"
+
+def _split_rendered(text):
+    """Split a template rendered with _SEP-quoted keys into text and keys."""
+
+    parts = text.split(_SEP)
+    return parts[0::2], parts[1::2]
+
+class SetrunWriter(object):
+    """Write setrun.py, roughness.txt, and case_settings.txt of many points.
+
+    The templates are rendered once with everything shared by the points, so
+    writing a case only joins the pre-rendered fragments with its own
+    coordinates, bounds, hydro file list, and case name. The per-point
+    numbers are computed for all points at once with NumPy.
+
+    The keyword arguments are the same as those of write_setrun, except the
+    per-point out_dir, point, and n_hydros.
+    """
+
+    def __init__(
+            self, aprx_file, rupture_point_layer, rupture_point_path,
+            extent, end_time, output_time,
+            res, ref_mu, ref_temp, amb_temp,
+            density, leak_profile, evap_type, evap_coeffs,
+            friction_type, roughness, dt_init, dt_max, cfl_desired,
+            cfl_max, amr_max, refinement_ratio,
+            apply_datetime_stamp, datetime_stamp, calendar_type,
+            case_name_method, case_field_name):
+
+        self.extent = [float(value) for value in extent]
+
+        fields = _setrun_fields(
+            extent, end_time, output_time, res, ref_mu, ref_temp, amb_temp,
+            density, leak_profile, evap_type, evap_coeffs, friction_type,
+            roughness, dt_init, dt_max, cfl_desired, cfl_max, amr_max,
+            refinement_ratio)
+
+        self.setrun = _split_rendered(template.format(
+            point=[_SEP+"x"+_SEP, _SEP+"y"+_SEP], hydros=_SEP+"hydros"+_SEP,
+            **fields))
+
+        self.roughness = _split_rendered(roughness_template.format(
+            _SEP+"xlower"+_SEP, _SEP+"ylower"+_SEP,
+            extent[1]+extent[0]+20, -9999, roughness))
+
+        self.case_settings = _split_rendered(case_settings_template.format(
+            aprx_file, rupture_point_layer, rupture_point_path,
+            _SEP+"x"+_SEP, _SEP+"y"+_SEP,
+            apply_datetime_stamp, datetime_stamp, calendar_type,
+            case_name_method, case_field_name, _SEP+"casename"+_SEP))
+
+        # hydro file lists by the number of hydro files
+        self._hydros = {}
+
+    def _hydro_list(self, n_hydros):
+        """The string of the hydro file list of a case."""
+
+        if n_hydros not in self._hydros:
+            self._hydros[n_hydros] = str(["hydro_{}.asc".format(i) for i in range(n_hydros)])
+
+        return self._hydros[n_hydros]
+
+    @staticmethod
+    def _render(rendered, values):
+        """Join pre-rendered text fragments with the values of their keys."""
+
+        texts, keys = rendered
+
+        pieces = [texts[0]]
+        for key, text in zip(keys, texts[1:]):
+            pieces.append(values[key])
+            pieces.append(text)
+
+        return "".join(pieces)
+
+    def write(self, out_dirs, points, n_hydros):
+        """Write the files of points into their folders.
+
+        Args:
+            out_dirs [in]: a list of N existing case folders.
+            points [in]: an N x 2 (or N x 3) array or N point records.
+            n_hydros [in]: the number of hydro files, either shared or one per
+                point.
+
+        Return:
+            A list of the paths to setrun.py.
+        """
+
+        xy = point_coords(points)
+        assert xy.shape[0] == len(out_dirs), "Numbers of points and folders differ."
+
+        n_hydros = numpy.broadcast_to(numpy.asarray(n_hydros, dtype=int), (len(out_dirs),))
+
+        x = xy[:, 0].astype(str)
+        y = xy[:, 1].astype(str)
+        xlower = (xy[:, 0] - self.extent[2] - 10).astype(str)
+        ylower = (xy[:, 1] - self.extent[1] - 10).astype(str)
+
+        outputs = []
+        for i, out_dir in enumerate(out_dirs):
+
+            if not os.path.isdir(out_dir):
+                raise FileNotFoundError("{} does not exist.".format(out_dir))
+
+            # a stale override would replace these files on computing nodes
+            if os.path.isfile(os.path.join(out_dir, case_override_file)):
+                os.remove(os.path.join(out_dir, case_override_file))
+
+            values = {
+                "x": x[i], "y": y[i], "xlower": xlower[i], "ylower": ylower[i],
+                "hydros": self._hydro_list(int(n_hydros[i])),
+                "casename": os.path.basename(out_dir)}
+
+            output = os.path.join(out_dir, "setrun.py")
+            with open(output, "w") as f:
+                f.write(self._render(self.setrun, values))
+
+            with open(os.path.join(out_dir, "roughness.txt"), "w") as f:
+                f.write(self._render(self.roughness, values))
+
+            with open(os.path.join(out_dir, "case_settings.txt"), "w") as f:
+                f.write(self._render(self.case_settings, values))
+
+            outputs.append(output)
+
+        return outputs
+
+    def write_overrides(self, out_dirs, points, n_hydros):
+        """Write only the case_override.json of points into their folders.
+
+        The override holds what differs between cases: the point, the number
+        of hydro files, and the case name. The script from
+        write_mission_script combines it with the mission-wide parameters
+        into the same files as write does.
+
+        Args:
+            out_dirs [in]: a list of N existing case folders.
+            points [in]: an N x 2 (or N x 3) array or N point records.
+            n_hydros [in]: the number of hydro files, either shared or one per
+                point.
+
+        Return:
+            A list of the paths to case_override.json.
+        """
+
+        xy = point_coords(points)
+        assert xy.shape[0] == len(out_dirs), "Numbers of points and folders differ."
+
+        n_hydros = numpy.broadcast_to(numpy.asarray(n_hydros, dtype=int), (len(out_dirs),))
+
+        outputs = []
+        for i, out_dir in enumerate(out_dirs):
+
+            if not os.path.isdir(out_dir):
+                raise FileNotFoundError("{} does not exist.".format(out_dir))
+
+            # full parameter files from the other mode would be uploaded for nothing
+            for filename in case_param_files:
+                if os.path.isfile(os.path.join(out_dir, filename)):
+                    os.remove(os.path.join(out_dir, filename))
+
+            output = os.path.join(out_dir, case_override_file)
+            with open(output, "w") as f:
+                json.dump({
+                    "point": xy[i].tolist(), "n_hydros": int(n_hydros[i]),
+                    "case_name": os.path.basename(out_dir)}, f)
+
+            outputs.append(output)
+
+        return outputs
+
+    def write_mission_script(self, filename):
+        """Write the mission-wide parameter script.
+
+        The script carries the pre-rendered templates. Running it with case
+        folders writes their setrun.py, roughness.txt, and case_settings.txt
+        from their case_override.json (see write_overrides).
+
+        Args:
+            filename [in]: path to the output script.
+
+        Return:
+            The path to the script.
+        """
+
+        templates = dict(zip(
+            case_param_files, [self.setrun, self.roughness, self.case_settings]))
+
+        # the templates contain non-ASCII characters; nodes read UTF-8
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(mission_script_head)
+            f.write("extent = {!r}\n".format(self.extent))
+            f.write("templates = {!r}\n".format(templates))
+            f.write(mission_script_body)
+
+        return filename
+
+
+def write_setrun_batch(out_dirs, points, n_hydros, **kwargs):
+    """Write setrun.py, roughness.txt, and case_settings.txt of many points.
+
+    Args:
+        out_dirs [in]: a list of N existing case folders.
+        points [in]: an N x 2 (or N x 3) array or N point records.
+        n_hydros [in]: the number of hydro files, either shared or one per
+            point.
+        kwargs [in]: the other keyword arguments of write_setrun.
+
+    Return:
+        A list of the paths to setrun.py.
+    """
+
+    return SetrunWriter(**kwargs).write(out_dirs, points, n_hydros)
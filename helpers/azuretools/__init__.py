@@ -43,8 +43,12 @@ import importlib as _importlib
 try:
     _importlib.reload(user_credential)
     _importlib.reload(mission_info)
+    _importlib.reload(worker_pool)
+    _importlib.reload(sync_manifest)
     _importlib.reload(mission_controller)
+    _importlib.reload(case_pipeline)
     _importlib.reload(mission_status_reporter)
+    _importlib.reload(task_tracker)
     _importlib.reload(graphical_monitor)
     _importlib.reload(mission)
 except NameError as err:
@@ -55,8 +59,10 @@ except NameError as err:
 from .user_credential import UserCredential
 from .mission_info import MissionInfo
 from .mission_controller import MissionController
-from .mission_status_reporter import MissionStatusReporter
-from .graphical_monitor import GraphicalMonitor
+from .case_pipeline import CasePipeline
+from .mission_status_reporter import MissionStatusReporter, PollingScheduler, StatusCache
+from .task_tracker import TaskTracker
+from .graphical_monitor import GraphicalMonitor, StatusHistory
 from .mission import Mission
 
 # meta data
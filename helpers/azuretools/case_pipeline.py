@@ -0,0 +1,249 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+########################################################################################################################
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+# All Rights Reserved.
+#
+# Contributors: Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Licensed under the BSD-3-Clause License (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at: https://opensource.org/licenses/BSD-3-Clause
+#
+# BSD-3-Clause License:
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#    following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+# GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+########################################################################################################################
+
+"""
+A pipeline that uploads and submits cases while they are still being prepared.
+"""
+import time
+import queue
+import logging
+import threading
+from .mission_info import MissionInfo
+from .mission_controller import MissionController
+
+
+class CasePipeline():
+    """Upload and submit cases as soon as they are prepared.
+
+    Cases go through two stages connected by bounded queues:
+
+        put() --> [upload queue] --> uploaders --> [submit queue] --> submitter
+
+    Several uploader threads upload case folders concurrently. One submitter
+    thread collects uploaded cases and submits them in bulk (see
+    MissionController.submit_tasks) when batch_size cases are waiting or when
+    the oldest waiting case has waited for batch_wait seconds. So the first
+    tasks reach the pool while later cases are still being prepared.
+
+    put() blocks when the upload queue is full, so the preparation of cases
+    can not run too far ahead of uploading.
+    """
+
+    def __init__(self, controller, mission, ignore_exist=True, n_uploaders=4,
+                 max_queued=64, batch_size=100, batch_wait=10., bundle=None,
+                 dedup=False):
+        """Constructor.
+
+        Args:
+            controller [in]: a MissionController object.
+            mission [in]: a MissionInfo object.
+            ignore_exist [in]: skip a case if it is already in the mission.
+            n_uploaders [in]: number of cases uploaded concurrently.
+            max_queued [in]: maximum number of cases waiting in each queue.
+            batch_size [in]: maximum number of tasks submitted in one request.
+            batch_wait [in]: maximum seconds an uploaded case waits for others.
+            bundle [in]: None, "gzip", or "zstd"; upload each case as files or
+                as one compressed tarball (see MissionController.add_task).
+            dedup [in]: upload files to the mission's content-addressed store.
+        """
+
+        assert isinstance(controller, MissionController), "Type error!"
+        assert isinstance(mission, MissionInfo), "Type error!"
+        assert isinstance(ignore_exist, bool), "Type error!"
+        assert 0 < batch_size <= 100, "batch_size should be in [1, 100]."
+
+        self.logger = logging.getLogger("AzureMission")
+
+        self.controller = controller
+        self.mission = mission
+        self.ignore_exist = ignore_exist
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.bundle = bundle
+        self.dedup = dedup
+
+        self._upload_queue = queue.Queue(max_queued)
+        self._submit_queue = queue.Queue(max_queued)
+
+        self._uploaders = [
+            threading.Thread(target=self._upload_worker, daemon=True)
+            for _ in range(n_uploaders)]
+        self._submitter = threading.Thread(target=self._submit_worker, daemon=True)
+
+        self._lock = threading.Lock()
+        self._seen = set()
+        self.submitted = [] # names of submitted cases
+        self.errors = [] # (case name, error message)
+
+    def __enter__(self):
+        """Start the pipeline when used as a context manager."""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Finish all cases in the pipeline."""
+        self.close()
+
+    def start(self):
+        """Start the uploader and submitter threads."""
+
+        for uploader in self._uploaders:
+            uploader.start()
+        self._submitter.start()
+
+        self.logger.info("Case pipeline started.")
+
+    def put(self, casename, casepath):
+        """Hand a prepared case to the pipeline. Block if the queue is full.
+
+        Args:
+            casename [in]: str; the name of the case
+            casepath [in]: str; the path to case's directory
+        """
+
+        assert isinstance(casename, str), "Type error!"
+        assert isinstance(casepath, str), "Type error!"
+
+        with self._lock:
+            if casename in self._seen:
+                self.logger.info("%s already in pipeline. Skip.", casename)
+                return
+            self._seen.add(casename)
+
+        if casename in self.mission.tasks:
+            if self.ignore_exist:
+                self.logger.info("%s already in job. Skip.", casename)
+                return
+            # if choose not to ignore, delete the existing task
+            self.controller.delete_task(self.mission, casename)
+
+        self._upload_queue.put((casename, casepath))
+
+    def close(self):
+        """Wait until all cases in the pipeline are uploaded and submitted.
+
+        Return:
+            (a list of submitted case names, a list of (case name, error message)).
+        """
+
+        for _ in self._uploaders:
+            self._upload_queue.put(None)
+
+        for uploader in self._uploaders:
+            uploader.join()
+
+        self._submit_queue.put(None)
+        self._submitter.join()
+
+        self.logger.info(
+            "Case pipeline finished: %d submitted; %d failed.",
+            len(self.submitted), len(self.errors))
+
+        return self.submitted, self.errors
+
+    def _upload_worker(self):
+        """The loop of an uploader thread."""
+
+        while True:
+            item = self._upload_queue.get()
+
+            if item is None:
+                return
+
+            casename, casepath = item
+
+            try:
+                if self.bundle is not None:
+                    self.controller.upload_case_bundle(
+                        self.mission, casename, casepath, self.bundle)
+                elif self.dedup:
+                    self.controller.upload_case_shared(
+                        self.mission, casename, casepath)
+                else:
+                    self.controller.upload_local_dir(
+                        self.mission, casename, casepath, True,
+                        self.controller.task_ignore_patterns, max_workers=2,
+                        include_patterns=self.controller.task_input_patterns)
+            except Exception as err: # pylint: disable=broad-except
+                self.logger.error("Failed uploading %s: %s", casename, err)
+                with self._lock:
+                    self.errors.append((casename, str(err)))
+                continue
+
+            self._submit_queue.put(item)
+
+    def _submit_worker(self):
+        """The loop of the submitter thread."""
+
+        batch = {}
+        deadline = None
+        finished = False
+
+        while not finished:
+            timeout = None if deadline is None else max(deadline-time.time(), 0)
+
+            try:
+                item = self._submit_queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False # the oldest case has waited long enough
+
+            if item is None:
+                finished = True
+            elif item:
+                batch[item[0]] = item[1]
+                if deadline is None:
+                    deadline = time.time() + self.batch_wait
+
+            if batch and (finished or item is False or len(batch) >= self.batch_size):
+                self._submit(batch)
+                batch = {}
+                deadline = None
+
+    def _submit(self, batch):
+        """Submit a batch of uploaded cases."""
+
+        try:
+            submitted, errors = self.controller.submit_tasks(
+                self.mission, batch, bundle=self.bundle, dedup=self.dedup)
+        except Exception as err: # pylint: disable=broad-except
+            self.logger.error("Failed submitting %d cases: %s", len(batch), err)
+            submitted, errors = [], [(casename, str(err)) for casename in batch]
+
+        with self._lock:
+            self.submitted += submitted
+            self.errors += errors
+
+        self.logger.info("Submitted %d cases to job.", len(submitted))
@@ -36,20 +36,256 @@
 """
 A callable object of graphical real-time status monitor.
 """
-import functools
+import os
+import time
+import datetime
 import numpy
 from matplotlib import pyplot
-from matplotlib import animation
+
+
+class StatusHistory():
+    """A fixed-size ring buffer of the counts in status snapshots.
+
+    Each row holds the time of a snapshot (epoch seconds), the number of
+    nodes in each state, and the number of tasks in each state. Rows can also
+    be appended to a compact binary log: a header line of column names
+    followed by the rows as float64.
+    """
+
+    # node states and task states recorded, in this order after the time
+    node_labels = [
+        "running", "idle", "creating", "starting", "waiting_for_start_task",
+        "unusable", "leaving_pool", "rebooting", "reimaging",
+        "start_task_failed", "unknown", "offline", "preempted"]
+
+    task_labels = ["succeeded", "running", "active", "failed"]
+
+    def __init__(self, capacity=10000, log_file=None):
+        """Constructor.
+
+        Args:
+            capacity [in]: max number of snapshots kept in memory.
+            log_file [in]: path to a binary log; rows already in the log are
+                loaded, and new rows are appended. (default: no log)
+        """
+
+        self.columns = ["time"] + \
+            ["node:{}".format(label) for label in self.node_labels] + \
+            ["task:{}".format(label) for label in self.task_labels]
+
+        self._data = numpy.zeros((capacity, len(self.columns)), dtype=numpy.float64)
+        self._size = 0 # number of valid rows
+        self._head = 0 # the row the next snapshot goes to
+
+        self.log_file = log_file
+
+        if log_file is not None:
+            if os.path.isfile(log_file):
+                self.extend(self.read_log(log_file))
+            else:
+                with open(log_file, "w", encoding="utf-8") as f:
+                    f.write(",".join(self.columns) + "\n")
+
+    def __len__(self):
+        """Number of snapshots kept."""
+
+        return self._size
+
+    @staticmethod
+    def _snapshot_time(snapshot):
+        """The epoch time of a snapshot from its timestamp string."""
+
+        try:
+            return datetime.datetime.strptime(
+                snapshot["timestamp"], "%a %b %d %H:%M:%S %Z %Y").replace(
+                    tzinfo=datetime.timezone.utc).timestamp()
+        except ValueError:
+            return time.time()
+
+    def append(self, snapshot):
+        """Record a snapshot.
+
+        Args:
+            snapshot [in]: a dict from MissionStatusReporter.get_status_snapshot.
+        """
+
+        row = numpy.empty(len(self.columns), dtype=numpy.float64)
+        row[0] = self._snapshot_time(snapshot)
+        row[1:1+len(self.node_labels)] = \
+            [snapshot["node_status"].get(label, 0) for label in self.node_labels]
+        row[1+len(self.node_labels):] = \
+            [snapshot["task_status"][label] for label in self.task_labels]
+
+        self.extend(row[None, :])
+
+        if self.log_file is not None:
+            with open(self.log_file, "ab") as f:
+                row.tofile(f)
+
+    def extend(self, rows):
+        """Record rows of counts without logging them.
+
+        Args:
+            rows [in]: a 2D array with one column per item in self.columns.
+        """
+
+        capacity = self._data.shape[0]
+        rows = rows[-capacity:]
+
+        idx = (self._head + numpy.arange(rows.shape[0])) % capacity
+        self._data[idx] = rows
+
+        self._head = (self._head + rows.shape[0]) % capacity
+        self._size = min(self._size + rows.shape[0], capacity)
+
+    @classmethod
+    def read_log(cls, log_file):
+        """Read all rows in a binary log.
+
+        Args:
+            log_file [in]: path to the log.
+
+        Return:
+            A 2D array with one row per snapshot.
+        """
+
+        with open(log_file, "rb") as f:
+            n_columns = len(f.readline().decode("utf-8").strip().split(","))
+            data = numpy.fromfile(f, dtype=numpy.float64)
+
+        # ignore a partially written last row
+        n_rows = data.size // n_columns
+        return data[:n_rows*n_columns].reshape(n_rows, n_columns)
+
+    @property
+    def capacity(self):
+        """Max number of snapshots kept in memory."""
+
+        return self._data.shape[0]
+
+    @property
+    def data(self):
+        """A copy of the kept rows, from the oldest to the newest."""
+
+        return self.copy_to(numpy.empty_like(self._data))
+
+    def copy_to(self, out):
+        """Copy the kept rows, from the oldest to the newest, into an array.
+
+        Args:
+            out [in]: a 2D array with at least capacity rows and one column per
+                item in self.columns; e.g., a buffer reused between frames.
+
+        Return:
+            A view of the first len(self) rows of out.
+        """
+
+        if self._size < self._data.shape[0]:
+            out[:self._size] = self._data[:self._size]
+        else:
+            tail = self._data.shape[0] - self._head
+            out[:tail] = self._data[self._head:]
+            out[tail:self._size] = self._data[:self._head]
+
+        return out[:self._size]
+
+    @property
+    def times(self):
+        """Epoch times of the kept snapshots."""
+
+        return self.data[:, 0]
+
+    @property
+    def node_counts(self):
+        """A 2D array of node counts; one column per item in node_labels."""
+
+        return self.data[:, 1:1+len(self.node_labels)]
+
+    @property
+    def task_counts(self):
+        """A 2D array of task counts; one column per item in task_labels."""
+
+        return self.data[:, 1+len(self.node_labels):]
+
+    def throughput(self, window=3600., data=None):
+        """Tasks finished per hour over a trailing time window.
+
+        Args:
+            window [in]: seconds of the window.
+            data [in]: the rows from data or copy_to, if already fetched.
+
+        Return:
+            A 1D array, one value per snapshot; NaN when the window has no
+            earlier snapshot.
+        """
+
+        data = self.data if data is None else data
+        times = data[:, 0]
+        finished = \
+            data[:, 1+len(self.node_labels)+self.task_labels.index("succeeded")] + \
+            data[:, 1+len(self.node_labels)+self.task_labels.index("failed")]
+
+        # the oldest snapshot inside the window of each snapshot
+        start = numpy.searchsorted(times, times-window)
+        elapsed = times - times[start]
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            rate = (finished - finished[start]) / elapsed * 3600.
+
+        rate[elapsed <= 0] = numpy.nan
+
+        return rate
+
+    def eta(self, window=3600., data=None, throughput=None):
+        """Estimated seconds until all tasks finish at the current throughput.
+
+        Args:
+            window [in]: seconds of the window used for the throughput.
+            data [in]: the rows from data or copy_to, if already fetched.
+            throughput [in]: the result of throughput(window), if already computed.
+
+        Return:
+            Seconds; 0 if no task is left, and inf if nothing finishes.
+        """
+
+        if self._size == 0:
+            return numpy.inf
+
+        data = self.data if data is None else data
+
+        latest = data[-1, 1+len(self.node_labels):]
+        remaining = latest[self.task_labels.index("active")] + \
+            latest[self.task_labels.index("running")]
+
+        if remaining == 0:
+            return 0.
+
+        if throughput is None:
+            throughput = self.throughput(window, data)
+
+        rate = throughput[-1]
+
+        if not rate > 0:
+            return numpy.inf
+
+        return remaining / rate * 3600.
 
 
 class GraphicalMonitor():
     """A callable object of graphical real-time status monitor."""
 
+    # seconds a cached snapshot can be overdue before it is flagged as stale
+    stale_margin = 60.
+
     def __init__(self):
         """Constructor."""
 
         # figure object and axes objects
         self._fig = self._ax_nodes = self._ax_tasks = None
+        self._ax_node_history = self._ax_task_history = self._ax_throughput = None
+
+        # StatusHistory of the snapshots drawn
+        self._history = None
 
         # the candidate labels for nodes with a preferred order
         self._label_candidates = [
@@ -60,38 +296,150 @@ class GraphicalMonitor():
         # the task status in our preferred order
         self._task_status_labels = ["succeeded", "running", "active", "failed"]
 
-    def __call__(self, mission, reporter, interval=30):
+        # the latest snapshot received and the one currently drawn
+        self._status = self._drawn = None
+
+        # the warning shown when cached snapshots stop being published
+        self._stale = None
+
+        # a callable returning the latest snapshot, and the timer checking it
+        self._source = self._timer = None
+
+        # the blitted redraw: artists updated in place, the background behind
+        # them, the layout of the static parts, and time series properties
+        self._blit = False
+        self._artists = self._animated = self._background = self._layout = None
+        self._t0 = self._limits = self._buffers = self._frame = None
+
+    def __call__(self, mission, reporter=None, interval=120, cache=None, history=None, blit=True):
         """Make this class callable.
 
         Args:
             mission [in]: a MissionInfo object.
             reporter [in]: a MissionStatusReporter object.
-            interval [in]: interval to update status (in seconds).
+            interval [in]: max interval to update status (in seconds); status
+                is polled more often right after it changes.
+            cache [in]: a StatusCache object; if given, snapshots are read from
+                it instead of being polled with the reporter. The process
+                publishing to the cache must stay alive while the monitor is
+                open; once a snapshot is overdue by stale_margin seconds, the
+                monitor shows a warning that the data are stale.
+            history [in]: a StatusHistory object recording the snapshots drawn;
+                e.g., one with a log file. (default: a new one in memory)
+            blit [in]: create artists once, update them in place, and only
+                redraw them over a saved background; falls back to rebuilding
+                the axes if the backend can not blit.
         """
 
+        assert reporter is not None or cache is not None, \
+            "Require either a reporter or a cache."
+
         # figure object and axes objects
-        self._fig, [self._ax_nodes, self._ax_tasks] = pyplot.subplots(
-            num=1, figsize=(7, 9), dpi=100,
-            nrows=2, ncols=1, sharex=False, sharey=False, squeeze=True,
-            gridspec_kw={"left": 0., "right": 1., "top": 0.95, "bottom": 0.})
+        # donut charts of current states on the left; trends on the right
+        self._fig, axes = pyplot.subplots(
+            num=1, figsize=(15, 9), dpi=100,
+            nrows=2, ncols=2, sharex=False, sharey=False, squeeze=True,
+            gridspec_kw={"left": 0., "right": 0.93, "top": 0.95, "bottom": 0.07,
+                         "wspace": 0.15, "hspace": 0.3})
+
+        [[self._ax_nodes, self._ax_node_history], [self._ax_tasks, self._ax_task_history]] = axes
+        self._ax_throughput = self._ax_task_history.twinx()
+
+        self._history = history if history is not None else StatusHistory()
+
+        # snapshots come from the reporter's shared poll loop or from the
+        # cache published by another process
+        if cache is None:
+            scheduler = reporter.get_scheduler(mission, max_interval=interval)
+            scheduler.subscribe(self._receive)
+            self._source = lambda: self._status
+        else:
+            self._source = cache.read
+
+        self._blit = blit and getattr(self._fig.canvas, "supports_blit", True)
 
-        # generator
-        generator = functools.partial(reporter.status_generator, mission)
+        if self._blit:
+            self._init_artists()
+            self._fig.canvas.mpl_connect("draw_event", self._on_draw)
 
-        # animation
-        ani = animation.FuncAnimation(
-            self._fig, self._animate, frames=generator, interval=interval*1000)
+        # check for a new snapshot every second; nothing is redrawn otherwise
+        self._timer = self._fig.canvas.new_timer(interval=1000)
+        self._timer.add_callback(self._tick)
+        self._timer.start()
 
         # pop up a window of animation
-        pyplot.show()
+        try:
+            pyplot.show()
+        finally:
+            self._timer.stop()
+
+            if cache is None:
+                scheduler.unsubscribe(self._receive)
 
         self._fig = self._ax_nodes = self._ax_tasks = None
+        self._ax_node_history = self._ax_task_history = self._ax_throughput = None
+        self._status = self._drawn = self._history = self._stale = None
+        self._source = self._timer = None
+        self._artists = self._animated = self._background = self._layout = None
+        self._t0 = self._limits = self._buffers = self._frame = None
+
+    def _receive(self, status):
+        """Keep the latest snapshot from the poll loop."""
+
+        self._status = status
+
+    def _tick(self):
+        """The function being called by the timer: draw a new snapshot."""
+
+        status = self._source()
+
+        if status is None:
+            return
+
+        self._update_stale(status)
+
+        # nothing new
+        if status is self._drawn:
+            return
+
+        self._drawn = status
+        self._history.append(status)
+
+        if self._blit:
+            self._update_artists(status)
+        else:
+            self._animate(status)
+            self._fig.canvas.draw_idle()
+
+    def _update_stale(self, status):
+        """Show or clear the warning about a cache nobody publishes to anymore.
+
+        Args:
+            status [in]: a snapshot read from a StatusCache; snapshots without
+                next_poll_time (e.g., polled by this process) are never stale.
+        """
+
+        stale = None
+
+        next_poll_time = status.get("next_poll_time")
+        if next_poll_time is not None and time.time() > next_poll_time + self.stale_margin:
+            stale = "Stale data: no update since {}; is the publishing process still running?".format(
+                datetime.datetime.fromtimestamp(status["published"]).replace(microsecond=0))
+
+        if stale == self._stale:
+            return
+
+        self._stale = stale
+        self._fig.suptitle("" if stale is None else stale, color="tab:red")
+
+        # the title is not blitted, so the figure is fully redrawn
+        self._fig.canvas.draw_idle()
 
     def _animate(self, status):
-        """The function being called by matplotlib for every frame.
+        """Rebuild all axes for a snapshot.
 
         Args:
-            status [in]: the dictionary returned by reporter's status_generator.
+            status [in]: the dictionary returned by reporter's get_status_snapshot.
         """
 
         self._update_ax_nodes(
@@ -101,6 +449,56 @@ class GraphicalMonitor():
         self._update_ax_tasks(
             status["timestamp"], status["job_status"], status["task_status"])
 
+        self._update_ax_history()
+
+    def _update_ax_history(self):
+        """Update the axes objects of node and task states over time."""
+
+        history = self._history
+        data = history.data
+        hours = (data[:, 0] - data[0, 0]) / 3600.
+        n_nodes = len(history.node_labels)
+
+        # stacked node states; only the states ever seen
+        ax = self._ax_node_history
+        ax.clear()
+
+        counts = data[:, 1:1+n_nodes]
+        seen = counts.any(axis=0)
+
+        if seen.any():
+            ax.stackplot(
+                hours, counts[:, seen].T,
+                labels=[label for label, s in zip(history.node_labels, seen) if s])
+            ax.legend(loc="upper left", fontsize="small")
+
+        ax.set_xlabel("Elapsed time (hours)")
+        ax.set_ylabel("Nodes")
+        ax.set_title("Node states over time")
+
+        # stacked task states
+        ax = self._ax_task_history
+        ax.clear()
+
+        ax.stackplot(hours, data[:, 1+n_nodes:].T, labels=history.task_labels)
+        ax.legend(loc="upper left", fontsize="small")
+        ax.set_xlabel("Elapsed time (hours)")
+        ax.set_ylabel("Tasks")
+
+        # throughput on the right axis
+        ax = self._ax_throughput
+        ax.clear()
+
+        throughput = history.throughput(data=data)
+        ax.plot(hours, throughput, "k--", label="throughput")
+        ax.yaxis.tick_right()
+        ax.yaxis.set_label_position("right")
+        ax.set_ylabel("Finished tasks per hour (dashed)")
+
+        eta = history.eta(data=data, throughput=throughput)
+        eta = "unknown" if numpy.isinf(eta) else str(datetime.timedelta(seconds=int(eta)))
+        self._ax_task_history.set_title("Task states over time; estimated time to completion: {}".format(eta))
+
     def _update_ax_nodes(self, timestring, pool_s, allocation_s, node_s):
         """Update the axes object of node information.
 
@@ -193,7 +591,7 @@ class GraphicalMonitor():
         wedges, _ = ax.pie(data, wedgeprops={"width": 0.5}, startangle=90)
 
         # the properties for the bounding box of an annotation
-        bbox_props = {"boxstyle": "square, pad=0.3", "fc": "w", "ec": "k", "lw": 0.72}
+        bbox_props = self._bbox_props
 
         # loop through all wedges and add an annotation to each of them
         for i, w in enumerate(wedges):
@@ -201,25 +599,7 @@ class GraphicalMonitor():
             if data[i] == 0:
                 continue
 
-            # the angle of the center line of the wedge
-            ang = (w.theta2 + w.theta1) / 2.
-
-            # the data point where the annotation refers to
-            # also the start of the connecting line
-            xy = (numpy.cos(numpy.deg2rad(ang)), numpy.sin(numpy.deg2rad(ang)))
-
-            # the location of the annotation box
-            # also the end of the connecting line
-            xytext = (1.05*numpy.sign(xy[0]), 1.05*xy[1])
-
-            # which side the text shoulf align to is based on if it's on left/right
-            ha = {-1: "right", 1: "left"}[int(numpy.sign(xy[0]))]
-
-            # properties of the connecting line
-            if (ang % 180) == 0:
-                connectionstyle = "arc3, rad=0"
-            else:
-                connectionstyle = "angle, angleA=0, angleB={}".format(ang)
+            xy, xytext, ha, connectionstyle = self._annotation_layout(w.theta1, w.theta2)
 
             ax.annotate(
                 texts[i], xy=xy, xytext=xytext, bbox=bbox_props, va="center", ha=ha,
@@ -233,11 +613,345 @@ class GraphicalMonitor():
         ax.set_title(title)
         ax.axis("off")
 
+    # the properties for the bounding box of an annotation
+    _bbox_props = {"boxstyle": "square, pad=0.3", "fc": "w", "ec": "k", "lw": 0.72}
+
+    @staticmethod
+    def _annotation_layout(theta1, theta2):
+        """Where the annotation of a donut wedge goes.
+
+        Args:
+            theta1, theta2 [in]: the start and end angles of the wedge (degrees).
+
+        Return:
+            The point the annotation refers to, the location of its text box,
+            the horizontal alignment of the text, and the connection style.
+        """
+
+        # the angle of the center line of the wedge
+        ang = (theta2 + theta1) / 2.
+
+        # the data point where the annotation refers to
+        # also the start of the connecting line
+        xy = (numpy.cos(numpy.deg2rad(ang)), numpy.sin(numpy.deg2rad(ang)))
+
+        # the location of the annotation box
+        # also the end of the connecting line
+        xytext = (1.05*numpy.sign(xy[0]), 1.05*xy[1])
+
+        # which side the text shoulf align to is based on if it's on left/right
+        ha = {-1: "right", 1: "left"}[int(numpy.sign(xy[0]))]
+
+        # properties of the connecting line
+        if (ang % 180) == 0:
+            connectionstyle = "arc3, rad=0"
+        else:
+            connectionstyle = "angle, angleA=0, angleB={}".format(ang)
+
+        return xy, xytext, ha, connectionstyle
+
+    def _init_artists(self):
+        """Create the artists of the blitted redraw once."""
+
+        self._artists = {}
+
+        # donut charts: a wedge and an annotation for every possible label
+        for key, ax, labels in [
+                ("nodes", self._ax_nodes, self._label_candidates),
+                ("tasks", self._ax_tasks, self._task_status_labels)]:
+
+            wedges, _ = ax.pie([1]*len(labels), wedgeprops={"width": 0.5}, startangle=90)
+
+            annotations = [
+                ax.annotate(
+                    "", xy=(0, 0), xytext=(0, 0), bbox=self._bbox_props, va="center",
+                    ha="left", arrowprops={"arrowstyle": "-"})
+                for _ in labels]
+
+            self._artists[key] = {
+                "wedges": wedges, "annotations": annotations,
+                "center": ax.annotate("", xy=(0, 0), xytext=(0, 0), va="center", ha="center"),
+                "stamp": ax.text(0, -1.15, "", va="center", ha="center")}
+
+            ax.set_ylim(-1.2, 1.4)
+            ax.set_xlim(-2.0, 2.0)
+            ax.axis("off")
+
+        self._ax_nodes.set_title("Node status")
+        self._ax_tasks.set_title("Task status")
+        self._ax_tasks.legend(
+            self._artists["tasks"]["wedges"], self._task_status_labels,
+            ncol=len(self._task_status_labels), loc=9, bbox_to_anchor=(0.5, 1.0))
+
+        # time series: a stacked band for every state
+        colors = pyplot.rcParams["axes.prop_cycle"].by_key()["color"]
+
+        for key, ax, labels, ylabel, title in [
+                ("node_history", self._ax_node_history, StatusHistory.node_labels,
+                 "Nodes", "Node states over time"),
+                ("task_history", self._ax_task_history, StatusHistory.task_labels,
+                 "Tasks", "Task states over time")]:
+
+            self._artists[key] = [
+                ax.fill_between([0, 0], 0, 0, color=colors[i % len(colors)], linewidth=0, label=label)
+                for i, label in enumerate(labels)]
+
+            ax.set_xlabel("Elapsed time (hours)")
+            ax.set_ylabel(ylabel)
+            ax.set_title(title)
+
+        self._ax_task_history.legend(loc="upper left", fontsize="small")
+
+        self._artists["throughput"], = self._ax_throughput.plot([], [], "k--")
+        self._ax_throughput.set_ylabel("Finished tasks per hour (dashed)")
+
+        self._artists["eta"] = self._ax_task_history.text(
+            0.98, 0.95, "", transform=self._ax_task_history.transAxes, ha="right", va="top")
+
+        self._animated = []
+        for key in ["nodes", "tasks"]:
+            self._animated += self._artists[key]["wedges"]
+            self._animated += self._artists[key]["annotations"]
+            self._animated += [self._artists[key]["center"], self._artists[key]["stamp"]]
+
+        self._animated += self._artists["node_history"] + self._artists["task_history"]
+        self._animated += [self._artists["throughput"], self._artists["eta"]]
+
+        for artist in self._animated:
+            artist.set_animated(True)
+
+        # axis limits of the time series only grow, so they rarely need a full redraw
+        self._t0 = None
+        self._limits = {"hours": (0., 0.25), "nodes": 1., "tasks": 1., "throughput": 1.}
+        self._layout = self._background = None
+
+        # buffers reused by every frame: the history rows, the elapsed hours,
+        # the stacked counts, and the vertices of each band (the top edge
+        # forward, then the bottom edge backward)
+        capacity = self._history.capacity
+        self._buffers = {
+            "data": numpy.empty((capacity, len(self._history.columns))),
+            "hours": numpy.empty(capacity),
+            "node_history": numpy.empty((capacity, len(StatusHistory.node_labels))),
+            "task_history": numpy.empty((capacity, len(StatusHistory.task_labels)))}
+
+        for key in ["node_history", "task_history"]:
+            self._buffers[key+":verts"] = [
+                numpy.empty((2*capacity, 2)) for _ in self._artists[key]]
+
+    def _on_draw(self, event):
+        """Save the background after a full draw and draw the artists over it."""
+
+        self._background = self._fig.canvas.copy_from_bbox(self._fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        """Draw the artists of the blitted redraw."""
+
+        for artist in self._animated:
+            self._fig.draw_artist(artist)
+
+    def _update_artists(self, status):
+        """Update the artists of the blitted redraw in place and redraw them.
+
+        A full redraw only happens when a static part, i.e., a legend or an
+        axis limit, has to change.
+
+        Args:
+            status [in]: the dictionary returned by reporter's get_status_snapshot.
+        """
+
+        node_s = status["node_status"]
+        node_counts = [node_s[label] for label in self._label_candidates]
+
+        if status["pool_status"] == "N/A":
+            center_text = "Not available"
+        else:
+            center_text = "Pool: {}\nAllocation: {}\nTotal nodes: {}".format(
+                status["pool_status"], status["allocation_status"], sum(node_counts))
+
+        self._update_donut(
+            self._artists["nodes"], self._label_candidates, node_counts,
+            center_text, status["timestamp"])
+
+        task_counts = [status["task_status"][label] for label in self._task_status_labels]
+
+        if status["job_status"] == "N/A":
+            center_text = "Not available"
+        else:
+            center_text = "Total: {}".format(sum(task_counts))
+
+        self._update_donut(
+            self._artists["tasks"], self._task_status_labels, task_counts,
+            center_text, status["timestamp"])
+
+        self._update_series()
+
+        # the static parts: node labels in the legends and the axis limits
+        node_labels = tuple(
+            label for label, count in zip(self._label_candidates, node_counts) if count > 0)
+
+        seen = tuple(self._frame[:, 1:1+len(StatusHistory.node_labels)].any(axis=0))
+
+        layout = (node_labels, seen, tuple(sorted(self._limits.items())))
+
+        if layout != self._layout or self._background is None:
+            self._layout = layout
+            self._update_static(node_labels, seen)
+
+            # the draw event saves the new background and draws the artists
+            self._fig.canvas.draw_idle()
+            return
+
+        self._fig.canvas.restore_region(self._background)
+        self._draw_animated()
+        self._fig.canvas.blit(self._fig.bbox)
+
+    def _update_donut(self, artists, labels, counts, center_text, timestring):
+        """Update the wedges and texts of a donut chart in place.
+
+        Args:
+            artists [in]: the dict of the donut's artists from _init_artists.
+            labels [in]: labels of the counts.
+            counts [in]: the count of each label.
+            center_text [in]: text in the center blank area of the donut chart.
+            timestring [in]: timestamp of when the status data was obtained.
+        """
+
+        total = sum(counts)
+        theta1 = 90.
+
+        for wedge, annotation, label, count in zip(
+                artists["wedges"], artists["annotations"], labels, counts):
+
+            if count == 0:
+                wedge.set_visible(False)
+                annotation.set_visible(False)
+                continue
+
+            theta2 = theta1 + 360. * count / total
+
+            wedge.set_theta1(theta1)
+            wedge.set_theta2(theta2)
+            wedge.set_visible(True)
+
+            xy, xytext, ha, connectionstyle = self._annotation_layout(theta1, theta2)
+
+            annotation.set_text("{}: {}".format(label, count))
+            annotation.xy = xy
+            annotation.set_position(xytext)
+            annotation.set_horizontalalignment(ha)
+            annotation.arrow_patch.set_connectionstyle(connectionstyle)
+            annotation.set_visible(True)
+
+            theta1 = theta2
+
+        if total == 0 and center_text != "Not available":
+            center_text += "\nNo data available"
+
+        artists["center"].set_text(center_text)
+        artists["stamp"].set_text("at {}".format(timestring))
+
+    def _update_series(self):
+        """Update the time series artists in place and grow the axis limits.
+
+        The history is fetched once per frame into preallocated buffers, and
+        the bands' vertices are written into buffers reused between frames.
+        """
+
+        history = self._history
+        buffers = self._buffers
+
+        data = self._frame = history.copy_to(buffers["data"])
+        n = data.shape[0]
+
+        if self._t0 is None:
+            self._t0 = data[0, 0]
+
+        hours = buffers["hours"][:n]
+        numpy.subtract(data[:, 0], self._t0, out=hours)
+        hours /= 3600.
+
+        totals = {}
+        begin = 1
+        for key, labels in [("node_history", history.node_labels), ("task_history", history.task_labels)]:
+
+            # stacked bands: each one spans from the top of the previous one
+            upper = buffers[key][:n]
+            numpy.cumsum(data[:, begin:begin+len(labels)], axis=1, out=upper)
+            begin += len(labels)
+
+            for i, (band, verts) in enumerate(zip(self._artists[key], buffers[key+":verts"])):
+                verts = verts[:2*n]
+                verts[:n, 0] = hours
+                verts[:n, 1] = upper[:, i]
+                verts[n:, 0] = hours[::-1]
+                verts[n:, 1] = upper[::-1, i-1] if i > 0 else 0.
+                band.set_verts([verts])
+
+            totals[key] = upper[:, -1].max()
+
+        throughput = history.throughput(data=data)
+        self._artists["throughput"].set_data(hours, throughput)
+
+        eta = history.eta(data=data, throughput=throughput)
+        eta = "unknown" if numpy.isinf(eta) else str(datetime.timedelta(seconds=int(eta)))
+        self._artists["eta"].set_text("Estimated time to completion: {}".format(eta))
+
+        # grow the limits with some room, so they do not change every frame
+        if hours[-1] > self._limits["hours"][1]:
+            self._limits["hours"] = (hours[0], hours[0] + 1.5 * (hours[-1] - hours[0]))
+
+        for key, value in [
+                ("nodes", totals["node_history"]), ("tasks", totals["task_history"]),
+                ("throughput", numpy.nanmax(throughput) if numpy.isfinite(throughput).any() else 0.)]:
+            if value > self._limits[key]:
+                self._limits[key] = 1.25 * value
+
+    def _update_static(self, node_labels, seen):
+        """Update the legends and axis limits around the blitted artists.
+
+        Args:
+            node_labels [in]: labels of nodes shown in the node donut chart.
+            seen [in]: whether each node state in StatusHistory.node_labels has
+                ever been seen.
+        """
+
+        # the legend of node donut chart only lists the current states
+        legend = self._ax_nodes.get_legend()
+        if legend is not None:
+            legend.remove()
+
+        if node_labels:
+            wedges = [
+                w for w, label in zip(self._artists["nodes"]["wedges"], self._label_candidates)
+                if label in node_labels]
+            self._ax_nodes.legend(
+                wedges, node_labels, ncol=len(node_labels), loc=9, bbox_to_anchor=(0.5, 1.0))
+
+        # the legend of node history lists the states ever seen
+        legend = self._ax_node_history.get_legend()
+        if legend is not None:
+            legend.remove()
+
+        if any(seen):
+            bands = [band for band, s in zip(self._artists["node_history"], seen) if s]
+            self._ax_node_history.legend(
+                bands, [band.get_label() for band in bands], loc="upper left", fontsize="small")
+
+        for ax in [self._ax_node_history, self._ax_task_history]:
+            ax.set_xlim(*self._limits["hours"])
+
+        self._ax_node_history.set_ylim(0, self._limits["nodes"])
+        self._ax_task_history.set_ylim(0, self._limits["tasks"])
+        self._ax_throughput.set_ylim(0, self._limits["throughput"])
+
 if __name__ == "__main__":
     import argparse
+    import getpass
     from user_credential import UserCredential
     from mission_info import MissionInfo
-    from mission_status_reporter import MissionStatusReporter
+    from mission_status_reporter import MissionStatusReporter, StatusCache
 
     parser = argparse.ArgumentParser(
         description="Graphical monitor of Azure batch pool and job")
@@ -247,29 +961,48 @@ if __name__ == "__main__":
         help="Name of the miission.")
 
     parser.add_argument(
-        "credential", metavar="credential-file", action="store", type=str,
-        help="An encrpyted file of Azure Batch and Storage credentials.")
+        "--cache", metavar="cache-file", action="store", type=str, default=None,
+        help="A status cache file published by another process. No Azure requests "
+             "are made by this monitor.")
+
+    parser.add_argument(
+        "--credential", metavar="credential-file", action="store", type=str, default=None,
+        help="An encrpyted file of Azure Batch and Storage credentials, used to poll "
+             "Azure directly when no cache is given. The passcode is prompted.")
+
+    parser.add_argument(
+        "--interval", metavar="seconds", action="store", type=int, default=120,
+        help="Max seconds between status updates. (default: %(default)s)")
 
     parser.add_argument(
-        "passcode", metavar="passcode", action="store", type=str,
-        help="Passcode to decode credential file.")
+        "--no-blit", dest="blit", action="store_false",
+        help="Rebuild the charts for every update instead of blitting.")
 
     parser.add_argument(
-        "--interval", metavar="seconds", action="store", type=int, default=30,
-        help="Seconds between status updates. (default: %(default)s)")
+        "--log", metavar="log-file", action="store", type=str, default=None,
+        help="A binary log of status history; existing history is loaded, and new "
+             "snapshots are appended.")
 
     args = parser.parse_args()
 
+    if args.cache is None and args.credential is None:
+        parser.error("either --cache or --credential is required")
+
     # dummy MissionInfo object (only providing the name of the mission)
     info = MissionInfo(args.missionname)
 
-    # UserCredential object
-    cred = UserCredential()
-    cred.read_encrypted(args.passcode, args.credential)
-
-    # MissionStatusReporter
-    reporter = MissionStatusReporter(cred)
-
     # GraphicalMonitor
     monitor = GraphicalMonitor()
-    monitor(info, reporter, args.interval)
+    history = StatusHistory(log_file=args.log)
+
+    if args.cache is not None:
+        monitor(info, interval=args.interval, cache=StatusCache(args.cache), history=history, blit=args.blit)
+    else:
+        # UserCredential object
+        cred = UserCredential()
+        cred.read_encrypted(getpass.getpass("Passcode: "), args.credential)
+
+        # MissionStatusReporter
+        reporter = MissionStatusReporter(cred)
+
+        monitor(info, reporter, args.interval, history=history, blit=args.blit)
@@ -37,6 +37,9 @@
 A function to report download/upload progress.
 """
 import re
+import gzip
+import tarfile
+import hashlib
 
 
 def reporthook(prefix, output, current, total):
@@ -78,3 +81,69 @@ def path_ignored(filepath, ignore_patterns):
             return True
 
     return False
+
+def file_sha256(filepath, chunk_size=1048576):
+    """Calculate the SHA-256 hex digest of the content of a file.
+
+    Args:
+        filepath [in]: the path of a file.
+        chunk_size [in]: the number of bytes read each time.
+    """
+
+    assert isinstance(filepath, str), "Type error!"
+
+    sha = hashlib.sha256()
+
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+def write_tarball(tarpath, members, compression="gzip", level=None):
+    """Pack files into a compressed tarball.
+
+    Owners, permissions, and modified times of the members (and the time in
+    the gzip header) are normalized, so the same file contents always give the
+    same archive content.
+
+    Args:
+        tarpath [in]: the path of the output tarball.
+        members [in]: a list of (name in the archive, path of the file).
+        compression [in]: either "gzip" or "zstd" (requires zstandard).
+        level [in]: compression level; None to use the default.
+    """
+
+    assert isinstance(tarpath, str), "Type error!"
+    assert isinstance(members, list), "Type error!"
+    assert compression in ["gzip", "zstd"], \
+        "Unsupported compression: {}".format(compression)
+
+    def _normalize(tarinfo):
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = ""
+        tarinfo.mode = 0o755 if tarinfo.mode & 0o100 else 0o644
+        tarinfo.mtime = 0
+        return tarinfo
+
+    if compression == "gzip":
+        level = 6 if level is None else level
+        with gzip.GzipFile(tarpath, "wb", compresslevel=level, mtime=0) as fileobj:
+            with tarfile.open(fileobj=fileobj, mode="w") as tar:
+                for arcname, filepath in members:
+                    tar.add(filepath, arcname, recursive=False, filter=_normalize)
+        return
+
+    try:
+        import zstandard
+    except ImportError as err:
+        raise ImportError(
+            "zstd bundles require the zstandard package.") from err
+
+    level = 10 if level is None else level
+    with open(tarpath, "wb") as fileobj:
+        compressor = zstandard.ZstdCompressor(level=level)
+        with compressor.stream_writer(fileobj, closefd=False) as writer:
+            with tarfile.open(fileobj=writer, mode="w|") as tar:
+                for arcname, filepath in members:
+                    tar.add(filepath, arcname, recursive=False, filter=_normalize)
@@ -44,7 +44,10 @@ import logging
 from .user_credential import UserCredential
 from .mission_info import MissionInfo
 from .mission_controller import MissionController
+from .case_pipeline import CasePipeline
 from .mission_status_reporter import MissionStatusReporter
+from .task_tracker import TaskTracker
+from .worker_pool import WorkerPool
 
 
 class Mission:
@@ -59,6 +62,10 @@ class Mission:
         self.credential = None # Azure credential
         self.controller = None # resource controller
         self.reporter = None # status reporter
+        self.tracker = None # task state tracker
+
+        self._monitors = [] # processes of graphical monitors
+        self._status_publisher = None # callback publishing status to monitors
 
     def __del__(self):
         """Destructor."""
@@ -129,7 +136,7 @@ class Mission:
 
         self.logger.info("Mission instance write succeeded.")
 
-    def setup_communication(self, cred_file=None, cred_pass=None, cred=None):
+    def setup_communication(self, cred_file=None, cred_pass=None, cred=None, max_workers=8):
         """Setup communication between local and Azure.
 
         Can provide either cred_file + cred_pass or cred.
@@ -138,6 +145,7 @@ class Mission:
             cred_file [in]: encrypted file containing credential.
             cred_pass [in]: passcode to decrypt the file.
             cred [in]: an UserCredential instance.
+            max_workers [in]: number of concurrent file transfers. (default: 8)
         """
 
         if cred is None:
@@ -152,8 +160,9 @@ class Mission:
 
             self.credential = cred
 
-        self.controller = MissionController(self.credential)
+        self.controller = MissionController(self.credential, max_workers)
         self.reporter = MissionStatusReporter(self.credential)
+        self.tracker = TaskTracker(self.controller.batch_client)
 
         self.logger.info("Local-Azure communication setup succeeded.")
 
@@ -210,38 +219,242 @@ class Mission:
 
         logging.info("Resources of the mission %s deleted.", self.info.name)
 
-    def add_task(self, casename, casepath, ignore_exist=True):
+    def add_task(self, casename, casepath, ignore_exist=True, bundle=None,
+                 dedup=False, memoize=False):
         """Add additional task to the task scheduler."""
 
         self.logger.debug("Adding {}".format(casename))
-        self.controller.add_task(self.info, casename, casepath, ignore_exist)
+        self.controller.add_task(
+            self.info, casename, casepath, ignore_exist, bundle, dedup, memoize)
         self.logger.debug("Done adding {}".format(casename))
 
+    def add_tasks(self, cases, ignore_exist=True, bundle=None, dedup=False,
+                  memoize=False):
+        """Add many tasks to the task scheduler in bulk.
+
+        Args:
+            cases [in]: a dict of {casename: casepath}.
+            ignore_exist [in]: skip adding a task if already exists.
+            bundle [in]: None, "gzip", or "zstd"; upload each case as files or
+                as one compressed tarball.
+            dedup [in]: upload files to a content-addressed store shared by
+                all cases, so identical files are only uploaded once.
+            memoize [in]: copy the stored results of cases whose inputs are
+                unchanged since a completed run (of any mission) instead of
+                running them again.
+
+        Return:
+            A list of case names submitted.
+        """
+
+        self.logger.debug("Adding {} tasks".format(len(cases)))
+        submitted = self.controller.add_tasks(
+            self.info, cases, ignore_exist, bundle=bundle, dedup=dedup,
+            memoize=memoize)
+        self.logger.debug("Done adding {} tasks".format(len(submitted)))
+
+        return submitted
+
+    def upload_shared_topo(self, filepath):
+        """Upload a tiled base topography shared by all cases."""
+
+        self.logger.debug("Uploading shared topography {}".format(filepath))
+        self.controller.upload_shared_topo(self.info, filepath)
+        self.logger.debug("Done uploading shared topography {}".format(filepath))
+
+    def upload_mission_params(self, filepath):
+        """Upload the mission-wide parameter script shared by all cases."""
+
+        self.logger.debug("Uploading mission parameters {}".format(filepath))
+        self.controller.upload_mission_params(self.info, filepath)
+        self.logger.debug("Done uploading mission parameters {}".format(filepath))
+
+    def record_results(self):
+        """Index the results of succeeded cases for later missions to reuse."""
+
+        self.logger.debug("Recording results of {}".format(self.info.name))
+        n_cases = self.controller.record_results(self.info)
+        self.logger.debug("Done recording results of {} cases".format(n_cases))
+
+        return n_cases
+
+    def start_pipeline(self, ignore_exist=True, n_uploaders=4, max_queued=64,
+                       batch_size=100, batch_wait=10., bundle=None,
+                       dedup=False):
+        """Start a pipeline that uploads and submits cases as they are prepared.
+
+        Args:
+            ignore_exist [in]: skip adding a task if already exists.
+            n_uploaders [in]: number of cases uploaded concurrently.
+            max_queued [in]: maximum number of cases waiting in each queue.
+            batch_size [in]: maximum number of tasks submitted in one request.
+            batch_wait [in]: maximum seconds an uploaded case waits for others.
+            bundle [in]: None, "gzip", or "zstd"; see add_tasks.
+            dedup [in]: use the content-addressed store; see add_tasks.
+
+        Return:
+            A started CasePipeline object. Use its put() to add cases and its
+            close() to wait for all cases.
+        """
+
+        pipeline = CasePipeline(
+            self.controller, self.info, ignore_exist, n_uploaders, max_queued,
+            batch_size, batch_wait, bundle, dedup)
+        pipeline.start()
+
+        return pipeline
+
+    def update_task_states(self):
+        """Update the states of tasks changed since the last update.
+
+        Return:
+            A list of the names of cases whose states changed.
+        """
+
+        self.logger.debug("Updating task states")
+        changed = self.tracker.poll(self.info)
+        self.logger.debug("Done updating states of {} tasks".format(len(changed)))
+
+        return changed
+
     def get_monitor_string(self):
         """Get a string for outputing."""
 
         return self.reporter.get_overview_string(self.info)
 
-    def monitor_and_terminate(self):
-        """Print status until all tasks are done and terminate mission."""
-        import time
+    def monitor_and_terminate(
+            self, harvest=False, syncmode=True, ignore_raw_data=True,
+            ignore_figures=True, ignore_rasters=True, n_downloaders=2,
+            max_poll_failures=5):
+        """Print status until all tasks are done and terminate mission.
+
+        With harvest, each case is downloaded as soon as its task completes,
+        while the other tasks are still running, so results are on the local
+        machine shortly after the last task finishes. Cases already completed
+        when monitoring starts (including memoized ones, which have no task)
+        are downloaded first.
+
+        Args:
+            harvest [in]: download cases as they complete.
+            syncmode, ignore_raw_data, ignore_figures, ignore_rasters [in]:
+                see download_case.
+            n_downloaders [in]: number of cases downloaded concurrently.
+            max_poll_failures [in]: raise the last polling error after this
+                many consecutive failed polls.
+        """
+        import queue
         import datetime
 
+        ignore_patterns = self._download_ignore_patterns(
+            ignore_raw_data, ignore_figures, ignore_rasters)
+
+        downloads = WorkerPool(n_downloaders, 1000000) if harvest else None
+
+        def report_downloads(block):
+            for casename, _, error in downloads.iter_results(block):
+                if error is None:
+                    print("{}: downloaded".format(casename))
+                else:
+                    self.logger.error("Failed downloading {}: {}".format(casename, error))
+                    print("{}: failed downloading: {}".format(casename, error))
+
+        harvested = set()
+
+        def harvest_case(casename):
+            if casename in harvested:
+                return
+            harvested.add(casename)
+            downloads.submit(
+                casename, self.controller.download_cloud_dir,
+                self.info, casename, self.info.tasks[casename]["path"], syncmode,
+                ignore_patterns)
+
+        # completed before monitoring started (e.g., memoized or a restarted monitor)
+        if harvest:
+            for casename, task in self.info.tasks.items():
+                if task.get("completed"):
+                    harvest_case(casename)
+
+        # status snapshots from the reporter's shared, adaptive poll loop
+        scheduler = self.reporter.get_scheduler(self.info)
+        snapshots = queue.Queue()
+        scheduler.subscribe(snapshots.put)
+
+        task_status = None
         keep_running = True
 
-        while keep_running:
+        try:
+            while keep_running:
+
+                try:
+                    snapshot = snapshots.get(timeout=2*scheduler.max_interval)
+                except queue.Empty:
+                    if scheduler.consecutive_failures >= max_poll_failures:
+                        raise RuntimeError(
+                            "Polling status failed {} times in a row.".format(
+                                scheduler.consecutive_failures)) from scheduler.last_error
+                    continue
+
+                print()
+                print(datetime.datetime.now().replace(microsecond=0))
+                print(self.reporter.get_overview_string(self.info, snapshot))
+                print("Next update at {}".format(
+                    datetime.datetime.fromtimestamp(scheduler.next_poll_time).replace(microsecond=0)))
+
+                # task states only need listing when the task counts changed
+                if snapshot["task_status"] != task_status:
+                    task_status = snapshot["task_status"]
+
+                    for casename in self.update_task_states():
+                        task = self.info.tasks[casename]
+                        if not task["completed"]:
+                            continue
+
+                        print("{}: {} (exit code {})".format(
+                            casename, "succeeded" if task["succeeded"] else "failed",
+                            task["exit_code"]))
+
+                        # failed cases are also downloaded for their logs
+                        if harvest:
+                            harvest_case(casename)
+
+                if harvest:
+                    report_downloads(False)
+
+                if task_status["active"]+task_status["running"] == 0:
+                    keep_running = False
+
+            if harvest:
+                # tasks completed after the last poll
+                for casename in self.update_task_states():
+                    if self.info.tasks[casename]["completed"]:
+                        harvest_case(casename)
+
+                report_downloads(True)
+        finally:
+            scheduler.unsubscribe(snapshots.put)
+
+            if harvest:
+                downloads.shutdown()
+
+        print("All tasks done.")
 
-            print()
-            print(datetime.datetime.now().replace(microsecond=0))
-            print(self.get_monitor_string())
+    @staticmethod
+    def _download_ignore_patterns(ignore_raw_data, ignore_figures, ignore_rasters):
+        """The ignore patterns of downloads; see download_case."""
 
-            time.sleep(30)
+        ignore_patterns = ["__pycache__"]
 
-            _, status = self.reporter.get_job_status(self.info)
-            if status["active"]+status["running"] == 0:
-                keep_running = False
+        if ignore_raw_data:
+            ignore_patterns += [".*?\.data", "fort\..*?"]
 
-        print("All tasks done.")
+        if ignore_figures:
+            ignore_patterns += ["_plots"]
+
+        if ignore_rasters:
+            ignore_patterns += [".*?\.asc", ".*?\.prj"]
+
+        return ignore_patterns
 
     def download_case(
             self, casename, syncmode=True, ignore_raw_data=True, ignore_figures=True,
@@ -256,16 +469,8 @@ class Mission:
             ignore_rasters [in]: ignore raster files (default: True)
         """
 
-        ignore_patterns = ["__pycache__"]
-
-        if ignore_raw_data:
-            ignore_patterns += [".*?\.data", "fort\..*?"]
-
-        if ignore_figures:
-            ignore_patterns += ["_plots"]
-
-        if ignore_rasters:
-            ignore_patterns += [".*?\.asc", ".*?\.prj"]
+        ignore_patterns = self._download_ignore_patterns(
+            ignore_raw_data, ignore_figures, ignore_rasters)
 
         try:
             self.controller.download_cloud_dir(
@@ -289,27 +494,50 @@ class Mission:
             ignore_rasters [in]: ignore raster files (default: True)
         """
 
-        ignore_patterns = ["__pycache__"]
+        ignore_patterns = self._download_ignore_patterns(
+            ignore_raw_data, ignore_figures, ignore_rasters)
 
-        if ignore_raw_data:
-            ignore_patterns += [".*?\.data", "fort\..*?"]
+        # all cases share one pool of download workers
+        dirs = {casename: values["path"] for casename, values in self.info.tasks.items()}
+        self.controller.download_cloud_dirs(self.info, dirs, syncmode, ignore_patterns)
 
-        if ignore_figures:
-            ignore_patterns += ["_plots"]
+    def get_graphical_monitor(self, interval=120, history_log=None):
+        """Get a graphical monitor.
 
-        if ignore_rasters:
-            ignore_patterns += [".*?\.asc", ".*?\.prj"]
+        The monitor runs in another process and reads the snapshots this
+        mission's reporter publishes to a status cache file in the working
+        directory, so it neither needs the credential nor polls Azure itself.
+        Publishing stops once all monitors launched this way are closed.
 
-        for casename, values in self.info.tasks.items():
-            self.controller.download_cloud_dir(
-                self.info, casename, values["path"], syncmode, ignore_patterns)
+        Polling runs in a background thread of this process, so the calling
+        process must stay alive while the monitors are open. Otherwise the
+        monitors keep showing the last snapshot and flag it as stale.
 
-    def get_graphical_monitor(self, cred_file, cred_pass):
-        """Get a graphical monitor."""
+        Args:
+            interval [in]: max interval to update status (in seconds).
+            history_log [in]: path to a binary log of the status history shown
+                by the monitor; see StatusHistory. (default: no log)
+        """
         import subprocess
 
         this_file = os.path.abspath(__file__)
         exec_file = os.path.join(os.path.dirname(this_file), "graphical_monitor.py")
+        cache_file = os.path.join(self.info.wd, "status_cache.json")
+
+        self._monitors = [p for p in self._monitors if p.poll() is None]
+        args = ["python", exec_file, self.info.name, "--cache", cache_file]
+
+        if history_log is not None:
+            args += ["--log", history_log]
+
+        self._monitors.append(subprocess.Popen(args))
+
+        # one publisher serves all monitors; replace a finishing one
+        old = self._status_publisher
+
+        self._status_publisher = self.reporter.publish_status(
+            self.info, cache_file, max_interval=interval,
+            until=lambda: all(p.poll() is not None for p in self._monitors))
 
-        subprocess.Popen([
-            "python", exec_file, self.info.name, cred_file, cred_pass])
+        if old is not None:
+            self.reporter.get_scheduler(self.info).unsubscribe(old)
@@ -43,22 +43,38 @@ import time
 import datetime
 import logging
 import base64
+import hashlib
+import tempfile
+import threading
 import azure.batch.models
 import azure.storage.blob
 import azure.common
+import azure.cosmosdb.table.tablebatch
 from .user_credential import UserCredential
 from .mission_info import MissionInfo
 from .misc import path_ignored
+from .misc import file_sha256
+from .misc import write_tarball
+from .worker_pool import WorkerPool
+from .sync_manifest import SyncManifest
+from ..rastertools import tiled_raster
+from ..rastertools import esri_ascii
 
 
 class MissionController():
     """MissionController"""
 
-    def __init__(self, credential):
+    def __init__(self, credential, max_workers=8, shared_table=True):
         """__init__
 
+        Synchronization decisions are made with a local manifest (see
+        SyncManifest). When shared_table is True, the records of transfers are
+        also written to the mission's table, so other machines can use them.
+
         Args:
             credential [in]: An instance of UserCredential.
+            max_workers [in]: default number of concurrent file transfers.
+            shared_table [in]: whether to keep records in the mission's table.
         """
 
         # logger
@@ -66,6 +82,31 @@ class MissionController():
         self.logger.debug("Creating a MissionController instance.")
 
         assert isinstance(credential, UserCredential), "Type error!"
+        assert isinstance(max_workers, int), "Type error!"
+
+        assert isinstance(shared_table, bool), "Type error!"
+
+        # the default size of worker pools used in directory transfers
+        self.max_workers = max_workers
+
+        # local sync manifests (one per mission) and the optional shared table
+        self.shared_table = shared_table
+        self._manifests = {}
+        self._manifest_lock = threading.Lock()
+
+        # table records waiting to be written in batches (one dict per table)
+        self._table_buffers = {}
+        self._table_lock = threading.Lock()
+
+        # content hashes in each container's shared input store, the uploads
+        # in progress, and the shared files of each case (see upload_case_shared)
+        self._shared_blobs = {}
+        self._shared_uploads = {}
+        self._shared_indexes = {}
+        self._shared_topos = {}
+        self._shared_params = {}
+        self._shared_hashes = {}
+        self._shared_lock = threading.Lock()
 
         # Batch and Storage service clients
         self.batch_client = credential.create_batch_client()
@@ -160,6 +201,18 @@ class MissionController():
         self.table_client.delete_table(mission.table_name)
         self.logger.info("Done deleting aux table for %s", mission.container_name)
 
+        # the local sync records are no longer valid
+        self.get_manifest(mission).clear()
+
+        with self._shared_lock:
+            self._shared_blobs.pop(mission.container_name, None)
+            self._shared_topos.pop(mission.container_name, None)
+            self._shared_params.pop(mission.container_name, None)
+            for key in [k for k in self._shared_hashes if k[0] == mission.container_name]:
+                del self._shared_hashes[key]
+            for key in [k for k in self._shared_indexes if k[0] == mission.container_name]:
+                del self._shared_indexes[key]
+
     def get_storage_container_access_tokens(self, mission):
         """Get container URL and SAS token.
 
@@ -416,6 +469,26 @@ class MissionController():
         assert isinstance(blobpath, str), "Type error!"
         assert isinstance(filepath, str), "Type error!"
 
+        # dealing with cloud file
+        entity = self._get_table_entity(mission, blobpath)
+        blob_props = self._get_blob_properties(mission, blobpath)
+
+        return self._compare_mtime(mission, blobpath, filepath, entity, blob_props)
+
+    def _compare_mtime(self, mission, blobpath, filepath, entity, blob_props):
+        """Compare timestamps using a table record and the blob's properties.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            blobpath [in]: relative path to the Blob root on Azure.
+            filename [in]: path to the file on a local machine.
+            entity [in]: the blob's record in the table; None if not exists.
+            blob_props [in]: the blob's properties; None if not exists.
+
+        Return:
+            The same as compare_timestamp.
+        """
+
         local_mtime = datetime.datetime(
             datetime.MINYEAR, 1, 1, tzinfo=datetime.timezone.utc)
         cloud_mtime = datetime.datetime(
@@ -427,20 +500,6 @@ class MissionController():
                 os.path.getmtime(filepath)).replace(
                     microsecond=0, tzinfo=datetime.timezone.utc)
 
-        # dealing with cloud file
-        blobkey = base64.urlsafe_b64encode(blobpath.encode()).decode()
-        try:
-            entity = self.table_client.get_entity(
-                mission.table_name, "blobfiles", blobkey)
-        except azure.common.AzureMissingResourceHttpError:
-            entity = None
-
-        try:
-            blob_props = self.storage_client.get_blob_properties(
-                mission.container_name, blobpath).properties
-        except azure.common.AzureMissingResourceHttpError:
-            blob_props = None
-
         # error case
         if entity is not None and blob_props is None:
             raise RuntimeError(
@@ -478,13 +537,164 @@ class MissionController():
         # else cloud_mtime > local_mtime
         return 2
 
-    def update_table_record(self, mission, blobpath, filepath):
+    def _get_blob_properties(self, mission, blobpath):
+        """Get the properties of a blob; None if the blob does not exist."""
+
+        try:
+            return self.storage_client.get_blob_properties(
+                mission.container_name, blobpath).properties
+        except azure.common.AzureMissingResourceHttpError:
+            return None
+
+    def _get_table_entity(self, mission, blobpath):
+        """Get the record of a blob in the table; None if not exists."""
+
+        blobkey = base64.urlsafe_b64encode(blobpath.encode()).decode()
+        try:
+            return self.table_client.get_entity(
+                mission.table_name, "blobfiles", blobkey)
+        except azure.common.AzureMissingResourceHttpError:
+            return None
+
+    def get_manifest(self, mission):
+        """Get the local sync manifest of a mission.
+
+        The manifest is opened once and cached by this controller.
+
+        Args:
+            mission [in]: an MissionInfo object.
+
+        Return:
+            A SyncManifest object.
+        """
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+
+        with self._manifest_lock:
+            if mission.manifest_file not in self._manifests:
+                self._manifests[mission.manifest_file] = \
+                    SyncManifest(mission.manifest_file)
+
+        return self._manifests[mission.manifest_file]
+
+    def _sync_code(self, mission, blobpath, filepath, blob_props, local_stat=None,
+                   entities=None):
+        """Decide the direction of synchronization of a file and a blob.
+
+        The local sync manifest is consulted first. Only when it has no record
+        of the pair, the shared table record (if enabled) is used.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            blobpath [in]: relative path to the Blob root on Azure.
+            filepath [in]: path to the file on a local machine.
+            blob_props [in]: the blob's properties; None if not exists.
+            local_stat [optional]: os.stat_result of the local file if known.
+            entities [optional]: table records from load_table_records. If
+                None, the record is requested from the table when needed.
+
+        Return:
+            The same as compare_timestamp.
+        """
+
+        code = self.get_manifest(mission).compare(
+            blobpath, filepath, blob_props, local_stat)
+
+        if code is None:
+            entity = None
+            if entities is not None:
+                entity = entities.get(blobpath)
+            elif self.shared_table:
+                entity = self._get_table_entity(mission, blobpath)
+            code = self._compare_mtime(mission, blobpath, filepath, entity, blob_props)
+
+        return code
+
+    def load_table_records(self, mission, dirblobname):
+        """Read the table records of all blobs under a folder in one query.
+
+        RowKeys are base64-encoded blob paths, so the query covers the RowKey
+        range sharing the encoded prefix, and the results are filtered locally.
+        The query is paginated by the Azure SDK.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            dirblobname [in]: the blobpath relative to the container's root path.
+
+        Return:
+            A dict of {blobpath: entity}.
+        """
+
+        self.logger.debug("Loading table records of %s", dirblobname)
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+        assert isinstance(dirblobname, str), "Type error!"
+
+        prefix = "{}/".format(dirblobname)
+
+        # only full 3-byte groups have stable base64 prefixes
+        encoded = prefix.encode()
+        encoded = encoded[:len(encoded)-len(encoded)%3]
+        keyprefix = base64.urlsafe_b64encode(encoded).decode()
+
+        query = "PartitionKey eq 'blobfiles'"
+        if keyprefix:
+            # "~" sorts after all characters of urlsafe base64
+            query += " and RowKey ge '{0}' and RowKey lt '{0}~'".format(keyprefix)
+
+        entities = self.table_client.query_entities(
+            mission.table_name, filter=query,
+            select="RowKey,local_utc_mtime,cloud_utc_mtime,local_path")
+
+        output = {}
+        for entity in entities:
+            blobpath = base64.urlsafe_b64decode(entity["RowKey"].encode()).decode()
+            if blobpath.startswith(prefix):
+                output[blobpath] = entity
+
+        self.logger.debug("Loaded %d table records of %s", len(output), dirblobname)
+
+        return output
+
+    def _record_transfer(self, mission, blobpath, filepath, blob_props):
+        """Record a finished transfer in the manifest (and the shared table).
+
+        The table record is queued; callers should call flush_table_records.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            blobpath [in]: relative path to the Blob root on Azure.
+            filepath [in]: path to the file on a local machine.
+            blob_props [in]: properties returned by the transfer, which must
+                have etag and last_modified.
+        """
+
+        filepath = os.path.abspath(filepath)
+        local_stat = os.stat(filepath)
+
+        self.get_manifest(mission).update(
+            blobpath, filepath, local_stat.st_size, local_stat.st_mtime_ns,
+            blob_props.etag, file_sha256(filepath))
+
+        if self.shared_table:
+            self.update_table_record(
+                mission, blobpath, filepath, blob_props.last_modified, defer=True)
+
+    def update_table_record(self, mission, blobpath, filepath, cloud_utc_mtime=None,
+                            defer=False):
         """Updating a blob's record in the table.
 
+        With defer=True, the record is queued and written together with other
+        records in entity-group transactions of up to 100 entities, either when
+        the queue is full or when flush_table_records is called.
+
         Args:
             mission [in]: an MissionInfo object.
             blobpath [in]: relative path to the Blob root on Azure.
             filename [in]: path to the file on a local machine.
+            cloud_utc_mtime [optional]: the last-modified time of the blob. If
+                None, it is obtained from Azure.
+            defer [optional]: queue the record instead of writing it now.
         """
 
         self.logger.debug(
@@ -498,8 +708,9 @@ class MissionController():
             os.path.getmtime(filepath)).replace(
                 microsecond=0, tzinfo=datetime.timezone.utc)
 
-        cloud_utc_mtime = self.storage_client.get_blob_properties(
-            mission.container_name, blobpath).properties.last_modified
+        if cloud_utc_mtime is None:
+            cloud_utc_mtime = self.storage_client.get_blob_properties(
+                mission.container_name, blobpath).properties.last_modified
 
         blobkey = base64.urlsafe_b64encode(blobpath.encode()).decode()
 
@@ -509,10 +720,50 @@ class MissionController():
             "cloud_utc_mtime": cloud_utc_mtime,
             "local_path": os.path.abspath(filepath)}
 
-        self.table_client.insert_or_replace_entity(mission.table_name, entity)
+        if not defer:
+            self.table_client.insert_or_replace_entity(mission.table_name, entity)
+            self.logger.debug(
+                "Done updating record in table %s", mission.table_name)
+            return
 
-        self.logger.info(
-            "Done updating record in table %s", mission.table_name)
+        with self._table_lock:
+            buffer = self._table_buffers.setdefault(mission.table_name, {})
+            buffer[blobkey] = entity
+
+            if len(buffer) < 100:
+                return
+
+            self._table_buffers[mission.table_name] = {}
+
+        self._commit_table_batch(mission, list(buffer.values()))
+
+    def flush_table_records(self, mission):
+        """Write all queued table records of a mission in batches.
+
+        Args:
+            mission [in]: an MissionInfo object.
+        """
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+
+        with self._table_lock:
+            buffer = self._table_buffers.pop(mission.table_name, {})
+
+        entities = list(buffer.values())
+        for i in range(0, len(entities), 100):
+            self._commit_table_batch(mission, entities[i:i+100])
+
+    def _commit_table_batch(self, mission, entities):
+        """Write at most 100 entities of the same partition in one transaction."""
+
+        batch = azure.cosmosdb.table.tablebatch.TableBatch()
+        for entity in entities:
+            batch.insert_or_replace_entity(entity)
+
+        self.table_client.commit_batch(mission.table_name, batch)
+
+        self.logger.debug(
+            "Done writing %d records to table %s", len(entities), mission.table_name)
 
     def upload_local_file(self, mission, blobpath, filepath, syncmode=True):
         """Upload a local file to a mission's sotrage container.
@@ -527,10 +778,46 @@ class MissionController():
             blobpath [in]: relative path to the Blob root on Azure.
             filename [in]: path to the file on a local machine.
             syncmode [in]: use "syncronization mode" or "always upload" mode.
+
+        Return:
+            True if the file was uploaded; False if the upload was not needed.
         """
 
         self.logger.debug("Uploading file %s to blob %s", filepath, blobpath)
 
+        assert isinstance(mission, MissionInfo), "Type error!"
+        assert isinstance(blobpath, str), "Type error!"
+
+        blob_props = None
+        if syncmode:
+            blob_props = self._get_blob_properties(mission, blobpath)
+
+        uploaded = self._upload_file(mission, blobpath, filepath, syncmode, blob_props)
+        self.flush_table_records(mission)
+
+        if uploaded:
+            self.logger.info(
+                "Done uploading file %s to blob %s", filepath, blobpath)
+        else:
+            self.logger.info(
+                "No need to upload file %s to blob %s", filepath, blobpath)
+
+        return uploaded
+
+    def _upload_file(self, mission, blobpath, filepath, syncmode, blob_props,
+                     local_stat=None, entities=None):
+        """The underlying implementation of upload_local_file (no info logs).
+
+        This function is executed by worker threads when uploading
+        directories, so the progress is logged by the caller in order.
+
+        Args:
+            blob_props [in]: the blob's properties; None if not exists. Only
+                used in sync mode.
+            local_stat [optional]: os.stat_result of the local file if known.
+            entities [optional]: preloaded table records (see _sync_code).
+        """
+
         assert isinstance(mission, MissionInfo), "Type error!"
         assert isinstance(blobpath, str), "Type error!"
         assert isinstance(filepath, str), "Type error!"
@@ -541,24 +828,23 @@ class MissionController():
 
         # if we are in sync mode
         if syncmode:
-            code = self.compare_timestamp(mission, blobpath, filepath)
+            code = self._sync_code(
+                mission, blobpath, filepath, blob_props, local_stat, entities)
             upload = (code == 1)
         else:
             upload = True
 
+        if not upload:
+            return False
+
         # upload to Azure storage
-        if upload:
-            self.storage_client.create_blob_from_path(
-                mission.container_name, blobpath, filepath, max_connections=4)
+        props = self.storage_client.create_blob_from_path(
+            mission.container_name, blobpath, filepath, max_connections=4)
 
-            self.logger.info(
-                "Done uploading file %s to blob %s", filepath, blobpath)
+        # updating records in the manifest and the table
+        self._record_transfer(mission, blobpath, filepath, props)
 
-            # updating record in the table
-            self.update_table_record(mission, blobpath, filepath)
-        else:
-            self.logger.info(
-                "No need to upload file %s to blob %s", filepath, blobpath)
+        return True
 
     def download_cloud_file(self, mission, blobpath, filepath, syncmode=True):
         """Download a file from a mission's sotrage container to local machine.
@@ -573,40 +859,72 @@ class MissionController():
             blobpath [in]: relative path to the Blob root on Azure.
             filename [in]: path to the file on a local machine.
             syncmode [in]: use "syncronization mode" or "always download" mode.
+
+        Return:
+            True if the file was downloaded; False if the download was not needed.
         """
 
         self.logger.debug("Download blob %s to file %s", blobpath, filepath)
 
         assert isinstance(mission, MissionInfo), "Type error!"
         assert isinstance(blobpath, str), "Type error!"
-        assert isinstance(filepath, str), "Type error!"
-        assert isinstance(syncmode, bool), "Type, errir!"
 
-        if not self.storage_client.exists(mission.container_name, blobpath):
+        blob_props = self._get_blob_properties(mission, blobpath)
+
+        if blob_props is None:
             raise FileNotFoundError("Blob {} does not exist".format(blobpath))
 
+        downloaded = self._download_file(mission, blobpath, filepath, syncmode, blob_props)
+        self.flush_table_records(mission)
+
+        if downloaded:
+            self.logger.info(
+                "Done downloading blob %s to file %s", blobpath, filepath)
+        else:
+            self.logger.info(
+                "No need to download blob %s to file %s", blobpath, filepath)
+
+        return downloaded
+
+    def _download_file(self, mission, blobpath, filepath, syncmode, blob_props,
+                       entities=None):
+        """The underlying implementation of download_cloud_file (no info logs).
+
+        The existence of the blob is not checked here because blobs coming from
+        a listing are known to exist.
+
+        Args:
+            blob_props [in]: the blob's properties (e.g., from a listing).
+            entities [optional]: preloaded table records (see _sync_code).
+        """
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+        assert isinstance(blobpath, str), "Type error!"
+        assert isinstance(filepath, str), "Type error!"
+        assert isinstance(syncmode, bool), "Type, errir!"
+
         # if we are in sync mode
         if syncmode:
-            code = self.compare_timestamp(mission, blobpath, filepath)
+            code = self._sync_code(
+                mission, blobpath, filepath, blob_props, None, entities)
             download = (code == 2)
         else:
             download = True
 
+        if not download:
+            return False
+
+        # make sure all intermediate folders exist
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
         # download from Azure storage
-        if download:
-            # make sure all intermediate folders exist
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        blob = self.storage_client.get_blob_to_path(
+            mission.container_name, blobpath, filepath, max_connections=4)
 
-            self.storage_client.get_blob_to_path(
-                mission.container_name, blobpath, filepath, max_connections=4)
-            self.logger.info(
-                "Done downloading blob %s to file %s", blobpath, filepath)
+        # updating records in the manifest and the table
+        self._record_transfer(mission, blobpath, filepath, blob.properties)
 
-            # updating record in the table
-            self.update_table_record(mission, blobpath, filepath)
-        else:
-            self.logger.info(
-                "No need to download blob %s to file %s", blobpath, filepath)
+        return True
 
     def delete_cloud_file(self, mission, blobpath, ignore_not_exist=False):
         """Delete a file in Azure blob storage and its record in Azure table.
@@ -643,88 +961,327 @@ class MissionController():
                 mission.table_name, "blobfiles", blobkey)
         except azure.common.AzureMissingResourceHttpError:
             pass
+        self.get_manifest(mission).remove(blobpath)
         self.logger.info("Done deleting record of %s from the table", blobpath)
 
     def upload_local_dir(self, mission, dirblobname, dirpath,
-                         syncmode=True, ignore_patterns=["__pycache__"]):
+                         syncmode=True, ignore_patterns=["__pycache__"],
+                         max_workers=None, ignore_errors=False,
+                         include_patterns=None):
         """Upload a directory to a mission's storage container.
 
+        Files are uploaded concurrently by a pool of worker threads. See
+        upload_local_dirs for the details of the return value and errors.
+
         Args:
             mission [in]: an MissionInfo object.
             dirblobname [in]: the blobpath relative to the container's root path.
             dirpath [in]: path to the directory on a local machine.
             syncmode [in]: use "syncronization mode" or "always upload" mode.
             ignore_patterns [in]: a list of Python regular expression string.
+            max_workers [in]: number of concurrent uploads. (default: self.max_workers)
+            ignore_errors [in]: return failed files instead of raising an error.
+            include_patterns [in]: a list of Python regular expression string;
+                files matching these are uploaded even if they match
+                ignore_patterns.
+
+        Return:
+            A list of (filepath, uploaded, error).
         """
 
-        self.logger.debug("Uploading directory %s to blob %s", dirpath, dirblobname)
+        results = self.upload_local_dirs(
+            mission, {dirblobname: dirpath}, syncmode, ignore_patterns,
+            max_workers, ignore_errors, include_patterns)
+
+        return results[dirblobname]
+
+    def upload_local_dirs(self, mission, dirs, syncmode=True,
+                          ignore_patterns=["__pycache__"], max_workers=None,
+                          ignore_errors=False, include_patterns=None):
+        """Upload several directories to a mission's storage container.
+
+        Files from all directories share one bounded pool of worker threads, so
+        many files of many cases are uploaded at the same time. A failed file
+        does not stop the uploading of others. Results are logged in the order
+        of files in each directory after they finish.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            dirs [in]: a dict of {dirblobname: dirpath}.
+            syncmode [in]: use "syncronization mode" or "always upload" mode.
+            ignore_patterns [in]: a list of Python regular expression string.
+            max_workers [in]: number of concurrent uploads. (default: self.max_workers)
+            ignore_errors [in]: return failed files instead of raising an error.
+            include_patterns [in]: a list of Python regular expression string;
+                files matching these are uploaded even if they match
+                ignore_patterns.
+
+        Return:
+            A dict of {dirblobname: [(filepath, uploaded, error), ...]}, where
+            uploaded is a bool (None if failed), and error is the exception
+            raised when uploading the file (None if succeeded).
+        """
 
         assert isinstance(mission, MissionInfo), "Type error!"
-        assert isinstance(dirblobname, str), "Type error!"
-        assert isinstance(dirpath, str), "Type error!"
+        assert isinstance(dirs, dict), "Type error!"
         assert isinstance(syncmode, bool), "Type, errir!"
         assert isinstance(ignore_patterns, list), "Type, errir!"
+        assert isinstance(ignore_errors, bool), "Type, errir!"
+
+        if max_workers is None:
+            max_workers = self.max_workers
+
+        # check all directories before uploading anything
+        for dirblobname, dirpath in dirs.items():
+            assert isinstance(dirblobname, str), "Type error!"
+            assert isinstance(dirpath, str), "Type error!"
+
+            if not os.path.isdir(dirpath):
+                raise FileNotFoundError("{} does not exist".format(dirpath))
+
+        results = {dirblobname: [] for dirblobname in dirs.keys()}
+        n_failed = 0
+
+        with WorkerPool(max_workers) as pool:
+
+            for dirblobname, dirpath in dirs.items():
+                self.logger.debug(
+                    "Uploading directory %s to blob %s", dirpath, dirblobname)
+
+                # in sync mode, one listing provides the states of all blobs,
+                # and one table query provides all shared records
+                blobs = {}
+                entities = None
+                if syncmode:
+                    blobs = self._list_blob_properties(mission, dirblobname)
+                    if self.shared_table:
+                        entities = self.load_table_records(mission, dirblobname)
+
+                for blobpath, filepath, local_stat in self._scan_local_files(
+                        dirblobname, dirpath, ignore_patterns, include_patterns):
+                    pool.submit(
+                        (dirblobname, blobpath, filepath), self._upload_file,
+                        mission, blobpath, filepath, syncmode,
+                        blobs.get(blobpath), local_stat, entities)
+
+            for (dirblobname, blobpath, filepath), uploaded, err in pool.iter_results():
+                results[dirblobname].append((filepath, uploaded, err))
+
+                if err is not None:
+                    n_failed += 1
+                    self.logger.error(
+                        "Failed uploading file %s to blob %s: %s",
+                        filepath, blobpath, err)
+                elif uploaded:
+                    self.logger.info(
+                        "Done uploading file %s to blob %s", filepath, blobpath)
+                else:
+                    self.logger.info(
+                        "No need to upload file %s to blob %s", filepath, blobpath)
+
+        self.flush_table_records(mission)
+
+        for dirblobname, dirpath in dirs.items():
+            self.logger.info(
+                "Done uploading directory %s to blob %s", dirpath, dirblobname)
 
-        if not os.path.isdir(dirpath):
-            raise FileNotFoundError("{} does not exist".format(dirpath))
+        if n_failed > 0 and not ignore_errors:
+            first_err = next(
+                err for values in results.values() for _, _, err in values
+                if err is not None)
+            raise RuntimeError(
+                "Failed uploading {} file(s). ".format(n_failed) +
+                "The first error: {}".format(first_err)) from first_err
+
+        return results
+
+    @staticmethod
+    def _scan_local_files(dirblobname, dirpath, ignore_patterns,
+                          include_patterns=None):
+        """List files in a local directory, their blob paths, and their stats.
+
+        Args:
+            dirblobname [in]: the blobpath relative to the container's root path.
+            dirpath [in]: path to the directory on a local machine.
+            ignore_patterns [in]: a list of Python regular expression string.
+            include_patterns [in]: a list of Python regular expression string;
+                files matching these are kept even if they match ignore_patterns.
+
+        Return:
+            A list of (blobpath, filepath, os.stat_result).
+        """
 
         # get the full and absolute path (and basename)
         dirpath = os.path.abspath(os.path.normpath(dirpath))
 
-        # upload files
-        for parent_dir, _, files in os.walk(dirpath):
-            for f in files:
-                filepath = os.path.join(parent_dir, f)
-                relfilepath = os.path.relpath(filepath, dirpath)
+        output = []
+        stack = [dirpath]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    if entry.is_dir():
+                        stack.append(entry.path)
+                        continue
 
-                if path_ignored(relfilepath, ignore_patterns):
-                    continue
+                    relfilepath = os.path.relpath(entry.path, dirpath)
+
+                    if path_ignored(relfilepath, ignore_patterns) and not (
+                            include_patterns and
+                            path_ignored(relfilepath, include_patterns)):
+                        continue
+
+                    output.append((
+                        os.path.join(dirblobname, relfilepath), entry.path,
+                        entry.stat()))
+
+        return output
+
+    def _list_blob_properties(self, mission, dirblobname):
+        """Get the properties of all blobs under a folder with one listing.
 
-                fileblobname = os.path.join(dirblobname, relfilepath)
-                self.upload_local_file(mission, fileblobname, filepath, syncmode)
+        Return:
+            A dict of {blobpath: properties}.
+        """
+
+        blob_list = self.storage_client.list_blobs(
+            mission.container_name,
+            prefix="{}/".format(dirblobname), num_results=50000)
 
-        self.logger.info("Done uploading directory %s to blob %s", dirpath, dirblobname)
+        return {blob.name: blob.properties for blob in blob_list}
 
     def download_cloud_dir(self, mission, dirblobname, dirpath,
-                           syncmode=True, ignore_patterns=["__pycache__"]):
+                           syncmode=True, ignore_patterns=["__pycache__"],
+                           max_workers=None, ignore_errors=False):
         """Download a directory from the sotrage container to local machine.
 
+        Blobs are downloaded concurrently by a pool of worker threads. See
+        download_cloud_dirs for the details of the return value and errors.
+
         Args:
             mission [in]: an MissionInfo object.
             dirblobname [in]: the blobpath relative to the container's root path.
             dirpath [in]: path to the directory on a local machine.
             syncmode [in]: use "syncronization mode" or "always download" mode.
             ignore_patterns [in]: a list of Python regular expression string.
+            max_workers [in]: number of concurrent downloads. (default: self.max_workers)
+            ignore_errors [in]: return failed files instead of raising an error.
+
+        Return:
+            A list of (filepath, downloaded, error).
         """
 
-        self.logger.debug(
-            "Downloading directory %s from blob %s", dirpath, dirblobname)
+        results = self.download_cloud_dirs(
+            mission, {dirblobname: dirpath}, syncmode, ignore_patterns,
+            max_workers, ignore_errors)
+
+        return results[dirblobname]
+
+    def download_cloud_dirs(self, mission, dirs, syncmode=True,
+                            ignore_patterns=["__pycache__"], max_workers=None,
+                            ignore_errors=False):
+        """Download several directories from the storage container.
+
+        Blobs of all directories share one bounded pool of worker threads, so
+        max_workers is a global cap on concurrent downloads. A blob is handed
+        to the pool as soon as the listing page containing it arrives, rather
+        than after the whole listing is in memory. Results are logged in the
+        order of the listing.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            dirs [in]: a dict of {dirblobname: dirpath}.
+            syncmode [in]: use "syncronization mode" or "always download" mode.
+            ignore_patterns [in]: a list of Python regular expression string.
+            max_workers [in]: number of concurrent downloads. (default: self.max_workers)
+            ignore_errors [in]: return failed files instead of raising an error.
+
+        Return:
+            A dict of {dirblobname: [(filepath, downloaded, error), ...]},
+            where downloaded is a bool (None if failed), and error is the
+            exception raised when downloading the blob (None if succeeded).
+        """
 
         assert isinstance(mission, MissionInfo), "Type error!"
-        assert isinstance(dirblobname, str), "Type error!"
-        assert isinstance(dirpath, str), "Type error!"
+        assert isinstance(dirs, dict), "Type error!"
         assert isinstance(syncmode, bool), "Type, errir!"
         assert isinstance(ignore_patterns, list), "Type, errir!"
+        assert isinstance(ignore_errors, bool), "Type, errir!"
 
-        # get the full and absolute path
-        dirpath = os.path.abspath(os.path.normpath(dirpath))
+        if max_workers is None:
+            max_workers = self.max_workers
 
-        blob_list = self.storage_client.list_blobs(
-            mission.container_name,
-            prefix="{}/".format(dirblobname), num_results=50000)
+        results = {dirblobname: [] for dirblobname in dirs.keys()}
+        failed = []
 
-        for blob in blob_list:
-            relblob = os.path.relpath(blob.name, dirblobname)
+        def log_results(block):
+            for (dirblobname, blobpath, filepath), downloaded, err in \
+                    pool.iter_results(block):
+                results[dirblobname].append((filepath, downloaded, err))
 
-            # check against ignored patterhs
-            if path_ignored(relblob, ignore_patterns):
-                continue
+                if err is not None:
+                    failed.append(err)
+                    self.logger.error(
+                        "Failed downloading blob %s to file %s: %s",
+                        blobpath, filepath, err)
+                elif downloaded:
+                    self.logger.info(
+                        "Done downloading blob %s to file %s", blobpath, filepath)
+                else:
+                    self.logger.info(
+                        "No need to download blob %s to file %s", blobpath, filepath)
 
-            filename = os.path.join(dirpath, relblob)
-            self.download_cloud_file(mission, blob.name, filename, syncmode)
+        with WorkerPool(max_workers) as pool:
 
-        self.logger.info(
-            "Done downloading directory %s from blob %s", dirpath, dirblobname)
+            for dirblobname, dirpath in dirs.items():
+                assert isinstance(dirblobname, str), "Type error!"
+                assert isinstance(dirpath, str), "Type error!"
+
+                self.logger.debug(
+                    "Downloading directory %s from blob %s", dirpath, dirblobname)
+
+                # get the full and absolute path
+                dirpath = os.path.abspath(os.path.normpath(dirpath))
+
+                # one table query provides all shared records of this folder
+                entities = None
+                if syncmode and self.shared_table:
+                    entities = self.load_table_records(mission, dirblobname)
+
+                # the listing is a lazy generator fetching one page per request
+                blob_list = self.storage_client.list_blobs(
+                    mission.container_name,
+                    prefix="{}/".format(dirblobname), num_results=50000)
+
+                for blob in blob_list:
+                    relblob = os.path.relpath(blob.name, dirblobname)
+
+                    # check against ignored patterhs
+                    if path_ignored(relblob, ignore_patterns):
+                        continue
+
+                    filename = os.path.join(dirpath, relblob)
+                    pool.submit(
+                        (dirblobname, blob.name, filename), self._download_file,
+                        mission, blob.name, filename, syncmode, blob.properties,
+                        entities)
+
+                    # log whatever has finished so far
+                    log_results(False)
+
+            log_results(True)
+
+        self.flush_table_records(mission)
+
+        for dirblobname, dirpath in dirs.items():
+            self.logger.info(
+                "Done downloading directory %s from blob %s", dirpath, dirblobname)
+
+        if failed and not ignore_errors:
+            raise RuntimeError(
+                "Failed downloading {} file(s). ".format(len(failed)) +
+                "The first error: {}".format(failed[0])) from failed[0]
+
+        return results
 
     def delete_cloud_dir(self, mission, dirblobname, ignore_not_exist=False):
         """Delete a folder in Azure blob storage and its record in Azure table.
@@ -750,14 +1307,614 @@ class MissionController():
 
         self.logger.info("Done deleting directory %s", dirblobname)
 
-    def add_task(self, mission, casename, casepath, ignore_exist=True):
-        """Add a task to the mission's job (i.e., task scheduler).
+    # files of a case folder that are not needed by the computing nodes; the
+    # raster inputs matching task_input_patterns are the exception, and every
+    # upload mode (per-file, bundle, and shared store) and the case input hash
+    # use the same rule
+    task_ignore_patterns = [
+        "__pycache__" ,".*?\.data", "fort\..*?",
+        "_plots" ,".*?\.asc", ".*?\.prj", ".*?\.nc", "\.prepared$"]
 
-        Args:
-            mission [in]: an MissionInfo object.
-            casename [in]: str; the name of the case
+    # raster inputs of a case folder, kept despite task_ignore_patterns
+    task_input_patterns = ["^topo\.asc$", "^hydro_[0-9]+\.asc$"]
+
+    # file extensions of case bundles (see upload_case_bundle)
+    bundle_extensions = {"gzip": ".tar.gz", "zstd": ".tar.zst"}
+
+    def bundle_blob_name(self, casename, bundle):
+        """The blob path of a case's bundle."""
+
+        assert bundle in self.bundle_extensions, \
+            "Unsupported bundle type: {}".format(bundle)
+
+        return "_bundles/{}{}".format(casename, self.bundle_extensions[bundle])
+
+    def upload_case_bundle(self, mission, casename, casepath, bundle="gzip"):
+        """Pack a case folder into one compressed tarball and upload it.
+
+        Files matching task_ignore_patterns are not packed, except the raster
+        inputs matching task_input_patterns (topo.asc and hydro_*.asc), which
+        compress well. A fingerprint of
+        the packed files (names, sizes, and modified times) is saved in the
+        blob's metadata, so the case is neither packed nor uploaded again if
+        nothing changed.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            casename [in]: str; the name of the case
+            casepath [in]: str; the path to case's directory
+            bundle [in]: either "gzip" or "zstd".
+
+        Return:
+            A bool indicating whether the bundle was uploaded.
+        """
+
+        self.logger.debug("Uploading bundle of %s", casename)
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+        assert isinstance(casename, str), "Type error!"
+        assert isinstance(casepath, str), "Type error!"
+
+        blobpath = self.bundle_blob_name(casename, bundle)
+
+        files = self._scan_local_files(
+            casename, casepath, self.task_ignore_patterns,
+            self.task_input_patterns)
+
+        fingerprint = hashlib.sha256(bundle.encode())
+        for arcname, _, stat in files:
+            fingerprint.update("{}\0{}\0{}\n".format(
+                arcname, stat.st_size, stat.st_mtime_ns).encode())
+        fingerprint = fingerprint.hexdigest()
+
+        try:
+            metadata = self.storage_client.get_blob_metadata(
+                mission.container_name, blobpath)
+        except azure.common.AzureMissingResourceHttpError:
+            metadata = {}
+
+        if metadata.get("fingerprint") == fingerprint:
+            self.logger.debug("Bundle of %s is up to date. Skip.", casename)
+            return False
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            tarpath = os.path.join(tempdir, os.path.basename(blobpath))
+
+            write_tarball(
+                tarpath, [(arcname, filepath) for arcname, filepath, _ in files],
+                bundle)
+
+            self.storage_client.create_blob_from_path(
+                mission.container_name, blobpath, tarpath,
+                metadata={"fingerprint": fingerprint}, max_connections=1)
+
+        self.logger.debug("Done uploading bundle of %s", casename)
+
+        return True
+
+    def _upload_case_bundles(self, mission, cases, bundle):
+        """Upload the bundles of many cases concurrently.
+
+        Return:
+            A list of (case name, error message) of failed cases.
+        """
+
+        errors = []
+        with WorkerPool(self.max_workers) as pool:
+            for casename, casepath in cases.items():
+                pool.submit(
+                    casename, self.upload_case_bundle, mission, casename,
+                    casepath, bundle)
+
+            for casename, _, error in pool.iter_results():
+                if error is not None:
+                    self.logger.error(
+                        "Failed uploading bundle of %s: %s", casename, error)
+                    errors.append((casename, str(error)))
+
+        return errors
+
+    @staticmethod
+    def shared_blob_name(sha256):
+        """The blob path of a file in the shared input store."""
+
+        return "_shared/sha256/{}".format(sha256)
+
+    def upload_case_shared(self, mission, casename, casepath):
+        """Upload a case folder to the mission's content-addressed input store.
+
+        Each file (except those matching task_ignore_patterns, but including
+        the raster inputs matching task_input_patterns) is stored once
+        per mission as _shared/sha256/<SHA-256 of content>, no matter how many
+        cases contain the same content. The task of the case then stages the
+        files from the shared blobs (see _build_task_params).
+
+        Args:
+            mission [in]: an MissionInfo object.
+            casename [in]: str; the name of the case
+            casepath [in]: str; the path to case's directory
+
+        Return:
+            The number of files uploaded (i.e., not already in the store).
+        """
+
+        self.logger.debug("Uploading shared files of %s", casename)
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+        assert isinstance(casename, str), "Type error!"
+        assert isinstance(casepath, str), "Type error!"
+
+        files = self._shared_case_files(mission, casename, casepath, True)
+
+        uploaded = 0
+        for _, filepath, sha256 in files:
+            uploaded += self._upload_shared_blob(mission, sha256, filepath)
+
+        self.logger.debug(
+            "Done uploading shared files of %s: %d of %d new",
+            casename, uploaded, len(files))
+
+        return uploaded
+
+    def _upload_shared_blob(self, mission, sha256, filepath):
+        """Upload a file to the shared store unless its content is there.
+
+        If another thread is uploading the same content, wait for it, so the
+        blob exists when this function returns.
+
+        Return:
+            A bool indicating whether this call uploaded the file.
+        """
+
+        with self._shared_lock:
+            if mission.container_name not in self._shared_blobs:
+                self._shared_blobs[mission.container_name] = set(
+                    blob.name.rsplit("/", 1)[-1] for blob in
+                    self.storage_client.list_blobs(
+                        mission.container_name, prefix="_shared/sha256/"))
+
+            shared_blobs = self._shared_blobs[mission.container_name]
+            key = (mission.container_name, sha256)
+
+            if sha256 in shared_blobs:
+                event = self._shared_uploads.get(key)
+                owner = False
+            else:
+                event = self._shared_uploads[key] = threading.Event()
+                shared_blobs.add(sha256)
+                owner = True
+
+        if not owner:
+            if event is not None:
+                event.wait()
+                if sha256 not in shared_blobs:
+                    raise RuntimeError(
+                        "Failed uploading shared blob {}".format(sha256))
+            return False
+
+        try:
+            self.storage_client.create_blob_from_path(
+                mission.container_name, self.shared_blob_name(sha256),
+                filepath, max_connections=1)
+        except Exception:
+            with self._shared_lock:
+                shared_blobs.discard(sha256)
+            raise
+        finally:
+            with self._shared_lock:
+                self._shared_uploads.pop(key).set()
+
+        return True
+
+    def _shared_case_files(self, mission, casename, casepath, refresh=False):
+        """The files of a case and the SHA-256 of their content.
+
+        Hashes are cached in the mission's sync manifest, and the result is
+        cached by this controller unless refresh is True.
+
+        Return:
+            A list of (path relative to the case's parent folder, local file
+            path, SHA-256).
+        """
+
+        key = (mission.container_name, casename)
+
+        with self._shared_lock:
+            if not refresh and key in self._shared_indexes:
+                return self._shared_indexes[key]
+
+        manifest = self.get_manifest(mission)
+        files = [
+            (blobpath.replace(os.sep, "/"), filepath,
+             manifest.file_sha256(filepath, stat))
+            for blobpath, filepath, stat in self._scan_local_files(
+                casename, casepath, self.task_ignore_patterns,
+                self.task_input_patterns)]
+
+        with self._shared_lock:
+            self._shared_indexes[key] = files
+
+        return files
+
+    # blob paths of the shared base topography and the script cropping it
+    shared_topo_blob = "_shared/topo/base_topo.tlr"
+    shared_topo_tool_blob = "_shared/tools/tiled_raster.py"
+    shared_topo_tool_modules = [tiled_raster, esri_ascii]
+
+    def upload_shared_topo(self, mission, filepath):
+        """Upload a tiled base topography shared by all cases of a mission.
+
+        Cases having a topo_window.txt (see arcgistools.export_tiled_topo and
+        prepare_single_topo_window) then get their topo.asc cropped from this
+        raster on the computing nodes before simulations, and only the tiles
+        covering the window are downloaded by the nodes.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            filepath [in]: path to the tiled raster file on a local machine.
+        """
+
+        self.logger.debug("Uploading shared topography %s", filepath)
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+        assert isinstance(filepath, str), "Type error!"
+
+        self.upload_local_file(mission, self.shared_topo_blob, filepath, True)
+        self._set_shared_hash(mission, self.shared_topo_blob, filepath)
+        for module in self.shared_topo_tool_modules:
+            toolpath = os.path.abspath(module.__file__)
+            self.upload_local_file(
+                mission, "_shared/tools/{}".format(os.path.basename(toolpath)),
+                toolpath, True)
+
+        with self._shared_lock:
+            self._shared_topos[mission.container_name] = True
+
+        self.logger.info("Done uploading shared topography %s", filepath)
+
+    def _has_shared_topo(self, mission):
+        """Whether the mission's container has a shared topography."""
+
+        with self._shared_lock:
+            if mission.container_name not in self._shared_topos:
+                self._shared_topos[mission.container_name] = \
+                    self._get_blob_properties(mission, self.shared_topo_blob) is not None
+
+            return self._shared_topos[mission.container_name]
+
+    # blob path of the mission-wide parameter script
+    shared_params_blob = "_shared/params/mission_setrun.py"
+
+    def upload_mission_params(self, mission, filepath):
+        """Upload the mission-wide parameter script shared by all cases.
+
+        Cases having only a case_override.json (see
+        arcgistools.SetrunWriter.write_overrides) then get their setrun.py,
+        roughness.txt, and case_settings.txt written by this script on the
+        computing nodes before simulations.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            filepath [in]: path to the script on a local machine.
+        """
+
+        self.logger.debug("Uploading mission parameters %s", filepath)
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+        assert isinstance(filepath, str), "Type error!"
+
+        self.upload_local_file(mission, self.shared_params_blob, filepath, True)
+        self._set_shared_hash(mission, self.shared_params_blob, filepath)
+
+        with self._shared_lock:
+            self._shared_params[mission.container_name] = True
+
+        self.logger.info("Done uploading mission parameters %s", filepath)
+
+    def _has_mission_params(self, mission):
+        """Whether the mission's container has a mission parameter script."""
+
+        with self._shared_lock:
+            if mission.container_name not in self._shared_params:
+                self._shared_params[mission.container_name] = \
+                    self._get_blob_properties(mission, self.shared_params_blob) is not None
+
+            return self._shared_params[mission.container_name]
+
+    def _set_shared_hash(self, mission, blobpath, filepath):
+        """Record the content hash of a shared blob in its metadata."""
+
+        sha256 = self.get_manifest(mission).file_sha256(filepath)
+        self.storage_client.set_blob_metadata(
+            mission.container_name, blobpath, {"sha256": sha256})
+
+        with self._shared_lock:
+            self._shared_hashes[(mission.container_name, blobpath)] = sha256
+
+    def _get_shared_hash(self, mission, blobpath):
+        """The content hash of a shared blob (its ETag if not recorded)."""
+
+        key = (mission.container_name, blobpath)
+
+        with self._shared_lock:
+            if key in self._shared_hashes:
+                return self._shared_hashes[key]
+
+        blob = self.storage_client.get_blob_properties(
+            mission.container_name, blobpath)
+        sha256 = blob.metadata.get("sha256", "etag:{}".format(blob.properties.etag))
+
+        with self._shared_lock:
+            self._shared_hashes[key] = sha256
+
+        return sha256
+
+    def _upload_cases_shared(self, mission, cases):
+        """Upload the files of many cases to the shared store concurrently.
+
+        Return:
+            A list of (case name, error message) of failed cases.
+        """
+
+        errors = []
+        with WorkerPool(self.max_workers) as pool:
+            for casename, casepath in cases.items():
+                pool.submit(
+                    casename, self.upload_case_shared, mission, casename, casepath)
+
+            uploaded = 0
+            for casename, result, error in pool.iter_results():
+                if error is not None:
+                    self.logger.error(
+                        "Failed uploading shared files of %s: %s", casename, error)
+                    errors.append((casename, str(error)))
+                else:
+                    uploaded += result
+
+        self.logger.info(
+            "Uploaded %d new shared files for %d cases", uploaded, len(cases))
+
+        return errors
+
+    # the table indexing results of completed cases of all missions by the
+    # hashes of their inputs (see case_input_hash and record_results)
+    result_index_table = "LANDSPILLRESULTINDEX"
+
+    def case_input_hash(self, mission, casename, casepath):
+        """A canonical hash of everything a case's results depend on.
+
+        The hash covers the relative paths and contents of the case's input
+        files (so also its name and parameters), the Docker image of the pool,
+        and the shared topography or mission parameter script the case uses
+        on the nodes. Input files are those not matching task_ignore_patterns
+        plus the raster inputs matching task_input_patterns (topo.asc and
+        hydro_*.asc), so editing the topography or hydro layers changes the
+        hash even though the rasters are not uploaded file by file.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            casename [in]: str; the name of the case
+            casepath [in]: str; the path to case's directory
+
+        Return:
+            A SHA-256 hex digest.
+        """
+
+        manifest = self.get_manifest(mission)
+
+        sha = hashlib.sha256()
+        sha.update("image:{}\n".format(mission.pool_image).encode())
+
+        for blobpath, filepath, stat in self._scan_local_files(
+                casename, casepath, self.task_ignore_patterns,
+                self.task_input_patterns):
+            sha.update("file:{}:{}\n".format(
+                blobpath.replace(os.sep, "/"),
+                manifest.file_sha256(filepath, stat)).encode())
+
+        if os.path.isfile(os.path.join(casepath, "topo_window.txt")) and \
+                self._has_shared_topo(mission):
+            sha.update("topo:{}\n".format(
+                self._get_shared_hash(mission, self.shared_topo_blob)).encode())
+
+        if os.path.isfile(os.path.join(casepath, "case_override.json")) and \
+                self._has_mission_params(mission):
+            sha.update("params:{}\n".format(
+                self._get_shared_hash(mission, self.shared_params_blob)).encode())
+
+        return sha.hexdigest()
+
+    def find_memoized_result(self, mission, input_hash):
+        """Find the stored results of a completed case with the same inputs.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            input_hash [in]: the case's hash from case_input_hash.
+
+        Return:
+            The record in the result index (with the source container and case
+            name), or None if not found or the results are no longer stored.
+        """
+
+        try:
+            entity = self.table_client.get_entity(
+                self.result_index_table, "results", input_hash)
+        except azure.common.AzureMissingResourceHttpError:
+            return None
+
+        # the source mission's container may have been deleted since
+        if not self.storage_client.exists(
+                entity.container, "{}/stdout.txt".format(entity.casename)):
+            return None
+
+        return entity
+
+    def copy_memoized_result(self, mission, casename, entity):
+        """Copy the stored results of a case into the mission's container.
+
+        Blobs are copied on the server side; nothing goes through the local
+        machine. Nothing is copied if the results are already in place.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            casename [in]: str; the name of the case in this mission.
+            entity [in]: the record from find_memoized_result.
+
+        Return:
+            The number of blobs copied.
+        """
+
+        if entity.container == mission.container_name and entity.casename == casename:
+            return 0
+
+        self.logger.debug(
+            "Copying results of %s from %s", casename, entity.container)
+
+        current_utc_time = \
+            datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
+
+        token = self.storage_client.generate_container_shared_access_signature(
+            container_name=entity.container,
+            permission=azure.storage.blob.ContainerPermissions(read=True),
+            start=current_utc_time,
+            expiry=current_utc_time+datetime.timedelta(days=1))
+
+        source_prefix = "{}/".format(entity.casename)
+        blobs = self.storage_client.list_blobs(
+            entity.container, prefix=source_prefix, num_results=50000)
+
+        copied = 0
+        for blob in blobs:
+            self.storage_client.copy_blob(
+                mission.container_name,
+                "{}/{}".format(casename, blob.name[len(source_prefix):]),
+                self.storage_client.make_blob_url(
+                    entity.container, blob.name, sas_token=token))
+            copied += 1
+
+        self.logger.info(
+            "Done copying %d blobs of %s from %s", copied, casename, entity.container)
+
+        return copied
+
+    def _memoize_cases(self, mission, cases):
+        """Reuse stored results of cases whose inputs did not change.
+
+        Cases found in the result index get their results copied and are
+        added to mission.tasks as completed without being submitted.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            cases [in]: a dict of {casename: casepath}.
+
+        Return:
+            (a dict of {casename: casepath} still to be submitted, a dict of
+            {casename: input hash} of these cases).
+        """
+
+        def check(casename, casepath):
+            input_hash = self.case_input_hash(mission, casename, casepath)
+            entity = self.find_memoized_result(mission, input_hash)
+            if entity is not None:
+                self.copy_memoized_result(mission, casename, entity)
+            return input_hash, entity
+
+        remaining = {}
+        hashes = {}
+        memoized = {}
+
+        with WorkerPool(self.max_workers) as pool:
+            for casename, casepath in cases.items():
+                pool.submit(casename, check, casename, casepath)
+
+            for casename, result, error in pool.iter_results():
+                if error is not None:
+                    # a failed lookup only costs a re-run
+                    self.logger.warning(
+                        "Failed looking up results of %s: %s", casename, error)
+                    remaining[casename] = cases[casename]
+                elif result[1] is None:
+                    remaining[casename] = cases[casename]
+                    hashes[casename] = result[0]
+                else:
+                    memoized[casename] = result[1].container
+
+        mission.add_tasks({casename: cases[casename] for casename in memoized})
+        for casename, container in memoized.items():
+            mission.tasks[casename].update(
+                completed=True, succeeded=True, memoized=container)
+
+        self.logger.info(
+            "Reused stored results of %d of %d cases", len(memoized), len(cases))
+
+        return remaining, hashes
+
+    def record_results(self, mission):
+        """Add the mission's succeeded cases to the result index.
+
+        Only cases submitted with memoization (i.e., having an input hash in
+        mission.tasks) are recorded.
+
+        Args:
+            mission [in]: an MissionInfo object.
+
+        Return:
+            The number of cases recorded.
+        """
+
+        self.logger.debug("Recording results of %s", mission.job_name)
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+
+        self.table_client.create_table(self.result_index_table)
+
+        tasks = self.batch_client.task.list(
+            mission.job_name,
+            task_list_options=azure.batch.models.TaskListOptions(
+                filter="state eq 'completed'", select="id,executionInfo"))
+
+        entities = []
+        for task in tasks:
+            if task.execution_info is None or \
+                    task.execution_info.result != azure.batch.models.TaskExecutionResult.success:
+                continue
+
+            input_hash = mission.tasks.get(task.id, {}).get("input_hash")
+            if input_hash is None:
+                continue
+
+            entities.append({
+                "PartitionKey": "results", "RowKey": input_hash,
+                "container": mission.container_name, "casename": task.id,
+                "pool_image": mission.pool_image})
+
+        for i in range(0, len(entities), 100):
+            batch = azure.cosmosdb.table.tablebatch.TableBatch()
+            for entity in entities[i:i+100]:
+                batch.insert_or_replace_entity(entity)
+            self.table_client.commit_batch(self.result_index_table, batch)
+
+        self.logger.info(
+            "Done recording results of %d cases of %s", len(entities), mission.job_name)
+
+        return len(entities)
+
+    def add_task(self, mission, casename, casepath, ignore_exist=True,
+                 bundle=None, dedup=False, memoize=False):
+        """Add a task to the mission's job (i.e., task scheduler).
+
+        Args:
+            mission [in]: an MissionInfo object.
+            casename [in]: str; the name of the case
             casepath [in]: str; the path to case's directory
             ignore_exist [in]: skip adding this task if already exists
+            bundle [in]: None to upload files one by one; "gzip" or "zstd" to
+                upload the case as one compressed tarball (see
+                upload_case_bundle), which is unpacked on the node.
+            dedup [in]: upload files to the mission's content-addressed store
+                (see upload_case_shared) instead; ignored if bundle is set.
+            memoize [in]: reuse the stored results of a completed case with
+                the same inputs (see case_input_hash) instead of submitting.
         """
 
         self.logger.debug("Adding %s to job", casename)
@@ -776,11 +1933,252 @@ class MissionController():
 
         casepath = os.path.abspath(casepath)
 
-        ignore_patterns = ["__pycache__" ,".*?\.data", "fort\..*?",
-                           "_plots" ,".*?\.asc", ".*?\.prj", ".*?\.nc"]
+        # reuse results of the same inputs from any mission
+        hashes = {}
+        if memoize:
+            cases, hashes = self._memoize_cases(mission, {casename: casepath})
+            if not cases:
+                self.logger.info("Reused stored results of %s", casename)
+                return
 
         # upload to the storage container
-        self.upload_local_dir(mission, casename, casepath, True, ignore_patterns)
+        if bundle is not None:
+            self.upload_case_bundle(mission, casename, casepath, bundle)
+        elif dedup:
+            self.upload_case_shared(mission, casename, casepath)
+        else:
+            self.upload_local_dir(
+                mission, casename, casepath, True, self.task_ignore_patterns,
+                include_patterns=self.task_input_patterns)
+
+        # add the task to the job
+        self.batch_client.task.add(
+            mission.job_name, self._build_task_params(
+                mission, casename, bundle,
+                self._shared_case_files(mission, casename, casepath)
+                if dedup and bundle is None else None))
+
+        # add the case information to MissionInfo object
+        mission.add_task(casename, casepath)
+        if casename in hashes:
+            mission.tasks[casename]["input_hash"] = hashes[casename]
+
+        self.logger.info("Done adding %s to job", casename)
+
+    def add_tasks(self, mission, cases, ignore_exist=True, max_retries=3,
+                  bundle=None, dedup=False, memoize=False):
+        """Add many tasks to the mission's job in bulk.
+
+        All case folders are uploaded by one pool of workers. Tasks are then
+        submitted in chunks of 100 through task.add_collection; entries failed
+        with server errors are retried (only those entries), while client
+        errors are reported after all chunks are done. Successfully submitted
+        cases are added to mission.tasks in one step.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            cases [in]: a dict of {casename: casepath}.
+            ignore_exist [in]: skip adding a task if already exists
+            max_retries [in]: the number of retries for server errors.
+            bundle [in]: None, "gzip", or "zstd"; see add_task.
+            dedup [in]: use the content-addressed store; see add_task.
+            memoize [in]: reuse stored results of the same inputs; see add_task.
+
+        Return:
+            A list of case names submitted.
+        """
+
+        self.logger.debug("Adding %d tasks to job", len(cases))
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+        assert isinstance(cases, dict), "Type error!"
+        assert isinstance(ignore_exist, bool), "Type error!"
+        assert isinstance(max_retries, int), "Type error!"
+
+        new_cases = {}
+        for casename, casepath in cases.items():
+            assert isinstance(casename, str), "Type error!"
+            assert isinstance(casepath, str), "Type error!"
+
+            if casename in mission.tasks:
+                if ignore_exist:
+                    self.logger.info("%s already in job. Skip.", casename)
+                    continue
+                # if choose not to ignore, delete the existing task
+                self.delete_task(mission, casename)
+
+            new_cases[casename] = os.path.abspath(casepath)
+
+        # reuse results of the same inputs from any mission
+        hashes = {}
+        if memoize:
+            new_cases, hashes = self._memoize_cases(mission, new_cases)
+
+        # upload all cases to the storage container
+        if bundle is None and not dedup:
+            self.upload_local_dirs(
+                mission, new_cases, True, self.task_ignore_patterns,
+                include_patterns=self.task_input_patterns)
+        else:
+            if bundle is not None:
+                errors = self._upload_case_bundles(mission, new_cases, bundle)
+            else:
+                errors = self._upload_cases_shared(mission, new_cases)
+
+            if errors:
+                raise RuntimeError(
+                    "Failed uploading {} case(s). ".format(len(errors)) +
+                    "The first error: {}: {}".format(*errors[0]))
+
+        submitted, errors = self.submit_tasks(
+            mission, new_cases, max_retries, bundle, dedup)
+
+        for casename in submitted:
+            if casename in hashes:
+                mission.tasks[casename]["input_hash"] = hashes[casename]
+
+        self.logger.info("Done adding %d tasks to job", len(submitted))
+
+        if errors:
+            raise RuntimeError(
+                "Failed adding {} task(s) to job. ".format(len(errors)) +
+                "The first error: {}: {}".format(*errors[0]))
+
+        return submitted
+
+    def submit_tasks(self, mission, cases, max_retries=3, bundle=None,
+                     dedup=False):
+        """Submit tasks of cases already uploaded to the storage container.
+
+        Tasks are submitted in chunks of 100 through task.add_collection (see
+        add_tasks). Successfully submitted cases are added to mission.tasks in
+        one step. Errors of individual tasks are returned rather than raised; if
+        a whole chunk raised, the exception is re-raised after the submitted
+        cases are recorded.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            cases [in]: a dict of {casename: casepath}.
+            max_retries [in]: the number of retries for server errors.
+            bundle [in]: None, "gzip", or "zstd"; how the cases were uploaded.
+            dedup [in]: whether the cases were uploaded to the shared store.
+
+        Return:
+            (a list of submitted case names, a list of (case name, error message)).
+        """
+
+        assert isinstance(mission, MissionInfo), "Type error!"
+        assert isinstance(cases, dict), "Type error!"
+
+        # build all task parameters and submit them in chunks
+        task_params = [
+            self._build_task_params(
+                mission, casename, bundle,
+                self._shared_case_files(mission, casename, casepath)
+                if dedup and bundle is None else None)
+            for casename, casepath in cases.items()]
+
+        submitted, errors, exception = self._submit_task_collection(
+            mission, task_params, max_retries)
+
+        # add the case information to MissionInfo object in one step
+        mission.add_tasks({casename: cases[casename] for casename in submitted})
+
+        # tasks accepted in other chunks are recorded before raising
+        if exception is not None:
+            raise exception
+
+        return submitted, errors
+
+    def _submit_task_collection(self, mission, task_params, max_retries):
+        """Submit tasks with task.add_collection in chunks of 100.
+
+        Chunks are submitted concurrently. Within a chunk, only entries failed
+        with server errors are re-submitted, with exponential back-off.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            task_params [in]: a list of azure.batch.models.TaskAddParameter.
+            max_retries [in]: the number of retries for server errors.
+
+        Return:
+            (a list of submitted task IDs, a list of (task ID, error message),
+            the first exception raised by a chunk or None).
+        """
+
+        def submit_chunk(chunk):
+            pending = {params.id: params for params in chunk}
+            succeeded = []
+            failed = {}
+
+            for attempt in range(max_retries+1):
+
+                if attempt > 0:
+                    time.sleep(2**attempt)
+
+                result = self.batch_client.task.add_collection(
+                    mission.job_name, list(pending.values()))
+
+                for entry in result.value:
+                    if entry.status == azure.batch.models.TaskAddStatus.success:
+                        succeeded.append(entry.task_id)
+                        del pending[entry.task_id]
+                        failed.pop(entry.task_id, None)
+                        continue
+
+                    message = entry.error.message.value \
+                        if entry.error is not None and entry.error.message is not None \
+                        else str(entry.status)
+
+                    failed[entry.task_id] = message
+
+                    # client errors (e.g., invalid or existing tasks) won't be fixed by retrying
+                    if entry.status == azure.batch.models.TaskAddStatus.client_error:
+                        del pending[entry.task_id]
+
+                if not pending:
+                    break
+
+                self.logger.debug(
+                    "Retrying %d tasks failed with server errors.", len(pending))
+
+            return succeeded, list(failed.items())
+
+        submitted = []
+        errors = []
+        exception = None
+
+        with WorkerPool(self.max_workers) as pool:
+            for i in range(0, len(task_params), 100):
+                pool.submit(i, submit_chunk, task_params[i:i+100])
+
+            for i, result, err in pool.iter_results():
+                if err is not None:
+                    errors += [(params.id, str(err)) for params in task_params[i:i+100]]
+                    exception = err if exception is None else exception
+                    continue
+                submitted += result[0]
+                errors += result[1]
+
+        for task_id, message in errors:
+            self.logger.error("Failed adding %s to job: %s", task_id, message)
+
+        return submitted, errors, exception
+
+    def _build_task_params(self, mission, casename, bundle=None,
+                           shared_files=None):
+        """Build the parameters of a case's task.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            casename [in]: str; the name of the case
+            bundle [in]: None, "gzip", or "zstd"; how the case was uploaded.
+            shared_files [in]: the case's files in the shared store (see
+                _shared_case_files) if the case was uploaded there.
+
+        Return:
+            An azure.batch.models.TaskAddParameter object.
+        """
 
         # configuration of Docker image being used
         task_container_settings = azure.batch.models.TaskContainerSettings(
@@ -788,10 +2186,24 @@ class MissionController():
             container_run_options="--rm --workdir /home/landspill")
 
         # file that will be copied to VM from Azure storage
-        input_data = [
-            azure.batch.models.ResourceFile(
-                storage_container_url=mission.container_url,
-                blob_prefix="{}/".format(casename))]
+        if bundle is None:
+            blob_prefix = "{}/".format(casename)
+        else:
+            blob_prefix = self.bundle_blob_name(casename, bundle)
+
+        if shared_files is None:
+            input_data = [
+                azure.batch.models.ResourceFile(
+                    storage_container_url=mission.container_url,
+                    blob_prefix=blob_prefix)]
+        else:
+            input_data = [
+                azure.batch.models.ResourceFile(
+                    http_url=self.storage_client.make_blob_url(
+                        mission.container_name, self.shared_blob_name(sha256),
+                        sas_token=mission.container_token),
+                    file_path=relpath)
+                for relpath, _, sha256 in shared_files]
 
         # file that will be copied to Azure storage from VM after simulation
         output_data = [
@@ -816,9 +2228,58 @@ class MissionController():
                         container_url=mission.container_url,
                         path="{}".format(casename))))]
 
+        # command to copy or unpack the case folder on VM
+        if bundle is None:
+            stage = "cp -r $AZ_BATCH_TASK_WORKING_DIR/{} ./".format(casename)
+        elif bundle == "gzip":
+            stage = "tar -xzf $AZ_BATCH_TASK_WORKING_DIR/{}".format(blob_prefix)
+        else:
+            stage = "zstd -dc $AZ_BATCH_TASK_WORKING_DIR/{} | tar -xf -".format(
+                blob_prefix)
+
+        # crop the shared topography on VM if the case has only a clip window
+        environment = None
+        if self._has_shared_topo(mission):
+            for module in self.shared_topo_tool_modules:
+                blobpath = "_shared/tools/{}".format(
+                    os.path.basename(module.__file__))
+                input_data.append(
+                    azure.batch.models.ResourceFile(
+                        http_url=self.storage_client.make_blob_url(
+                            mission.container_name, blobpath,
+                            sas_token=mission.container_token),
+                        file_path=blobpath))
+
+            environment = [
+                azure.batch.models.EnvironmentSetting(
+                    name="TOPO_URL",
+                    value=self.storage_client.make_blob_url(
+                        mission.container_name, self.shared_topo_blob,
+                        sas_token=mission.container_token))]
+
+            stage += \
+                " && if [ -f {0}/topo_window.txt ]; then ".format(casename) + \
+                "python3 $AZ_BATCH_TASK_WORKING_DIR/{} crop $TOPO_URL ".format(
+                    self.shared_topo_tool_blob) + \
+                "{0}/topo_window.txt {0}/topo.asc; fi".format(casename)
+
+        # write the parameter files on VM if the case has only an override
+        if self._has_mission_params(mission):
+            input_data.append(
+                azure.batch.models.ResourceFile(
+                    http_url=self.storage_client.make_blob_url(
+                        mission.container_name, self.shared_params_blob,
+                        sas_token=mission.container_token),
+                    file_path=self.shared_params_blob))
+
+            stage += \
+                " && if [ -f {0}/case_override.json ]; then ".format(casename) + \
+                "python3 $AZ_BATCH_TASK_WORKING_DIR/{} {}; fi".format(
+                    self.shared_params_blob, casename)
+
         # command to be executed on VM
         command = "/bin/bash -c \"" + \
-            "cp -r $AZ_BATCH_TASK_WORKING_DIR/{} ./ && ".format(casename) + \
+            "{} && ".format(stage) + \
             "run.py {} && ".format(casename) + \
             "createnc.py {} && ".format(casename) + \
             "cp -r ./{} $AZ_BATCH_TASK_WORKING_DIR".format(casename) + \
@@ -830,15 +2291,10 @@ class MissionController():
             command_line=command,
             container_settings=task_container_settings,
             resource_files=input_data,
-            output_files=output_data)
-
-        # add the task to the job
-        self.batch_client.task.add(mission.job_name, task_params)
+            output_files=output_data,
+            environment_settings=environment)
 
-        # add the case information to MissionInfo object
-        mission.add_task(casename, casepath)
-
-        self.logger.info("Done adding %s to job", casename)
+        return task_params
 
     def delete_task(self, mission, case):
         """Delete a task from the mission's job (i.e., task scheduler)."""
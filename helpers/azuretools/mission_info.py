@@ -86,7 +86,8 @@ class MissionInfo():
             "Max. number of nodes: {}\n".format(self.n_max_nodes) + \
             "Auto-scaling formula: {}\n".format(self.auto_scaling_formula) + \
             "Node type: {}\n".format(self.node_type) + \
-            "Task tracker file name: {}\n".format(self.backup_file)
+            "Task tracker file name: {}\n".format(self.backup_file) + \
+            "Sync manifest file name: {}\n".format(self.manifest_file)
 
         return s
 
@@ -132,6 +133,7 @@ class MissionInfo():
 
         self.tasks = {}
         self.backup_file = os.path.join(self.wd, "{}_backup_file.dat".format(self.name))
+        self.manifest_file = self._manifest_file_name()
 
         # a formula for auto-scaling of the pool
         if self.node_type == "dedicated":
@@ -155,6 +157,12 @@ class MissionInfo():
 
         self.logger.info("Done setting up a MissionInfo instance.")
 
+    def _manifest_file_name(self):
+        """The path of the local sync manifest, next to the backup file."""
+
+        return os.path.join(
+            os.path.dirname(self.backup_file), "{}_sync_manifest.db".format(self.name))
+
     def add_task(self, case_name, case_path, ignore=True):
         """Add a task to the mission's task list.
 
@@ -187,6 +195,39 @@ class MissionInfo():
 
         self.logger.info("Done adding task %s to MissionInfo.", case_name)
 
+    def add_tasks(self, cases, ignore=True):
+        """Add many tasks to the mission's task list in one step.
+
+        See add_task for details. Either all tasks are added or none of them
+        is added.
+
+        Args:
+            cases [in]: a dict of {case_name: case_path}.
+            ignore [optional]: whether to ignore if a task exists in the list
+        """
+
+        self.logger.debug("Adding %d tasks to MissionInfo.", len(cases))
+
+        if not ignore:
+            existing = [case_name for case_name in cases if case_name in self.tasks]
+            if existing:
+                self.logger.error("%s already exists. Error!", existing[0])
+                raise RuntimeError("{} already exists.".format(existing[0]))
+
+        new_tasks = {}
+        for case_name, case_path in cases.items():
+            if case_name in self.tasks:
+                continue
+
+            case_path = os.path.abspath(case_path)
+            new_tasks[case_name] = {
+                "path": case_path, "parent_path": os.path.dirname(case_path),
+                "completed": False, "succeeded": False}
+
+        self.tasks.update(new_tasks)
+
+        self.logger.info("Done adding %d tasks to MissionInfo.", len(new_tasks))
+
     def remove_task(self, case_name, ignore=True):
         """Remove a task from the mission's task list.
 
@@ -275,6 +316,9 @@ class MissionInfo():
             self.container_token, self.container_url, self.tasks, \
             self.backup_file = data_list
 
+        # the local sync manifest always sits next to the backup file
+        self.manifest_file = self._manifest_file_name()
+
         self.logger.info("Done reading the MissionInfo from file %s.", self.backup_file)
 
         return timestamp
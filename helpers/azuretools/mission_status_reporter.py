@@ -37,10 +37,332 @@
 """
 An object to obtain status of resources of a mission.
 """
+import os
+import json
+import time
+import random
+import logging
 import datetime
+import threading
+import collections
+import concurrent.futures
 import azure.batch
 
 
+def _not_found(err):
+    """Whether a BatchErrorException means the pool or job does not exist."""
+
+    return err.error is not None and err.error.code in ("PoolNotFound", "JobNotFound")
+
+
+# error codes telling the service does not provide an operation (see _not_supported)
+_UNSUPPORTED_CODES = (
+    "InvalidRestAPIForVersion", "OperationNotSupported", "UnsupportedOperation",
+    "FeatureNotEnabled", "NotImplemented")
+
+
+def _not_supported(err):
+    """Whether a BatchErrorException means the operation is not provided."""
+
+    return err.error is not None and err.error.code in _UNSUPPORTED_CODES
+
+
+class PollingScheduler():
+    """A shared poll loop with an adaptive interval and a per-loop request budget.
+
+    Right after the polled state changes, the next poll comes after
+    min_interval seconds. While nothing changes, the interval grows by the
+    backoff factor up to max_interval. Each interval is randomized by
+    +/- jitter (a fraction) so that several processes do not poll in lockstep.
+    Every poll costs `cost` requests from a budget of `budget` requests per
+    `period` seconds; a poll that would exceed the budget is delayed. The
+    budget only covers the polls of this loop; other requests (e.g., task
+    listings and downloads) and the loops of other missions are not counted.
+
+    Consumers register callbacks with subscribe; all of them receive the
+    results of the same polls, which run in one background thread. Failed
+    polls are logged and retried; consumers can check consecutive_failures
+    and last_error when no state arrives.
+    """
+
+    def __init__(self, poll, min_interval=5., max_interval=120., backoff=2., jitter=0.2,
+                 budget=300, period=60., cost=5, key=None):
+        """Constructor.
+
+        Args:
+            poll [in]: a callable taking no arguments and returning the state.
+            min_interval [in]: seconds between polls right after a change.
+            max_interval [in]: upper bound of seconds between polls.
+            backoff [in]: factor by which the interval grows while nothing changes.
+            jitter [in]: fraction by which each interval is randomized.
+            budget [in]: max number of requests of this loop in a period.
+            period [in]: seconds of a budget period.
+            cost [in]: number of requests of one poll.
+            key [in]: a callable mapping a state to what is compared to detect
+                changes; default to the state itself.
+        """
+
+        assert min_interval > 0, "min_interval must be positive."
+        assert max_interval >= min_interval, "max_interval is smaller than min_interval."
+        assert backoff >= 1, "backoff must be at least 1."
+        assert 0 <= jitter < 1, "jitter must be in [0, 1)."
+        assert budget >= cost, "budget can not afford a poll."
+
+        self.poll = poll
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.backoff = float(backoff)
+        self.jitter = float(jitter)
+        self.budget = budget
+        self.period = float(period)
+        self.cost = cost
+        self.key = key if key is not None else (lambda state: state)
+
+        self.logger = logging.getLogger("AzureMission")
+
+        self._interval = self.min_interval
+        self._requests = collections.deque() # times of the requests in the budget period
+        self._subscribers = []
+        self._latest = None
+        self._latest_key = None
+        self._next_poll_time = None
+        self._failures = 0
+        self._last_error = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def latest(self):
+        """The state from the latest successful poll, or None."""
+
+        return self._latest
+
+    @property
+    def next_poll_time(self):
+        """Epoch time (time.time) of the next poll, or None if not scheduled."""
+
+        return self._next_poll_time
+
+    @property
+    def consecutive_failures(self):
+        """The number of polls failed since the last successful one."""
+
+        return self._failures
+
+    @property
+    def last_error(self):
+        """The exception of the latest failed poll, or None."""
+
+        return self._last_error
+
+    @property
+    def running(self):
+        """Whether the poll loop is running."""
+
+        return self._thread is not None
+
+    def subscribe(self, callback):
+        """Register a callback and start the poll loop if it is not running.
+
+        Args:
+            callback [in]: a callable taking the polled state; called from the
+                poll loop thread, so it should return quickly.
+        """
+
+        with self._lock:
+            self._subscribers.append(callback)
+
+            # also cancels a stop the loop has not acted on yet
+            self._stop.clear()
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="PollingScheduler", daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, callback):
+        """Remove a callback and stop the poll loop if no subscriber is left.
+
+        Args:
+            callback [in]: a callable previously passed to subscribe.
+        """
+
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+            if not self._subscribers:
+                self._stop.set()
+                self._wake.set()
+
+    def poll_now(self):
+        """Make the next poll happen as soon as the budget allows."""
+
+        self._interval = self.min_interval
+        self._wake.set()
+
+    def stop(self):
+        """Stop the poll loop and drop all subscribers."""
+
+        with self._lock:
+            self._subscribers = []
+            self._stop.set()
+            self._wake.set()
+            thread = self._thread
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _budget_delay(self, now):
+        """Seconds to wait until a poll fits in the request budget."""
+
+        while self._requests and self._requests[0] <= now - self.period:
+            self._requests.popleft()
+
+        if len(self._requests) + self.cost <= self.budget:
+            return 0.
+
+        # wait until enough of the old requests leave the period
+        return self._requests[len(self._requests)+self.cost-self.budget-1] + self.period - now
+
+    def _next_interval(self, changed):
+        """Update and return the randomized interval to the next poll."""
+
+        if changed:
+            self._interval = self.min_interval
+        else:
+            self._interval = min(self._interval*self.backoff, self.max_interval)
+
+        return self._interval * random.uniform(1.-self.jitter, 1.+self.jitter)
+
+    def _loop(self):
+        """The poll loop."""
+
+        delay = 0.
+
+        while True:
+
+            self._next_poll_time = time.time() + delay
+            self._wake.wait(delay)
+            self._wake.clear()
+
+            # finish while holding the lock so that a new subscriber either
+            # cancels the stop or starts a new loop
+            with self._lock:
+                if self._stop.is_set():
+                    self._thread = None
+                    self._next_poll_time = None
+                    return
+
+            # the budget may postpone the poll
+            now = time.time()
+            delay = self._budget_delay(now)
+            if delay > 0:
+                continue
+
+            self._requests.extend([now]*self.cost)
+
+            try:
+                state = self.poll()
+            except Exception as err: # keep polling; Azure errors are often transient
+                self.logger.error("Polling failed: {}".format(err))
+                self._failures += 1
+                self._last_error = err
+                delay = self._next_interval(False)
+                continue
+
+            self._failures = 0
+
+            state_key = self.key(state)
+            changed = self._latest is None or state_key != self._latest_key
+            self._latest, self._latest_key = state, state_key
+
+            delay = self._next_interval(changed)
+            self._next_poll_time = time.time() + delay
+
+            with self._lock:
+                subscribers = list(self._subscribers)
+
+            for callback in subscribers:
+                try:
+                    callback(state)
+                except Exception as err:
+                    self.logger.error("A polling subscriber failed: {}".format(err))
+
+
+class StatusCache():
+    """A local file through which one process shares status snapshots.
+
+    The process polling Azure publishes each snapshot with an atomic file
+    replacement, and any number of viewer processes read the file, so N
+    viewers cost one set of Azure requests and need no credentials.
+    """
+
+    def __init__(self, filename):
+        """Constructor.
+
+        Args:
+            filename [in]: path to the cache file.
+        """
+
+        self.filename = os.path.abspath(filename)
+
+        # (mtime, size) of the file when it was last read, and the snapshot read
+        self._stamp = None
+        self._snapshot = None
+
+    def publish(self, snapshot, next_poll_time=None):
+        """Write a snapshot to the cache file.
+
+        Args:
+            snapshot [in]: a dict from MissionStatusReporter.get_status_snapshot.
+            next_poll_time [in]: epoch time of the next poll, if known.
+        """
+
+        data = dict(snapshot)
+        data["published"] = time.time()
+        data["next_poll_time"] = next_poll_time
+
+        tmp = "{}.{}.tmp".format(self.filename, os.getpid())
+
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+        try:
+            os.replace(tmp, self.filename)
+        except PermissionError: # a reader holds the file on Windows; the next publish replaces it
+            os.remove(tmp)
+
+    def read(self):
+        """Read the latest snapshot from the cache file.
+
+        Return:
+            A snapshot dict with the extra keys published and next_poll_time,
+            or None if nothing has been published. The same object is returned
+            as long as the file is unchanged.
+        """
+
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        if stamp != self._stamp:
+            try:
+                with open(self.filename, "r", encoding="utf-8") as f:
+                    self._snapshot = json.load(f)
+            except (OSError, ValueError): # being replaced; try again next time
+                return self._snapshot
+
+            self._stamp = stamp
+
+        return self._snapshot
+
+
 class MissionStatusReporter():
     """An object to obtain status of resources of a mission. """
 
@@ -52,6 +374,148 @@ class MissionStatusReporter():
         self.storage_client = credential.create_blob_client()
         self.table_client = credential.create_table_client()
 
+        # threads issuing the requests of a status snapshot concurrently
+        self._executor = concurrent.futures.ThreadPoolExecutor(5)
+
+        # whether the account's node-count aggregation can be used
+        self._node_counts_supported = True
+
+        # shared poll loops of status snapshots; one per mission
+        self._schedulers = {}
+
+    @staticmethod
+    def _empty_node_states():
+        """A dict of node states with zero counts."""
+
+        return dict(
+            idle=0, rebooting=0, reimaging=0, running=0, unusable=0, creating=0,
+            starting=0, waiting_for_start_task=0, start_task_failed=0, unknown=0,
+            leaving_pool=0, offline=0, preempted=0)
+
+    def _get_pool(self, mission):
+        """Get the pool; None if it does not exist."""
+
+        try:
+            return self.batch_client.pool.get(pool_id=mission.pool_name)
+        except azure.batch.models.BatchErrorException as err:
+            if _not_found(err):
+                return None
+            raise
+
+    def _count_node_states(self, mission):
+        """Count the pool's nodes in each state; None if the pool does not exist.
+
+        The counts aggregated by the Batch service (account.list_pool_node_counts)
+        are used, which is one small response whatever the pool size. If the
+        service or the SDK does not provide them, nodes are listed with only
+        their states selected from then on. Other errors (e.g., throttling or
+        server errors) are raised, so the next poll tries the aggregation again.
+        """
+
+        if self._node_counts_supported:
+            try:
+                return self._aggregate_node_states(mission)
+            except AttributeError:
+                self._node_counts_supported = False
+            except azure.batch.models.BatchErrorException as err:
+                if not _not_supported(err):
+                    raise
+                self._node_counts_supported = False
+
+        states = self._empty_node_states()
+
+        try:
+            for node in self.batch_client.compute_node.list(
+                    pool_id=mission.pool_name,
+                    compute_node_list_options=azure.batch.models.ComputeNodeListOptions(
+                        select="state")):
+                states[node.state.name] += 1
+        except azure.batch.models.BatchErrorException as err:
+            if _not_found(err):
+                return None
+            raise
+
+        return states
+
+    def _aggregate_node_states(self, mission):
+        """Node state counts (dedicated plus low-priority) of the pool.
+
+        A pool missing from the aggregation (e.g., just created or deleted)
+        has no nodes; whether it exists is told by the pool request.
+        """
+
+        states = self._empty_node_states()
+
+        pools = self.batch_client.account.list_pool_node_counts(
+            account_list_pool_node_counts_options=\
+                azure.batch.models.AccountListPoolNodeCountsOptions(
+                    filter="poolId eq '{}'".format(mission.pool_name)))
+
+        for pool in pools:
+            if pool.pool_id != mission.pool_name:
+                continue
+
+            for counts in [pool.dedicated, pool.low_priority]:
+                if counts is None:
+                    continue
+                for key in states:
+                    states[key] += getattr(counts, key)
+
+        return states
+
+    def _get_job(self, mission):
+        """Get the job; None if it does not exist."""
+
+        try:
+            return self.batch_client.job.get(job_id=mission.job_name)
+        except azure.batch.models.BatchErrorException as err:
+            if _not_found(err):
+                return None
+            raise
+
+    def _get_task_counts(self, mission):
+        """Get the job's task counts; None if the job does not exist."""
+
+        try:
+            return self.batch_client.job.get_task_counts(mission.job_name)
+        except azure.batch.models.BatchErrorException as err:
+            if _not_found(err):
+                return None
+            raise
+
+    def _get_storage_status(self, mission):
+        """See get_storage_container_status."""
+
+        if self.storage_client.exists(container_name=mission.container_name):
+            return "available"
+
+        return "N/A"
+
+    @staticmethod
+    def _pool_status(the_pool, states):
+        """Pool status, allocation status, and node states from responses."""
+
+        if the_pool is None or states is None:
+            return "N/A", "N/A", MissionStatusReporter._empty_node_states()
+
+        return the_pool.state.name, the_pool.allocation_state.name, states
+
+    @staticmethod
+    def _job_status(the_job, status_counts):
+        """Job status and task status from responses."""
+
+        status = dict(active=0, running=0, succeeded=0, failed=0)
+
+        if the_job is None or status_counts is None:
+            return "N/A", status
+
+        status["active"] = status_counts.active
+        status["running"] = status_counts.running
+        status["succeeded"] = status_counts.succeeded
+        status["failed"] = status_counts.failed
+
+        return the_job.state.name, status
+
     def get_pool_status(self, mission):
         """Get the current status of the pool.
 
@@ -72,39 +536,17 @@ class MissionStatusReporter():
             'unknown', 'leaving_pool', 'offline', and 'preempted'
         """
 
-        # initialize node status
-        states = dict(
-            idle=0, rebooting=0, reimaging=0, running=0, unusable=0, creating=0,
-            starting=0, waiting_for_start_task=0, start_task_failed=0, unknown=0,
-            leaving_pool=0, offline=0, preempted=0)
-
-        # if the pool does not exist
-        if not self.batch_client.pool.exists(pool_id=mission.pool_name):
-            return "N/A", "N/A", states
-
-        # get pool info
-        the_pool = self.batch_client.pool.get(pool_id=mission.pool_name)
-        state = the_pool.state.name
-        allocation_state = the_pool.allocation_state.name
+        # a pool deleted between the two requests gets N/A as a whole
+        return self._pool_status(
+            self._get_pool(mission), self._count_node_states(mission))
 
-        # get the list of node at current time point
-        # we check the existance of the pool again to avoid coincidence
-        if self.batch_client.pool.exists(pool_id=mission.pool_name):
-            node_list = self.batch_client.compute_node.list(
-                pool_id=mission.pool_name)
-
-            # calculate the number of nodes in each status
-            for node in node_list:
-                states[node.state.name] += 1
-            node_list.reset()
-
-        return state, allocation_state, states
-
-    def get_pool_overview_string(self, mission):
+    def get_pool_overview_string(self, mission, snapshot=None):
         """Get a string for the status overview of the pool and nodes.
 
         Args:
             mission [in]: an MissionInfo object.
+            snapshot [in]: optional; a dict from get_status_snapshot to use
+                instead of requesting the status.
 
         Return:
             A string of format:
@@ -115,7 +557,11 @@ class MissionStatusReporter():
         """
 
         # get statuses
-        pool_status, allocation_status, node_status = self.get_pool_status(mission)
+        if snapshot is None:
+            pool_status, allocation_status, node_status = self.get_pool_status(mission)
+        else:
+            pool_status, allocation_status, node_status = \
+                snapshot["pool_status"], snapshot["allocation_status"], snapshot["node_status"]
 
         s = "Pool status: {}\n".format(pool_status)
         s += "Allocation status: {}".format(allocation_status)
@@ -150,34 +596,15 @@ class MissionStatusReporter():
             the numbers of tasks in those statuses.
         """
 
-        # initialize task status
-        status = dict(active=0, running=0, succeeded=0, failed=0)
-
-        # get job status if it exists. Otherwise, return N/A
-        try:
-            the_job = self.batch_client.job.get(job_id=mission.job_name)
+        return self._job_status(
+            self._get_job(mission), self._get_task_counts(mission))
 
-            # get counts of tasks in different statuses
-            status_counts = self.batch_client.job.get_task_counts(mission.job_name)
-        except azure.batch.models.BatchErrorException as err:
-            if err.message.value.startswith("The specified job does not exist"):
-                return "N/A", status
-            # raise an exception for other kinds of errors
-            raise
-
-        # update the dictionary
-        status["active"] = status_counts.active
-        status["running"] = status_counts.running
-        status["succeeded"] = status_counts.succeeded
-        status["failed"] = status_counts.failed
-
-        return the_job.state.name, status
-
-    def get_job_overview_string(self, mission):
+    def get_job_overview_string(self, mission, snapshot=None):
         """Get a string for the status overview of the job and tasks.
 
         Args:
             mission [in]: an MissionInfo object.
+            snapshot [in]: optional; see get_pool_overview_string.
 
         Return:
             A string of format:
@@ -187,7 +614,10 @@ class MissionStatusReporter():
         """
 
         # get statuses
-        job_status, task_status = self.get_job_status(mission)
+        if snapshot is None:
+            job_status, task_status = self.get_job_status(mission)
+        else:
+            job_status, task_status = snapshot["job_status"], snapshot["task_status"]
 
         s = "Job status: {}".format(job_status)
 
@@ -211,32 +641,35 @@ class MissionStatusReporter():
             A string. Possible values: available and N/A.
         """
 
-        if self.storage_client.exists(container_name=mission.container_name):
-            return "available"
-
         # TODO: calculate space used in the container
 
-        return "N/A"
+        return self._get_storage_status(mission)
 
-    def get_storage_container_overview_string(self, mission):
+    def get_storage_container_overview_string(self, mission, snapshot=None):
         """Get a string for the status of the storage container.
 
         Args:
             mission [in]: an MissionInfo object.
+            snapshot [in]: optional; see get_pool_overview_string.
 
         Return:
             A string of format: Storage container status: {}.
         """
 
-        status = self.get_storage_container_status(mission)
+        if snapshot is None:
+            status = self.get_storage_container_status(mission)
+        else:
+            status = snapshot["storage_status"]
+
         s = "Storage container status: {}".format(status)
         return s
 
-    def get_overview_string(self, mission):
+    def get_overview_string(self, mission, snapshot=None):
         """Get the string of an overview to all resources.
 
         Args:
             mission [in]: an MissionInfo object.
+            snapshot [in]: a dict from get_status_snapshot; polled if None.
 
         Return:
             A string with format:
@@ -251,12 +684,73 @@ class MissionStatusReporter():
             Storage container status: {}.
         """
 
-        s = self.get_pool_overview_string(mission) + "\n\n"
-        s += self.get_job_overview_string(mission) + "\n\n"
-        s += self.get_storage_container_overview_string(mission)
+        if snapshot is None:
+            snapshot = self.get_status_snapshot(mission)
+
+        s = self.get_pool_overview_string(mission, snapshot) + "\n\n"
+        s += self.get_job_overview_string(mission, snapshot) + "\n\n"
+        s += self.get_storage_container_overview_string(mission, snapshot)
 
         return s
 
+    def get_status_snapshot(self, mission):
+        """Get the status of all resources with concurrent requests.
+
+        The requests for the pool, its nodes, the job, its task counts, and
+        the storage container are issued at the same time, so a snapshot
+        takes about as long as the slowest of them. A missing pool or job is
+        reported as N/A rather than checked beforehand.
+
+        Args:
+            mission [in]: an MissionInfo object.
+
+        Return:
+            A dict with keys: timestamp, pool_status, allocation_status,
+            node_status, job_status, task_status, storage_status (see the
+            get_*_status functions), and latency (a dict of the seconds each
+            request took, and the total).
+        """
+
+        def timed(func):
+            tic = time.perf_counter()
+            return func(mission), time.perf_counter() - tic
+
+        status = {}
+
+        status["timestamp"] = datetime.datetime.utcnow().replace(
+            microsecond=0, tzinfo=datetime.timezone.utc).strftime(
+                "%a %b %d %H:%M:%S %Z %Y")
+
+        tic = time.perf_counter()
+
+        requests = {
+            "pool": self._get_pool, "nodes": self._count_node_states,
+            "job": self._get_job, "tasks": self._get_task_counts,
+            "storage": self._get_storage_status}
+
+        futures = {
+            key: self._executor.submit(timed, func) for key, func in requests.items()}
+
+        # wait for all requests before raising any error
+        concurrent.futures.wait(futures.values())
+
+        results = {}
+        status["latency"] = {}
+        for key, future in futures.items():
+            results[key], status["latency"][key] = future.result()
+
+        status["latency"]["total"] = time.perf_counter() - tic
+
+        status["pool_status"], status["allocation_status"], status["node_status"] = \
+            self._pool_status(results["pool"], results["nodes"])
+
+        status["job_status"], status["task_status"] = \
+            self._job_status(results["job"], results["tasks"])
+
+        status["storage_status"] = results["storage"]
+
+        return status
+
     def status_generator(self, mission):
         """A generator that can be used in a loop.
 
@@ -264,24 +758,67 @@ class MissionStatusReporter():
             mission [in]: an MissionInfo object.
 
         Yield:
-            [pool status, allocation status, node status, job status,
-            task status, storage container status]
+            A dict from get_status_snapshot.
         """
 
         while True:
-            status = {}
+            yield self.get_status_snapshot(mission)
+
+    @staticmethod
+    def _snapshot_key(snapshot):
+        """The part of a snapshot compared to detect state changes."""
+
+        return tuple(
+            (key, repr(value)) for key, value in sorted(snapshot.items())
+            if key not in ("timestamp", "latency"))
+
+    def get_scheduler(self, mission, **kwargs):
+        """Get the shared PollingScheduler of status snapshots of a mission.
+
+        All consumers in this process polling the same mission should
+        subscribe to this scheduler instead of polling on their own.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            kwargs [in]: keyword arguments of PollingScheduler; only used when
+                the scheduler is created.
+
+        Return:
+            A PollingScheduler whose polls return get_status_snapshot dicts.
+        """
+
+        if mission.name not in self._schedulers:
+            kwargs.setdefault("key", self._snapshot_key)
+            self._schedulers[mission.name] = PollingScheduler(
+                lambda: self.get_status_snapshot(mission), **kwargs)
+
+        return self._schedulers[mission.name]
+
+    def publish_status(self, mission, filename, until=None, **kwargs):
+        """Publish the snapshots of the shared scheduler to a StatusCache file.
+
+        Args:
+            mission [in]: an MissionInfo object.
+            filename [in]: path to the cache file.
+            until [in]: a callable taking no arguments; publishing stops once it
+                returns True. (default: publish until unsubscribed)
+            kwargs [in]: keyword arguments passed to get_scheduler.
+
+        Return:
+            The callback subscribed to the scheduler, which can be passed to
+            its unsubscribe to stop publishing.
+        """
 
-            status["timestamp"] = datetime.datetime.utcnow().replace(
-                microsecond=0, tzinfo=datetime.timezone.utc).strftime(
-                    "%a %b %d %H:%M:%S %Z %Y")
+        scheduler = self.get_scheduler(mission, **kwargs)
+        cache = StatusCache(filename)
 
-            status["pool_status"], status["allocation_status"], \
-                status["node_status"] = self.get_pool_status(mission)
+        def publish(snapshot):
+            if until is not None and until():
+                scheduler.unsubscribe(publish)
+                return
 
-            status["job_status"], status["task_status"] = \
-                self.get_job_status(mission)
+            cache.publish(snapshot, scheduler.next_poll_time)
 
-            status["storage_status"] = \
-                self.get_storage_container_status(mission)
+        scheduler.subscribe(publish)
 
-            yield status
+        return publish
@@ -0,0 +1,247 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+########################################################################################################################
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+# All Rights Reserved.
+#
+# Contributors: Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Licensed under the BSD-3-Clause License (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at: https://opensource.org/licenses/BSD-3-Clause
+#
+# BSD-3-Clause License:
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#    following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+# GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+########################################################################################################################
+"""
+A local record of the synchronization state of files and blobs.
+"""
+import os
+import sqlite3
+import threading
+import collections
+from .misc import file_sha256
+
+
+# a record of a blob at the last time it was synchronized with a local file
+ManifestRecord = collections.namedtuple(
+    "ManifestRecord", ["blobpath", "local_path", "size", "mtime_ns", "etag", "sha256"])
+
+
+def normalize_etag(etag):
+    """Strip the quotes of an ETag.
+
+    Upload and download calls return the ETag as in the HTTP header (quoted),
+    while blob listings return it unquoted.
+    """
+
+    return None if etag is None else etag.strip('"')
+
+
+class SyncManifest():
+    """A local SQLite record of the synchronization state of blobs.
+
+    For every blob uploaded or downloaded, the manifest records the local file
+    path, the size and modification time of the local file, the ETag of the
+    blob, and the SHA-256 of the content at the time of the transfer. Whether a
+    file has to be transferred can then be decided from local metadata and a
+    blob listing, without per-file requests to Azure.
+
+    The object can be shared by several threads.
+    """
+
+    def __init__(self, filename):
+        """Constructor.
+
+        Args:
+            filename [in]: the SQLite file. Created if it does not exist.
+        """
+
+        self.filename = os.path.abspath(filename)
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (" +
+            "blobpath TEXT PRIMARY KEY, local_path TEXT, size INTEGER, " +
+            "mtime_ns INTEGER, etag TEXT, sha256 TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes (" +
+            "local_path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, " +
+            "sha256 TEXT)")
+        self._conn.commit()
+
+    def close(self):
+        """Close the underlying database connection."""
+
+        with self._lock:
+            self._conn.close()
+
+    def get(self, blobpath):
+        """Get the record of a blob.
+
+        Args:
+            blobpath [in]: relative path to the Blob root on Azure.
+
+        Return:
+            A ManifestRecord, or None if the blob has no record.
+        """
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM blobs WHERE blobpath=?", (blobpath,)).fetchone()
+
+        return None if row is None else ManifestRecord(*row)
+
+    def update(self, blobpath, local_path, size, mtime_ns, etag, sha256):
+        """Insert or replace the record of a blob."""
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                (blobpath, local_path, size, mtime_ns, normalize_etag(etag), sha256))
+            self._conn.commit()
+
+    def remove(self, blobpath):
+        """Remove the record of a blob (if exists)."""
+
+        with self._lock:
+            self._conn.execute("DELETE FROM blobs WHERE blobpath=?", (blobpath,))
+            self._conn.commit()
+
+    def clear(self):
+        """Remove all records."""
+
+        with self._lock:
+            self._conn.execute("DELETE FROM blobs")
+            self._conn.commit()
+
+    def file_sha256(self, filepath, local_stat=None):
+        """Get the SHA-256 of a local file's content.
+
+        The hash is cached by the file's path, size, and modification time, so
+        a file is only read again after it changes.
+
+        Args:
+            filepath [in]: the path of a local file.
+            local_stat [in]: optional os.stat_result of the file.
+
+        Return:
+            The hex digest.
+        """
+
+        filepath = os.path.abspath(filepath)
+        local_stat = os.stat(filepath) if local_stat is None else local_stat
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, sha256 FROM hashes WHERE local_path=?",
+                (filepath,)).fetchone()
+
+        if row is not None and row[:2] == (local_stat.st_size, local_stat.st_mtime_ns):
+            return row[2]
+
+        sha256 = file_sha256(filepath)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)",
+                (filepath, local_stat.st_size, local_stat.st_mtime_ns, sha256))
+            self._conn.commit()
+
+        return sha256
+
+    def compare(self, blobpath, filepath, blob_props, local_stat=None):
+        """Compare a local file and a blob using the record in the manifest.
+
+        The content hash of the local file is only calculated when its size
+        matches the record but its modification time does not.
+
+        Args:
+            blobpath [in]: relative path to the Blob root on Azure.
+            filepath [in]: path to the file on a local machine.
+            blob_props [in]: properties of the blob from Azure; None if the blob
+                does not exist.
+            local_stat [optional]: os.stat_result of the local file if already
+                known.
+
+        Return:
+            0: both are unchanged since the last synchronization (or both non-exist)
+            1: the local file is newer (including cloud file non-exists)
+            2: the cloud file is newer (including local file non-exists)
+            None: can not be decided because no record matches the pair.
+        """
+
+        filepath = os.path.abspath(filepath)
+
+        if local_stat is None:
+            try:
+                local_stat = os.stat(filepath)
+            except FileNotFoundError:
+                local_stat = None
+
+        if local_stat is None and blob_props is None:
+            return 0
+
+        if blob_props is None:
+            return 1
+
+        if local_stat is None:
+            return 2
+
+        record = self.get(blobpath)
+
+        if record is None or record.local_path != filepath:
+            return None
+
+        cloud_changed = (normalize_etag(blob_props.etag) != normalize_etag(record.etag))
+
+        if local_stat.st_size != record.size:
+            local_changed = True
+        elif local_stat.st_mtime_ns != record.mtime_ns:
+            local_changed = (file_sha256(filepath) != record.sha256)
+
+            # only touched; refresh the record to avoid hashing next time
+            if not local_changed:
+                self.update(
+                    blobpath, filepath, local_stat.st_size, local_stat.st_mtime_ns,
+                    record.etag, record.sha256)
+        else:
+            local_changed = False
+
+        if not (local_changed or cloud_changed):
+            return 0
+
+        if local_changed and not cloud_changed:
+            return 1
+
+        if cloud_changed and not local_changed:
+            return 2
+
+        # both changed; the one modified more recently wins
+        if local_stat.st_mtime > blob_props.last_modified.timestamp():
+            return 1
+
+        return 2
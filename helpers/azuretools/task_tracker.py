@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+########################################################################################################################
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+# All Rights Reserved.
+#
+# Contributors: Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Licensed under the BSD-3-Clause License (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at: https://opensource.org/licenses/BSD-3-Clause
+#
+# BSD-3-Clause License:
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#    following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+# GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+########################################################################################################################
+
+"""
+Incremental tracking of the states of a mission's tasks.
+"""
+import logging
+import datetime
+import azure.batch.models
+
+
+class TaskTracker():
+    """Keep the task records in MissionInfo.tasks up to date.
+
+    Each poll lists only the tasks whose state changed since the latest state
+    transition seen by the previous poll, and only the properties needed, so
+    a poll of a large job transfers little when few tasks change. The first
+    poll of a job lists all its tasks.
+    """
+
+    # the task properties requested from the Batch service
+    select = "id,state,stateTransitionTime,executionInfo,nodeInfo"
+
+    def __init__(self, batch_client):
+        """Constructor.
+
+        Args:
+            batch_client [in]: an azure.batch.BatchServiceClient object.
+        """
+
+        self.logger = logging.getLogger("AzureMission")
+        self.batch_client = batch_client
+
+        # the latest state transition time seen in each job (service clock)
+        self._watermarks = {}
+
+    def reset(self, mission):
+        """Make the next poll of the mission list all tasks again."""
+
+        self._watermarks.pop(mission.job_name, None)
+
+    def poll(self, mission):
+        """Update the records of tasks changed since the previous poll.
+
+        The records in mission.tasks get these keys: state, exit_code,
+        start_time, end_time, node_id, completed, and succeeded. Tasks not in
+        mission.tasks are ignored.
+
+        Args:
+            mission [in]: an MissionInfo object.
+
+        Return:
+            A list of the names of cases whose records changed.
+        """
+
+        watermark = self._watermarks.get(mission.job_name)
+
+        # tasks at exactly the watermark are listed again; updates are idempotent
+        if watermark is None:
+            query = None
+        else:
+            query = "stateTransitionTime ge datetime'{}'".format(
+                watermark.astimezone(datetime.timezone.utc).strftime(
+                    "%Y-%m-%dT%H:%M:%S.%fZ"))
+
+        try:
+            tasks = self.batch_client.task.list(
+                mission.job_name,
+                task_list_options=azure.batch.models.TaskListOptions(
+                    filter=query, select=self.select))
+
+            changed = []
+            for task in tasks:
+                if task.state_transition_time is not None and \
+                        (watermark is None or task.state_transition_time > watermark):
+                    watermark = task.state_transition_time
+
+                record = mission.tasks.get(task.id)
+                if record is None:
+                    continue
+
+                update = self._task_record(task)
+                if any(record.get(key) != value for key, value in update.items()):
+                    record.update(update)
+                    changed.append(task.id)
+
+        except azure.batch.models.BatchErrorException as err:
+            if err.error is not None and err.error.code == "JobNotFound":
+                return []
+            raise
+
+        if watermark is not None:
+            self._watermarks[mission.job_name] = watermark
+
+        self.logger.debug(
+            "Polled task states of %s: %d changed", mission.job_name, len(changed))
+
+        return changed
+
+    @staticmethod
+    def _task_record(task):
+        """The values of a task's record from a listed CloudTask."""
+
+        record = {
+            "state": task.state.name, "exit_code": None, "start_time": None,
+            "end_time": None, "node_id": None}
+
+        if task.execution_info is not None:
+            record["exit_code"] = task.execution_info.exit_code
+            record["start_time"] = task.execution_info.start_time
+            record["end_time"] = task.execution_info.end_time
+
+        if task.node_info is not None:
+            record["node_id"] = task.node_info.node_id
+
+        record["completed"] = (record["state"] == "completed")
+        record["succeeded"] = record["completed"] and \
+            task.execution_info is not None and \
+            task.execution_info.result == azure.batch.models.TaskExecutionResult.success
+
+        return record
@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+########################################################################################################################
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+# All Rights Reserved.
+#
+# Contributors: Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Licensed under the BSD-3-Clause License (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at: https://opensource.org/licenses/BSD-3-Clause
+#
+# BSD-3-Clause License:
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#    following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+# GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+########################################################################################################################
+"""
+A bounded pool of worker threads for concurrent requests to Azure services.
+"""
+import threading
+import collections
+import concurrent.futures
+
+
+class WorkerPool():
+    """A bounded pool of worker threads for concurrent requests to Azure.
+
+    Each job is submitted together with a tag (e.g., a file path) and is
+    executed by one of at most max_workers threads. At most max_pending jobs
+    can wait in the queue; submit() blocks when the queue is full, so a
+    producer (e.g., a lazy blob listing) never runs too far ahead of workers.
+
+    An exception raised by a job does not stop other jobs. It is collected and
+    returned together with the tag of the job.
+    """
+
+    def __init__(self, max_workers=8, max_pending=None):
+        """Constructor.
+
+        Args:
+            max_workers [in]: the maximum number of concurrent jobs.
+            max_pending [in]: the maximum number of queued jobs.
+                (default: 4 * max_workers)
+        """
+
+        assert isinstance(max_workers, int), "Type error!"
+        assert max_workers > 0, "max_workers should be a positive integer."
+
+        if max_pending is None:
+            max_pending = 4 * max_workers
+
+        self.max_workers = max_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self._slots = threading.BoundedSemaphore(max_workers+max_pending)
+        self._lock = threading.Lock()
+        self._jobs = collections.deque() # (tag, future) in the order of submission
+
+    def __enter__(self):
+        """Use the pool as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Wait for all running jobs and release the threads."""
+        self.shutdown()
+
+    def submit(self, tag, func, *args, **kwargs):
+        """Submit a job. Block if the queue of pending jobs is full.
+
+        Args:
+            tag [in]: any object used to identify this job in the results.
+            func [in]: the callable to be executed.
+            args, kwargs [in]: arguments passed to func.
+
+        Return:
+            A concurrent.futures.Future object.
+        """
+
+        self._slots.acquire()
+
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+
+        with self._lock:
+            self._jobs.append((tag, future))
+
+        return future
+
+    def iter_results(self, block=True):
+        """Yield results of submitted jobs in submission order.
+
+        Jobs yielded are removed from the pool's record. When block is False,
+        the iteration stops at the first job that has not finished yet, which
+        allows a producer to consume finished jobs between submissions.
+
+        Args:
+            block [in]: whether to wait for unfinished jobs.
+
+        Yield:
+            (tag, result, error), where error is None if the job succeeded and
+            result is None if the job raised an exception.
+        """
+
+        while True:
+            with self._lock:
+                if not self._jobs:
+                    return
+                if not block and not self._jobs[0][1].done():
+                    return
+                tag, future = self._jobs.popleft()
+
+            try:
+                yield tag, future.result(), None
+            except Exception as err: # pylint: disable=broad-except
+                yield tag, None, err
+
+    def results(self):
+        """Wait for all submitted jobs and return their results.
+
+        Return:
+            A list of (tag, result, error) in the order of submission.
+        """
+
+        return list(self.iter_results())
+
+    def shutdown(self, wait=True):
+        """Shut down the underlying threads.
+
+        Args:
+            wait [in]: whether to wait for running and pending jobs.
+        """
+
+        self._executor.shutdown(wait)
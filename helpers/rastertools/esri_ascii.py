@@ -0,0 +1,512 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+########################################################################################################################
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+# All Rights Reserved.
+#
+# Contributors: Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Licensed under the BSD-3-Clause License (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at: https://opensource.org/licenses/BSD-3-Clause
+#
+# BSD-3-Clause License:
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#    following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+# GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+########################################################################################################################
+
+"""
+Memory-mapped ESRI ASCII rasters: parse once, clip many windows, write fast.
+"""
+import os
+import json
+import numpy
+import numpy.lib.format
+
+
+# the keys of an ESRI ASCII header, in the order of the file
+_HEADER_KEYS = ["ncols", "nrows", "xllcorner", "yllcorner", "cellsize", "nodata_value"]
+
+
+def read_esri_ascii_header(filename):
+    """Read the header of an ESRI ASCII raster file.
+
+    Return:
+        (a dict of the header, the number of header lines).
+    """
+
+    header = {}
+    with open(filename, "r") as f:
+        for nlines in range(len(_HEADER_KEYS)):
+            position = f.tell()
+            line = f.readline().split()
+            key = line[0].lower()
+
+            if key not in _HEADER_KEYS + ["xllcenter", "yllcenter"]:
+                f.seek(position)
+                break
+
+            header[key] = float(line[1])
+        else:
+            nlines = len(_HEADER_KEYS)
+
+    header["ncols"] = int(header["ncols"])
+    header["nrows"] = int(header["nrows"])
+    header.setdefault("nodata_value", -9999.)
+
+    # convert cell-center registration to corner registration
+    if "xllcenter" in header:
+        header["xllcorner"] = header.pop("xllcenter") - header["cellsize"] / 2.
+    if "yllcenter" in header:
+        header["yllcorner"] = header.pop("yllcenter") - header["cellsize"] / 2.
+
+    return header, nlines
+
+
+class RasterGrid():
+    """A georeferenced 2D grid that can be cut into windows quickly.
+
+    Attributes:
+        ncols, nrows, xllcorner, yllcorner, cellsize, nodata_value: header.
+        data: a (nrows, ncols) float32 array; row 0 is the north.
+        text: None, or a (nrows, ncols) array of fixed-width formatted values
+            used to write windows without formatting numbers.
+    """
+
+    # the format of a value in text arrays (a fixed width of 14 bytes)
+    text_format = "%13.7g "
+
+    def __init__(self, data, xllcorner, yllcorner, cellsize, nodata_value=-9999.,
+                 text=None):
+        """Constructor.
+
+        Args:
+            data [in]: a 2D array; the first row is the northmost row.
+            xllcorner, yllcorner [in]: the coordinates of the lower-left corner.
+            cellsize [in]: the size of a cell.
+            nodata_value [in]: the value of cells without data.
+            text [in]: optional pre-formatted values (see format_text).
+        """
+
+        self.data = data
+        self.nrows, self.ncols = data.shape
+        self.xllcorner = xllcorner
+        self.yllcorner = yllcorner
+        self.cellsize = cellsize
+        self.nodata_value = nodata_value
+        self.text = text
+
+    def format_text(self, out=None, chunk_rows=512):
+        """Format all values into a fixed-width text array.
+
+        Args:
+            out [in]: an array (e.g., a memmap) to hold the result; None to
+                allocate a new one.
+            chunk_rows [in]: number of rows formatted at a time.
+
+        Return:
+            The text array.
+        """
+
+        if out is None:
+            out = numpy.empty((self.nrows, self.ncols), dtype=self.text_dtype())
+
+        for begin in range(0, self.nrows, chunk_rows):
+            end = min(begin+chunk_rows, self.nrows)
+            out[begin:end] = numpy.char.mod(
+                self.text_format, self.data[begin:end].astype(numpy.float64))
+
+        return out
+
+    @classmethod
+    def text_dtype(cls):
+        """The NumPy dtype of formatted values."""
+
+        return "S{}".format(len(cls.text_format % -1.234567e+38))
+
+    def save(self, filename, meta=None):
+        """Save the grid to <filename>.npy and its header to <filename>.json.
+
+        Args:
+            filename [in]: the path without extensions.
+            meta [in]: optional JSON-serializable information about the
+                source of the grid; see load.
+        """
+
+        numpy.save(filename+".npy", numpy.asarray(self.data, dtype=numpy.float32))
+
+        header = {key: getattr(self, key) for key in _HEADER_KEYS}
+
+        with open(filename+".json", "w") as f:
+            json.dump({"header": header, "meta": meta}, f)
+
+    @classmethod
+    def load(cls, filename, meta=None, text_cache=False):
+        """Map a grid saved by save.
+
+        Args:
+            filename [in]: the path without extensions.
+            meta [in]: if not None, the grid is only loaded when the saved
+                meta equals this.
+            text_cache [in]: whether to also map pre-formatted values (see
+                format_text) from <filename>.text.npy. The text file is built
+                only if missing or older than the grid, so processes loading
+                the same grid share one copy through the page cache.
+
+        Return:
+            A RasterGrid, or None if the files do not exist or meta differs.
+        """
+
+        try:
+            with open(filename+".json", "r") as f:
+                saved = json.load(f)
+            data = numpy.load(filename+".npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+        if meta is not None and saved["meta"] != meta:
+            return None
+
+        header = saved["header"]
+        grid = cls.__new__(cls)
+        RasterGrid.__init__(
+            grid, data, header["xllcorner"], header["yllcorner"],
+            header["cellsize"], header["nodata_value"])
+
+        grid.filename = filename
+
+        if text_cache:
+            grid.text = _map_text_sidecar(grid, filename+".npy", filename+".text.npy")
+
+        return grid
+
+    def window_indices(self, left, bottom, right, top):
+        """The row/column ranges of cells overlapping rectangles.
+
+        All arguments can be scalars or arrays of the same shape, so the
+        windows of many points are computed at once.
+
+        Return:
+            (row_start, row_end, col_start, col_end); rows count from north.
+        """
+
+        ytop = self.yllcorner + self.nrows * self.cellsize
+
+        col_start = numpy.floor((numpy.asarray(left)-self.xllcorner)/self.cellsize)
+        col_end = numpy.ceil((numpy.asarray(right)-self.xllcorner)/self.cellsize)
+        row_start = numpy.floor((ytop-numpy.asarray(top))/self.cellsize)
+        row_end = numpy.ceil((ytop-numpy.asarray(bottom))/self.cellsize)
+
+        col_start = numpy.clip(col_start, 0, self.ncols).astype(numpy.int64)
+        col_end = numpy.clip(col_end, 0, self.ncols).astype(numpy.int64)
+        row_start = numpy.clip(row_start, 0, self.nrows).astype(numpy.int64)
+        row_end = numpy.clip(row_end, 0, self.nrows).astype(numpy.int64)
+
+        return row_start, row_end, col_start, col_end
+
+    def clip(self, left, bottom, right, top):
+        """Clip the cells overlapping a rectangle.
+
+        Return:
+            (data, xllcorner, yllcorner) of the clipped raster. data is a view
+            of the memory map.
+        """
+
+        return self.slice(*self.window_indices(left, bottom, right, top))
+
+    def slice(self, row_start, row_end, col_start, col_end):
+        """Cut cells by index ranges (see window_indices).
+
+        Return:
+            (data, xllcorner, yllcorner) of the cut raster.
+        """
+
+        r0, r1, c0, c1 = int(row_start), int(row_end), int(col_start), int(col_end)
+
+        if r0 >= r1 or c0 >= c1:
+            raise ValueError("The window does not overlap the raster.")
+
+        xll = self.xllcorner + c0 * self.cellsize
+        yll = self.yllcorner + (self.nrows-r1) * self.cellsize
+
+        return self.data[r0:r1, c0:c1], xll, yll
+
+    def write_clip(self, filename, left, bottom, right, top):
+        """Clip a rectangle and write it to an ESRI ASCII file."""
+
+        return self.write_slice(
+            filename, *self.window_indices(left, bottom, right, top))
+
+    def write_slice(self, filename, row_start, row_end, col_start, col_end):
+        """Cut cells by index ranges and write them to an ESRI ASCII file."""
+
+        data, xll, yll = self.slice(row_start, row_end, col_start, col_end)
+
+        if self.text is None:
+            write_esri_ascii(filename, data, xll, yll, self.cellsize, self.nodata_value)
+            return filename
+
+        # copy pre-formatted bytes and end each row with a newline
+        block = self.text[int(row_start):int(row_end), int(col_start):int(col_end)]
+        nrows, ncols = block.shape
+        width = block.dtype.itemsize
+
+        lines = numpy.empty((nrows, ncols*width+1), dtype=numpy.uint8)
+        lines[:, :-1] = numpy.ascontiguousarray(block).view(numpy.uint8).reshape(nrows, -1)
+        lines[:, -1] = ord("\n")
+
+        with open(filename, "wb") as f:
+            f.write(_esri_ascii_header(
+                ncols, nrows, xll, yll, self.cellsize, self.nodata_value).encode())
+            f.write(lines.tobytes())
+
+        return filename
+
+
+
+class EsriAsciiRaster(RasterGrid):
+    """An ESRI ASCII raster backed by a memory-mapped float32 binary sidecar.
+
+    The first time a raster is opened, its values are parsed into a NumPy
+    .npy sidecar file (<filename>.f32.npy by default) with a small JSON file
+    recording the header and the size and modification time of the source.
+    Later opens map the sidecar directly, so only the cells actually used are
+    read from disk.
+
+    Formatting numbers is the most expensive part of writing clipped rasters.
+    With text_cache, every value is also formatted once into a fixed-width
+    text sidecar (<sidecar>.text.npy), and write_clip only copies bytes.
+
+    See RasterGrid for the attributes; data and text are read-only memmaps.
+    """
+
+    def __init__(self, filename, sidecar=None, chunk_rows=512, text_cache=False):
+        """Constructor.
+
+        Args:
+            filename [in]: the path of the ESRI ASCII raster file.
+            sidecar [in]: the path of the binary sidecar; None for the default.
+            chunk_rows [in]: number of rows parsed at a time when building the
+                sidecar.
+            text_cache [in]: whether to use a pre-formatted text sidecar.
+        """
+
+        self.filename = os.path.abspath(filename)
+        self.sidecar = self.filename + ".f32.npy" if sidecar is None else sidecar
+
+        stat = os.stat(self.filename)
+        source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        header = self._read_sidecar_header(source)
+        if header is None:
+            header = self._build_sidecar(source, chunk_rows)
+
+        super().__init__(
+            numpy.load(self.sidecar, mmap_mode="r"), header["xllcorner"],
+            header["yllcorner"], header["cellsize"], header["nodata_value"])
+
+        if text_cache:
+            self.text = _map_text_sidecar(
+                self, self.sidecar, self.sidecar+".text.npy", chunk_rows)
+
+    def _read_sidecar_header(self, source):
+        """The header saved with the sidecar; None if missing or outdated."""
+
+        try:
+            with open(self.sidecar + ".json", "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if saved.get("source") != source or not os.path.isfile(self.sidecar):
+            return None
+
+        return saved["header"]
+
+    def _build_sidecar(self, source, chunk_rows):
+        """Parse the ASCII values into the sidecar file."""
+
+        header, nlines = read_esri_ascii_header(self.filename)
+        nrows, ncols = header["nrows"], header["ncols"]
+
+        data = numpy.lib.format.open_memmap(
+            self.sidecar, mode="w+", dtype=numpy.float32, shape=(nrows, ncols))
+
+        with open(self.filename, "r") as f:
+            for _ in range(nlines):
+                f.readline()
+
+            for begin in range(0, nrows, chunk_rows):
+                end = min(begin+chunk_rows, nrows)
+                text = "".join(f.readline() for _ in range(end-begin))
+                values = numpy.fromstring(text, dtype=numpy.float32, sep=" ")
+
+                if values.size != (end-begin) * ncols:
+                    raise ValueError(
+                        "{}: rows {} to {} do not have {} values each.".format(
+                            self.filename, begin, end, ncols))
+
+                data[begin:end] = values.reshape(end-begin, ncols)
+
+        data.flush()
+        del data
+
+        with open(self.sidecar + ".json", "w") as f:
+            json.dump({"source": source, "header": header}, f)
+
+        return header
+
+
+def _map_text_sidecar(grid, datafile, filename, chunk_rows=512):
+    """Map the text sidecar of a grid; build it if missing or older than the data.
+
+    The sidecar is formatted chunk by chunk into a memmap under a temporary
+    name and then renamed, so concurrent processes never see a partial file.
+    """
+
+    if not os.path.isfile(filename) or \
+            os.stat(filename).st_mtime_ns < os.stat(datafile).st_mtime_ns:
+
+        temp = "{}.{}.tmp.npy".format(filename, os.getpid())
+        text = numpy.lib.format.open_memmap(
+            temp, mode="w+", dtype=grid.text_dtype(), shape=(grid.nrows, grid.ncols))
+
+        grid.format_text(text, chunk_rows)
+
+        text.flush()
+        del text
+        os.replace(temp, filename)
+
+    return numpy.load(filename, mmap_mode="r")
+
+
+def _esri_ascii_header(ncols, nrows, xllcorner, yllcorner, cellsize, nodata_value):
+    """The header of an ESRI ASCII raster file."""
+
+    return \
+        "ncols {}\nnrows {}\n".format(ncols, nrows) + \
+        "xllcorner {!r}\nyllcorner {!r}\n".format(float(xllcorner), float(yllcorner)) + \
+        "cellsize {!r}\nNODATA_value {!r}\n".format(float(cellsize), float(nodata_value))
+
+
+def write_esri_ascii(filename, data, xllcorner, yllcorner, cellsize,
+                     nodata_value=-9999., fmt="%.7g", chunk_cells=65536):
+    """Write a 2D array to an ESRI ASCII raster file.
+
+    Rows are written in blocks of about chunk_cells cells. Each block is
+    formatted with one string-formatting operation on a pre-built template
+    instead of row-by-row formatting, so memory use is bounded by the block
+    rather than the raster.
+
+    Args:
+        filename [in]: the path of the output file.
+        data [in]: a 2D array; the first row is the northmost row.
+        xllcorner, yllcorner [in]: the coordinates of the lower-left corner.
+        cellsize [in]: the size of a cell.
+        nodata_value [in]: the value of cells without data.
+        fmt [in]: the printf-style format of a value.
+        chunk_cells [in]: approximate number of cells formatted at a time.
+    """
+
+    nrows, ncols = data.shape
+
+    row = " ".join([fmt] * ncols) + "\n"
+    chunk_rows = max(1, chunk_cells // max(ncols, 1))
+    block = row * chunk_rows
+
+    with open(filename, "w") as f:
+        f.write(_esri_ascii_header(
+            ncols, nrows, xllcorner, yllcorner, cellsize, nodata_value))
+
+        for begin in range(0, nrows, chunk_rows):
+            end = min(begin+chunk_rows, nrows)
+            values = tuple(numpy.asarray(data[begin:end], dtype=numpy.float64).ravel())
+            f.write((block if end-begin == chunk_rows else row * (end-begin)) % values)
+
+
+def write_windows(grid, points, extent, out_dirs, basename, ignore=False):
+    """Cut the windows of many rupture points from a grid and write them.
+
+    The windows match helpers.arcgistools.prepare_single_topo (the extent plus
+    10 on each side) and are computed for all points at once.
+
+    Args:
+        grid [in]: a RasterGrid (e.g., an EsriAsciiRaster).
+        points [in]: an array of (x, y, ...) of rupture points.
+        extent [in]: (top, bottom, left, right) distances to rupture points.
+        out_dirs [in]: the case folders of the points.
+        basename [in]: the file name of the output in each case folder.
+        ignore [in]: keep existing output files.
+
+    Return:
+        A list of the paths of output files.
+    """
+
+    x = numpy.array([point[0] for point in points], dtype=numpy.float64)
+    y = numpy.array([point[1] for point in points], dtype=numpy.float64)
+
+    # index ranges of all windows at once
+    indices = numpy.stack(grid.window_indices(
+        x-extent[2]-10, y-extent[1]-10, x+extent[3]+10, y+extent[0]+10), axis=1)
+
+    outputs = []
+    for out_dir, index in zip(out_dirs, indices):
+        if not os.path.isdir(out_dir):
+            raise FileNotFoundError("{} does not exist.".format(out_dir))
+
+        output = os.path.join(out_dir, basename)
+
+        if not (ignore and os.path.isfile(output)):
+            grid.write_slice(output, *index)
+
+        outputs.append(output)
+
+    return outputs
+
+
+def prepare_topos(base, points, extent, out_dirs, ignore=False, text_cache=False):
+    """Clip topography files for many rupture points without arcpy.
+
+    Args:
+        base [in]: an EsriAsciiRaster or the path of an ESRI ASCII file.
+        points [in]: an array of (x, y, ...) of rupture points.
+        extent [in]: (top, bottom, left, right) distances to rupture points.
+        out_dirs [in]: the case folders of the points.
+        ignore [in]: keep existing topo.asc files.
+        text_cache [in]: when base is a path, whether to use a pre-formatted
+            text sidecar (about 14 bytes per cell on disk); faster when many
+            overlapping windows are written.
+
+    Return:
+        A list of the paths of topo.asc files.
+    """
+
+    if not isinstance(base, RasterGrid):
+        base = EsriAsciiRaster(base, text_cache=text_cache)
+
+    return write_windows(base, points, extent, out_dirs, "topo.asc", ignore)
+
+
+def prepare_single_topo(base, point, extent, out_dir, ignore=False, text_cache=False):
+    """Clip the topography file for a rupture point without arcpy."""
+
+    return prepare_topos(base, [point], extent, [out_dir], ignore, text_cache)[0]
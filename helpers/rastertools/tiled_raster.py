@@ -0,0 +1,330 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+########################################################################################################################
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+# All Rights Reserved.
+#
+# Contributors: Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Licensed under the BSD-3-Clause License (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at: https://opensource.org/licenses/BSD-3-Clause
+#
+# BSD-3-Clause License:
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#    following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+#    following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+# GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+########################################################################################################################
+
+"""
+A tiled and compressed binary raster format that can be cropped remotely.
+
+File layout (all integers are little-endian):
+
+    8 bytes: magic string b"LSTILE01"
+    4 bytes: uint32; the length of the JSON header in bytes
+    N bytes: the JSON header (see TiledRaster for the keys)
+    tiles: zlib-compressed float32 tiles in row-major order, north to south
+
+Because the byte range of every tile is in the header, a window of the raster
+can be read from a blob URL with HTTP range requests, without downloading the
+whole file. This module only depends on NumPy and the standard library, so it
+can be staged to and run on computing nodes directly (together with
+esri_ascii.py):
+
+    python3 tiled_raster.py crop <file or URL> <window file> <output ESRI ASCII>
+"""
+import os
+import sys
+import json
+import zlib
+import struct
+import shutil
+import urllib.request
+import numpy
+
+try:
+    from .esri_ascii import write_esri_ascii
+except ImportError: # run as a standalone script next to esri_ascii.py
+    from esri_ascii import write_esri_ascii
+
+
+MAGIC = b"LSTILE01"
+
+
+def write_tiled_raster(filename, data, xllcorner, yllcorner, cellsize,
+                       nodata_value=-9999., tile_size=256, level=6):
+    """Write a 2D array to a tiled raster file.
+
+    Args:
+        filename [in]: the path of the output file.
+        data [in]: a 2D array; the first row is the northmost row.
+        xllcorner, yllcorner [in]: the coordinates of the lower-left corner.
+        cellsize [in]: the size of a cell.
+        nodata_value [in]: the value of cells without data.
+        tile_size [in]: the number of rows and columns of a tile.
+        level [in]: zlib compression level.
+    """
+
+    data = numpy.asarray(data, dtype="<f4")
+    assert data.ndim == 2, "Only 2D arrays are supported."
+
+    nrows, ncols = data.shape
+
+    write_tiled_raster_blocks(
+        filename, (data[r:r+tile_size] for r in range(0, nrows, tile_size)),
+        ncols, nrows, xllcorner, yllcorner, cellsize, nodata_value,
+        tile_size, level)
+
+
+def write_tiled_raster_blocks(filename, blocks, ncols, nrows, xllcorner,
+                              yllcorner, cellsize, nodata_value=-9999.,
+                              tile_size=256, level=6):
+    """Write a tiled raster file from blocks of rows.
+
+    Only one block is held in memory at a time; compressed tiles are spooled
+    to a temporary file next to the output until the header is known.
+
+    Args:
+        filename [in]: the path of the output file.
+        blocks [in]: an iterable of 2D arrays of ncols columns, north to south;
+            the number of rows of every block except the last must be a
+            multiple of tile_size.
+        ncols, nrows [in]: the size of the whole raster.
+        xllcorner, yllcorner [in]: the coordinates of the lower-left corner.
+        cellsize [in]: the size of a cell.
+        nodata_value [in]: the value of cells without data.
+        tile_size [in]: the number of rows and columns of a tile.
+        level [in]: zlib compression level.
+    """
+
+    lengths = []
+    rows_written = 0
+    spool = filename + ".tiles"
+
+    try:
+        with open(spool, "wb") as f:
+            for block in blocks:
+                block = numpy.asarray(block, dtype="<f4")
+                assert block.ndim == 2 and block.shape[1] == ncols, \
+                    "Blocks must be 2D arrays of {} columns.".format(ncols)
+                assert rows_written % tile_size == 0, \
+                    "Only the last block can end in the middle of a tile row."
+
+                for r in range(0, block.shape[0], tile_size):
+                    for c in range(0, ncols, tile_size):
+                        tile = zlib.compress(numpy.ascontiguousarray(
+                            block[r:r+tile_size, c:c+tile_size]).tobytes(), level)
+                        lengths.append(len(tile))
+                        f.write(tile)
+
+                rows_written += block.shape[0]
+
+        assert rows_written == nrows, \
+            "Got {} rows from blocks but expected {}.".format(rows_written, nrows)
+
+        header = {
+            "ncols": ncols, "nrows": nrows,
+            "xllcorner": float(xllcorner), "yllcorner": float(yllcorner),
+            "cellsize": float(cellsize), "nodata_value": float(nodata_value),
+            "tile_size": tile_size, "dtype": "<f4", "compression": "zlib",
+            "lengths": lengths}
+        header = json.dumps(header).encode()
+
+        with open(filename, "wb") as f, open(spool, "rb") as tiles:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            shutil.copyfileobj(tiles, f, 1048576)
+    finally:
+        if os.path.isfile(spool):
+            os.remove(spool)
+
+
+class TiledRaster():
+    """A reader of tiled raster files, local or behind an HTTP(S) URL.
+
+    Attributes (from the JSON header):
+        ncols, nrows: the size of the raster.
+        xllcorner, yllcorner: the coordinates of the lower-left corner.
+        cellsize: the size of a cell.
+        nodata_value: the value of cells without data.
+        tile_size: the number of rows and columns of a tile.
+    """
+
+    def __init__(self, source):
+        """Constructor.
+
+        Args:
+            source [in]: a file path or an http(s) URL (e.g., a blob URL with
+                a SAS token).
+        """
+
+        self.source = source
+        self._remote = source.startswith(("http://", "https://"))
+
+        if not self._remote:
+            self._file = open(source, "rb")
+
+        prefix = self._read(0, len(MAGIC)+4)
+        if prefix[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a tiled raster.".format(source))
+
+        header_length = struct.unpack("<I", prefix[len(MAGIC):])[0]
+        header = json.loads(self._read(len(prefix), header_length).decode())
+
+        self.ncols = header["ncols"]
+        self.nrows = header["nrows"]
+        self.xllcorner = header["xllcorner"]
+        self.yllcorner = header["yllcorner"]
+        self.cellsize = header["cellsize"]
+        self.nodata_value = header["nodata_value"]
+        self.tile_size = header["tile_size"]
+
+        self._tile_cols = -(-self.ncols // self.tile_size)
+        self._lengths = header["lengths"]
+        self._offsets = numpy.cumsum(
+            [len(prefix)+header_length] + self._lengths[:-1]).tolist()
+
+    def close(self):
+        """Close the underlying file (if local)."""
+
+        if not self._remote:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read(self, offset, length):
+        """Read a range of bytes from the source."""
+
+        if not self._remote:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+        request = urllib.request.Request(
+            self.source, headers={"Range": "bytes={}-{}".format(offset, offset+length-1)})
+
+        with urllib.request.urlopen(request) as response:
+            return response.read()
+
+    def window_indices(self, left, bottom, right, top):
+        """The row/column ranges of cells overlapping a rectangle.
+
+        Return:
+            (row_start, row_end, col_start, col_end); rows count from north.
+        """
+
+        ytop = self.yllcorner + self.nrows * self.cellsize
+
+        col_start = int(numpy.floor((left-self.xllcorner)/self.cellsize))
+        col_end = int(numpy.ceil((right-self.xllcorner)/self.cellsize))
+        row_start = int(numpy.floor((ytop-top)/self.cellsize))
+        row_end = int(numpy.ceil((ytop-bottom)/self.cellsize))
+
+        col_start, col_end = max(col_start, 0), min(col_end, self.ncols)
+        row_start, row_end = max(row_start, 0), min(row_end, self.nrows)
+
+        if col_start >= col_end or row_start >= row_end:
+            raise ValueError("The window does not overlap the raster.")
+
+        return row_start, row_end, col_start, col_end
+
+    def read_window(self, left, bottom, right, top):
+        """Read the cells overlapping a rectangle.
+
+        Only the tiles covering the rectangle are read; tiles adjacent in a
+        row of tiles are read with one request.
+
+        Return:
+            (data, xllcorner, yllcorner) of the window.
+        """
+
+        r0, r1, c0, c1 = self.window_indices(left, bottom, right, top)
+        ts = self.tile_size
+
+        output = numpy.empty((r1-r0, c1-c0), dtype=numpy.float32)
+
+        for tr in range(r0//ts, (r1-1)//ts+1):
+            tc0, tc1 = c0 // ts, (c1-1) // ts + 1
+            first, last = tr*self._tile_cols+tc0, tr*self._tile_cols+tc1-1
+            offset = self._offsets[first]
+            chunk = self._read(
+                offset, self._offsets[last]+self._lengths[last]-offset)
+
+            for tc in range(tc0, tc1):
+                i = tr * self._tile_cols + tc
+                begin = self._offsets[i] - offset
+                rows = min(ts, self.nrows-tr*ts)
+                cols = min(ts, self.ncols-tc*ts)
+                tile = numpy.frombuffer(
+                    zlib.decompress(chunk[begin:begin+self._lengths[i]]),
+                    dtype="<f4").reshape(rows, cols)
+
+                # intersection of this tile and the window (global indices)
+                gr0, gr1 = max(r0, tr*ts), min(r1, tr*ts+rows)
+                gc0, gc1 = max(c0, tc*ts), min(c1, tc*ts+cols)
+
+                output[gr0-r0:gr1-r0, gc0-c0:gc1-c0] = \
+                    tile[gr0-tr*ts:gr1-tr*ts, gc0-tc*ts:gc1-tc*ts]
+
+        xll = self.xllcorner + c0 * self.cellsize
+        yll = self.yllcorner + (self.nrows-r1) * self.cellsize
+
+        return output, xll, yll
+
+
+def read_window_file(filename):
+    """Read a clip window (left, bottom, right, top) from a text file."""
+
+    with open(filename, "r") as f:
+        left, bottom, right, top = [float(v) for v in f.read().split()]
+
+    return left, bottom, right, top
+
+
+def write_window_file(filename, left, bottom, right, top):
+    """Write a clip window (left, bottom, right, top) to a text file."""
+
+    with open(filename, "w") as f:
+        f.write("{!r} {!r} {!r} {!r}\n".format(
+            float(left), float(bottom), float(right), float(top)))
+
+
+def crop(source, window_file, output):
+    """Crop a tiled raster with a window file and write an ESRI ASCII file."""
+
+    with TiledRaster(source) as raster:
+        data, xll, yll = raster.read_window(*read_window_file(window_file))
+        write_esri_ascii(output, data, xll, yll, raster.cellsize, raster.nodata_value)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 5 or sys.argv[1] != "crop":
+        print("Usage: {} crop <file or URL> <window file> <output>".format(
+            os.path.basename(sys.argv[0])), file=sys.stderr)
+        sys.exit(1)
+
+    crop(*sys.argv[2:])
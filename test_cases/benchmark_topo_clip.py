@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+#
+# Distributed under terms of the BSD 3-Clause license.
+
+"""
+Benchmark the arcpy-free topography clipper of helpers.rastertools.
+
+A synthetic ESRI ASCII base raster is created, parsed into its binary sidecar
+(first open), mapped again from the sidecar (later opens), and clipped for a
+number of random rupture points, each written to its own topo.asc, both with
+and without the pre-formatted text sidecar.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy
+
+
+def create_base(filename, nrows, ncols, cellsize):
+    """Write a synthetic ESRI ASCII raster."""
+
+    x, y = numpy.meshgrid(numpy.arange(ncols), numpy.arange(nrows))
+    data = (100. + 10. * numpy.sin(x/50.) * numpy.cos(y/70.)).astype(numpy.float32)
+    write_esri_ascii(filename, data, 0., 0., cellsize)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=4000, help="Rows of the base raster. (default: %(default)s)")
+    parser.add_argument("--cols", type=int, default=4000, help="Columns of the base raster. (default: %(default)s)")
+    parser.add_argument("--cellsize", type=float, default=1., help="Cell size. (default: %(default)s)")
+    parser.add_argument("--points", type=int, default=2000, help="Number of rupture points. (default: %(default)s)")
+    parser.add_argument("--extent", type=float, default=100.,
+                        help="Distance from a point to each side of its domain. (default: %(default)s)")
+    args = parser.parse_args()
+
+    # add repo directory to module search path and import
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(test_dir))
+    from helpers.rastertools import EsriAsciiRaster, write_esri_ascii, prepare_topos
+
+    workdir = tempfile.mkdtemp()
+
+    try:
+        base = os.path.join(workdir, "base.asc")
+
+        tic = time.perf_counter()
+        create_base(base, args.rows, args.cols, args.cellsize)
+        print("Writing a {} x {} base raster: {:.2f} s".format(
+            args.rows, args.cols, time.perf_counter()-tic))
+
+        tic = time.perf_counter()
+        EsriAsciiRaster(base)
+        print("First open (parsing into sidecar): {:.2f} s".format(time.perf_counter()-tic))
+
+        tic = time.perf_counter()
+        raster = EsriAsciiRaster(base)
+        print("Later open (mapping sidecar): {:.4f} s".format(time.perf_counter()-tic))
+
+        tic = time.perf_counter()
+        text_raster = EsriAsciiRaster(base, text_cache=True)
+        print("Building the text sidecar: {:.2f} s".format(time.perf_counter()-tic))
+
+        margin = args.extent + 20
+        rng = numpy.random.RandomState(0)
+        points = numpy.stack([
+            rng.uniform(margin, args.cols*args.cellsize-margin, args.points),
+            rng.uniform(margin, args.rows*args.cellsize-margin, args.points)], axis=1)
+
+        out_dirs = [os.path.join(workdir, "case{:05d}".format(i)) for i in range(args.points)]
+        for out_dir in out_dirs:
+            os.makedirs(out_dir)
+
+        extent = [args.extent] * 4
+
+        for label, backend in [("formatting", raster), ("text sidecar", text_raster)]:
+            tic = time.perf_counter()
+            prepare_topos(backend, points, extent, out_dirs)
+            toc = time.perf_counter() - tic
+
+            print("Clipping {} points ({}): {:.2f} s ({:.1f} points/s)".format(
+                args.points, label, toc, args.points/toc))
+    finally:
+        shutil.rmtree(workdir)
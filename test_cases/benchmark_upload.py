@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+#
+# Distributed under terms of the BSD 3-Clause license.
+
+"""
+Benchmark MissionController.upload_local_dirs against a local fake blob service.
+
+The fake services keep blobs in memory and emulate the network with a fixed
+latency per request plus a per-connection bandwidth, so the numbers reflect
+how well the upload engine hides round-trips, not the real Azure throughput.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import datetime
+import threading
+import types
+import logging
+
+
+class FakeBlobService:
+    """An in-memory stand-in for azure.storage.blob.BlockBlobService."""
+
+    def __init__(self, latency, bandwidth):
+        self.latency = latency # seconds per request
+        self.bandwidth = bandwidth # bytes per second per connection
+        self.blobs = {}
+        self.lock = threading.Lock()
+
+    def _now(self):
+        return datetime.datetime.utcnow().replace(
+            microsecond=0, tzinfo=datetime.timezone.utc)
+
+    def create_blob_from_path(self, container_name, blob_name, file_path, max_connections=2):
+        with open(file_path, "rb") as f:
+            size = len(f.read())
+        time.sleep(self.latency+size/self.bandwidth)
+        props = types.SimpleNamespace(
+            last_modified=self._now(), etag=str(time.time()), content_length=size)
+        with self.lock:
+            self.blobs[(container_name, blob_name)] = props
+        return props
+
+    def get_blob_properties(self, container_name, blob_name):
+        import azure.common
+        time.sleep(self.latency)
+        with self.lock:
+            try:
+                props = self.blobs[(container_name, blob_name)]
+            except KeyError:
+                raise azure.common.AzureMissingResourceHttpError("Not found", 404)
+        return types.SimpleNamespace(name=blob_name, properties=props)
+
+
+class FakeTableService:
+    """An in-memory stand-in for azure.cosmosdb.table.tableservice.TableService."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.entities = {}
+        self.lock = threading.Lock()
+
+    def get_entity(self, table_name, partition_key, row_key):
+        import azure.common
+        time.sleep(self.latency)
+        with self.lock:
+            try:
+                return self.entities[(table_name, partition_key, row_key)]
+            except KeyError:
+                raise azure.common.AzureMissingResourceHttpError("Not found", 404)
+
+    def insert_or_replace_entity(self, table_name, entity):
+        time.sleep(self.latency)
+        with self.lock:
+            self.entities[(table_name, entity["PartitionKey"], entity["RowKey"])] = entity
+
+
+def create_cases(root, n_cases, n_files, file_size):
+    """Create fake case folders with random file content."""
+
+    for i in range(n_cases):
+        case_dir = os.path.join(root, "case{:04d}".format(i))
+        os.makedirs(case_dir)
+        for j in range(n_files):
+            with open(os.path.join(case_dir, "file{:03d}.txt".format(j)), "wb") as f:
+                f.write(os.urandom(file_size))
+
+    return {"case{:04d}".format(i): os.path.join(root, "case{:04d}".format(i))
+            for i in range(n_cases)}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cases", type=int, default=16, help="Number of cases. (default: %(default)s)")
+    parser.add_argument("--files", type=int, default=16, help="Files per case. (default: %(default)s)")
+    parser.add_argument("--size", type=int, default=65536, help="Bytes per file. (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per request. (default: %(default)s)")
+    parser.add_argument("--bandwidth", type=float, default=50e6,
+                        help="Bytes/s per connection. (default: %(default)s)")
+    parser.add_argument("--sync", action="store_true", help="Use synchronization mode.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16, 64],
+                        help="Numbers of workers to test. (default: %(default)s)")
+    args = parser.parse_args()
+
+    # add repo directory to module search path and import
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(test_dir))
+    from helpers.azuretools import UserCredential, MissionInfo, MissionController
+
+    logging.basicConfig(filename=os.devnull)
+
+    class FakeCredential(UserCredential):
+        """A credential creating fake service clients."""
+
+        def create_blob_client(self):
+            return FakeBlobService(args.latency, args.bandwidth)
+
+        def create_table_client(self):
+            return FakeTableService(args.latency)
+
+        def create_batch_client(self):
+            return None
+
+    workdir = tempfile.mkdtemp()
+
+    try:
+        dirs = create_cases(workdir, args.cases, args.files, args.size)
+        n_files = args.cases * args.files
+        n_mb = n_files * args.size / 1024 / 1024
+
+        print("{} files, {:.1f} MB in total; latency {} s; sync mode: {}".format(
+            n_files, n_mb, args.latency, args.sync))
+        print("{:>8s} {:>10s} {:>10s} {:>10s}".format("workers", "seconds", "files/s", "MB/s"))
+
+        for n_workers in args.workers:
+            mission = MissionInfo("benchmark", 1, workdir)
+            controller = MissionController(FakeCredential(), n_workers)
+
+            tic = time.perf_counter()
+            controller.upload_local_dirs(mission, dirs, args.sync, ["__pycache__"])
+            toc = time.perf_counter() - tic
+
+            print("{:>8d} {:>10.2f} {:>10.1f} {:>10.2f}".format(
+                n_workers, toc, n_files/toc, n_mb/toc))
+    finally:
+        shutil.rmtree(workdir)
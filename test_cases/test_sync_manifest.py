@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019-2020 Pi-Yueh Chuang and Lorena A. Barba.
+#
+# Distributed under terms of the BSD 3-Clause license.
+
+"""
+Test the decisions of the local synchronization manifest.
+"""
+import os
+import sys
+import datetime
+import tempfile
+import collections
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from helpers.azuretools.sync_manifest import SyncManifest  # pylint: disable=wrong-import-position
+
+
+BlobProps = collections.namedtuple("BlobProps", ["etag", "last_modified"])
+
+
+def test_quoted_and_unquoted_etag():
+    """A quoted ETag from a transfer matches the unquoted one of a listing."""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, "setrun.py")
+        with open(filepath, "w") as f:
+            f.write("print('hello')\n")
+
+        manifest = SyncManifest(os.path.join(tmpdir, "manifest.db"))
+        local_stat = os.stat(filepath)
+        mtime = datetime.datetime.now(datetime.timezone.utc)
+
+        # as returned by create_blob_from_path/get_blob_to_path
+        manifest.update(
+            "case/setrun.py", filepath, local_stat.st_size, local_stat.st_mtime_ns,
+            "\"0x8D7A1B2C3D4E5F6\"", manifest.file_sha256(filepath))
+        assert manifest.get("case/setrun.py").etag == "0x8D7A1B2C3D4E5F6"
+
+        # as returned by list_blobs
+        assert manifest.compare(
+            "case/setrun.py", filepath, BlobProps("0x8D7A1B2C3D4E5F6", mtime)) == 0
+        assert manifest.compare(
+            "case/setrun.py", filepath, BlobProps("\"0x8D7A1B2C3D4E5F6\"", mtime)) == 0
+
+        # a different ETag still means the blob changed
+        assert manifest.compare(
+            "case/setrun.py", filepath, BlobProps("0x8D7A1B2C3D4E5F7", mtime)) == 2
+
+        manifest.close()
+
+
+if __name__ == "__main__":
+    test_quoted_and_unquoted_etag()